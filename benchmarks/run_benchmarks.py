@@ -0,0 +1,196 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# End-to-end benchmarks against a local fake node. Runs export_blocks_and_transactions, export_receipts_and_logs,
+# export_all and stream over HTTP and IPC and reports the number of exported items per second.
+#
+#   python benchmarks/run_benchmarks.py --blocks 2000 --latency-ms 5 --output benchmark_results.json
+
+import glob
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ethereumetl.cli import cli
+from ethereumetl.enumeration.entity_type import EntityType
+from ethereumetl.fake_node.chain import SyntheticChain
+from ethereumetl.fake_node.server import FakeNode, FakeNodeServer
+from ethereumetl.providers.auto import get_batch_provider_from_uri
+
+
+class CountingItemExporter:
+    def __init__(self):
+        self.item_count = 0
+
+    def open(self):
+        pass
+
+    def export_items(self, items):
+        self.item_count += len(items)
+
+    def export_item(self, item):
+        self.item_count += 1
+
+    def close(self):
+        pass
+
+
+def count_items(path_pattern):
+    item_count = 0
+    for path in glob.glob(path_pattern, recursive=True):
+        with open(path) as file:
+            # Every csv file starts with a header
+            item_count += max(sum(1 for _ in file) - 1, 0)
+    return item_count
+
+
+def run_cli(args):
+    cli.main(args=args, standalone_mode=False)
+
+
+def benchmark_export_blocks_and_transactions(provider_uri, start_block, end_block, work_dir, max_workers):
+    blocks_output = os.path.join(work_dir, 'blocks.csv')
+    transactions_output = os.path.join(work_dir, 'transactions.csv')
+    run_cli(['export_blocks_and_transactions', '-s', str(start_block), '-e', str(end_block), '-p', provider_uri,
+             '-w', str(max_workers), '--blocks-output', blocks_output, '--transactions-output', transactions_output])
+    return count_items(blocks_output) + count_items(transactions_output)
+
+
+def benchmark_export_receipts_and_logs(provider_uri, start_block, end_block, work_dir, max_workers):
+    transactions_output = os.path.join(work_dir, 'transactions.csv')
+    if not os.path.exists(transactions_output):
+        benchmark_export_blocks_and_transactions(provider_uri, start_block, end_block, work_dir, max_workers)
+    transaction_hashes = os.path.join(work_dir, 'transaction_hashes.txt')
+    run_cli(['extract_csv_column', '-i', transactions_output, '-c', 'hash', '-o', transaction_hashes])
+    receipts_output = os.path.join(work_dir, 'receipts.csv')
+    logs_output = os.path.join(work_dir, 'logs.csv')
+    started_at = time.time()
+    run_cli(['export_receipts_and_logs', '--transaction-hashes', transaction_hashes, '-p', provider_uri,
+             '-w', str(max_workers), '--receipts-output', receipts_output, '--logs-output', logs_output])
+    return count_items(receipts_output) + count_items(logs_output), time.time() - started_at
+
+
+def benchmark_export_all(provider_uri, start_block, end_block, work_dir, max_workers):
+    output_dir = os.path.join(work_dir, 'export_all')
+    run_cli(['export_all', '-s', str(start_block), '-e', str(end_block), '-p', provider_uri, '-o', output_dir,
+             '-w', str(max_workers)])
+    return sum(count_items(os.path.join(output_dir, entity, '**', '*.csv'))
+               for entity in ('blocks', 'transactions', 'token_transfers', 'receipts', 'logs', 'contracts', 'tokens'))
+
+
+def benchmark_stream(provider_uri, start_block, end_block, work_dir, max_workers):
+    from blockchainetl.streaming.streamer import Streamer
+    from ethereumetl.streaming.eth_streamer_adapter import EthStreamerAdapter
+
+    item_exporter = CountingItemExporter()
+    streamer = Streamer(
+        blockchain_streamer_adapter=EthStreamerAdapter(
+            batch_web3_provider=get_batch_provider_from_uri(provider_uri),
+            item_exporter=item_exporter,
+            max_workers=max_workers,
+            entity_types=[EntityType.BLOCK, EntityType.TRANSACTION, EntityType.LOG, EntityType.TOKEN_TRANSFER]),
+        last_synced_block_file=os.path.join(work_dir, 'last_synced_block.txt'),
+        start_block=start_block - 1,
+        end_block=end_block,
+        block_batch_size=100,
+        retry_errors=False)
+    streamer.stream()
+    return item_exporter.item_count
+
+
+BENCHMARKS = {
+    'export_blocks_and_transactions': benchmark_export_blocks_and_transactions,
+    'export_receipts_and_logs': benchmark_export_receipts_and_logs,
+    'export_all': benchmark_export_all,
+    'stream': benchmark_stream,
+}
+
+
+def run_benchmark(name, provider_uri, start_block, end_block, max_workers):
+    work_dir = tempfile.mkdtemp(prefix='ethereumetl_benchmark_')
+    try:
+        started_at = time.time()
+        result = BENCHMARKS[name](provider_uri, start_block, end_block, work_dir, max_workers)
+        # Benchmarks with a setup step time themselves
+        item_count, duration = result if isinstance(result, tuple) else (result, time.time() - started_at)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {'benchmark': name, 'item_count': item_count, 'duration_seconds': round(duration, 3),
+            'items_per_second': round(item_count / duration, 1) if duration > 0 else None}
+
+
+@click.command(context_settings=dict(help_option_names=['-h', '--help']))
+@click.option('--blocks', default=1000, show_default=True, type=int, help='The number of blocks to export.')
+@click.option('--transactions-per-block', default=100, show_default=True, type=int,
+              help='The average number of transactions per block.')
+@click.option('--latency-ms', default=0, show_default=True, type=float, help='The latency of every request.')
+@click.option('--error-rate', default=0, show_default=True, type=float,
+              help='The share of JSON-RPC requests answered with an error.')
+@click.option('-w', '--max-workers', default=5, show_default=True, type=int, help='The number of workers.')
+@click.option('--transports', default='http,ipc', show_default=True, type=str,
+              help='Comma separated transports to benchmark.')
+@click.option('--benchmarks', default=','.join(BENCHMARKS), show_default=True, type=str,
+              help='Comma separated benchmarks to run.')
+@click.option('--output', default=None, show_default=True, type=str, help='Write the results to this json file.')
+def run_benchmarks(blocks, transactions_per_block, latency_ms, error_rate, max_workers, transports, benchmarks,
+                   output):
+    """Benchmarks the export commands and streaming against a local fake node."""
+    height = 10 * blocks
+    start_block, end_block = height - blocks + 1, height
+    ipc_path = os.path.join(tempfile.mkdtemp(prefix='ethereumetl_fake_node_'), 'fake_node.ipc')
+    node = FakeNode(SyntheticChain(height=height, transactions_per_block=transactions_per_block),
+                    latency_ms=latency_ms, error_rate=error_rate)
+    results = []
+    with FakeNodeServer(node, ipc_path=ipc_path) as server:
+        provider_uris = {'http': server.uri, 'ipc': server.ipc_uri}
+        for transport in transports.split(','):
+            for name in benchmarks.split(','):
+                result = run_benchmark(name, provider_uris[transport], start_block, end_block, max_workers)
+                result['transport'] = transport
+                results.append(result)
+                click.echo('{benchmark:<32} {transport:<5} {item_count:>10} items {duration_seconds:>9.2f}s '
+                           '{items_per_second:>12} items/s'.format(**result))
+
+    if output is not None:
+        with open(output, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'blocks': blocks,
+                'transactions_per_block': transactions_per_block,
+                'latency_ms': latency_ms,
+                'error_rate': error_rate,
+                'max_workers': max_workers,
+                'results': results,
+            }, file, indent=2)
+
+
+if __name__ == '__main__':
+    run_benchmarks()
@@ -35,9 +35,10 @@ import io
 import threading
 from json import JSONEncoder
 
-import decimal
 import six
 
+from blockchainetl import json_codec
+
 
 class BaseItemExporter(object):
 
@@ -109,6 +110,7 @@ class CsvItemExporter(BaseItemExporter):
             write_through=True,
             encoding=self.encoding
         ) if six.PY3 else file
+        self.file = file
         self.csv_writer = csv.writer(self.stream, **kwargs)
         self._headers_not_written = True
         self._join_multivalued = join_multivalued
@@ -146,6 +148,16 @@ class CsvItemExporter(BaseItemExporter):
         values = list(self._build_row(x for _, x in fields))
         self.csv_writer.writerow(values)
 
+    # Writes rows already serialized by a CsvItemExporter without headers and with the same fields_to_export
+    def export_serialized(self, data):
+        if self._headers_not_written:
+            with self._write_headers_lock:
+                if self._headers_not_written:
+                    if self.include_headers_line:
+                        self.csv_writer.writerow(list(self._build_row(self.fields_to_export)))
+                    self._headers_not_written = False
+        self.file.write(data)
+
     def _build_row(self, values):
         for s in values:
             try:
@@ -166,23 +178,31 @@ class CsvItemExporter(BaseItemExporter):
             self.csv_writer.writerow(row)
 
 def EncodeDecimal(o):
-    if isinstance(o, decimal.Decimal):
-        return float(round(o, 8))
-    raise TypeError(repr(o) + " is not JSON serializable")
+    return json_codec.encode_default(o)
 
 class JsonLinesItemExporter(BaseItemExporter):
 
     def __init__(self, file, **kwargs):
         self._configure(kwargs, dont_fail=True)
         self.file = file
-        kwargs.setdefault('ensure_ascii', not self.encoding)
-        # kwargs.setdefault('default', EncodeDecimal)
-        self.encoder = JSONEncoder(default=EncodeDecimal, **kwargs)
+        # Custom encoder options and encodings fall back to the standard library encoder
+        if kwargs or self.encoding:
+            kwargs.setdefault('ensure_ascii', not self.encoding)
+            self.encoder = JSONEncoder(default=EncodeDecimal, **kwargs)
+        else:
+            self.encoder = None
 
     def export_item(self, item):
         itemdict = dict(self._get_serialized_fields(item))
-        data = self.encoder.encode(itemdict) + '\n'
-        self.file.write(to_bytes(data, self.encoding))
+        if self.encoder is None:
+            self.file.write(json_codec.dumps_item_bytes(itemdict) + b'\n')
+        else:
+            data = self.encoder.encode(itemdict) + '\n'
+            self.file.write(to_bytes(data, self.encoding))
+
+    # Writes lines already serialized by a JsonLinesItemExporter with the same options
+    def export_serialized(self, data):
+        self.file.write(data)
 
 
 def to_native_str(text, encoding=None, errors='strict'):
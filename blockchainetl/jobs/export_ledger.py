@@ -0,0 +1,76 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import os
+
+
+# Records how far a job exporting a block range in order has got, so that it can resume after a crash instead of
+# starting over. The first line of the ledger file holds the block range, and every following line the last
+# exported block with the sizes of the output files at that point. On resume the output files are truncated to
+# those sizes, which drops whatever was written after the last recorded batch, and the export continues from the
+# next block.
+class ExportLedger:
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = None
+
+    def open(self, start_block, end_block):
+        """Returns the last recorded block and the output file sizes at that point, or (None, None) for a new
+        ledger."""
+        header = {'start_block': start_block, 'end_block': end_block}
+        last_block, offsets = None, None
+        valid_size = 0
+        if os.path.exists(self.filename):
+            with open(self.filename, 'rb') as file:
+                lines = file.read().split(b'\n')
+            # A line without the trailing new line was cut short by a crash
+            for index, line in enumerate(lines[:-1]):
+                record = json.loads(line)
+                if index == 0:
+                    if record != header:
+                        raise ValueError('The ledger {} is for blocks {}-{}, not {}-{}'.format(
+                            self.filename, record.get('start_block'), record.get('end_block'),
+                            start_block, end_block))
+                else:
+                    last_block, offsets = record['last_block'], record['offsets']
+                valid_size += len(line) + 1
+
+        self._file = open(self.filename, 'ab')
+        self._file.truncate(valid_size)
+        if valid_size == 0:
+            self._write(header)
+        return last_block, offsets
+
+    def record(self, last_block, offsets):
+        self._write({'last_block': last_block, 'offsets': offsets})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, record):
+        self._file.write(json.dumps(record).encode() + b'\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
@@ -19,12 +19,20 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import io
 import logging
+import os
 
 from blockchainetl.atomic_counter import AtomicCounter
 from blockchainetl.exporters import CsvItemExporter, JsonLinesItemExporter
-from blockchainetl.file_utils import get_file_handle, close_silently
+from blockchainetl.file_utils import get_file_handle, close_silently, is_regular_file
 from blockchainetl.jobs.exporters.converters.composite_item_converter import CompositeItemConverter
+from blockchainetl.metrics import registry
+
+EXPORTED_ITEMS = registry.counter(
+    'blockchainetl_exported_items_total', 'Items written to output files.', ['item_type'])
+OUTPUT_FILE_BYTES = registry.gauge(
+    'blockchainetl_output_file_bytes', 'The size of the output file of an item type.', ['item_type'])
 
 
 class CompositeItemExporter:
@@ -40,18 +48,28 @@ class CompositeItemExporter:
 
         self.logger = logging.getLogger('CompositeItemExporter')
 
-    def open(self):
+    def open(self, offsets=None):
+        """With offsets, as returned by sync(), continues the output files from those sizes instead of overwriting
+        them, dropping anything written after."""
         for item_type, filename in self.filename_mapping.items():
-            file = get_file_handle(filename, binary=True)
+            offset = offsets.get(item_type) if offsets is not None else None
+            if offset:
+                file = get_file_handle(filename, mode='r+', binary=True)
+                file.truncate(offset)
+                file.seek(offset)
+            else:
+                file = get_file_handle(filename, binary=True)
             fields = self.field_mapping.get(item_type)
             self.file_mapping[item_type] = file
             if str(filename).endswith('.json'):
                 item_exporter = JsonLinesItemExporter(file, fields_to_export=fields)
             else:
-                item_exporter = CsvItemExporter(file, fields_to_export=fields)
+                item_exporter = CsvItemExporter(file, include_headers_line=not offset, fields_to_export=fields)
             self.exporter_mapping[item_type] = item_exporter
 
             self.counter_mapping[item_type] = AtomicCounter()
+            if is_regular_file(filename):
+                OUTPUT_FILE_BYTES.labels(item_type).set_function(file.tell)
 
     def export_items(self, items):
         for item in items:
@@ -70,10 +88,80 @@ class CompositeItemExporter:
         counter = self.counter_mapping.get(item_type)
         if counter is not None:
             counter.increment()
+        EXPORTED_ITEMS.labels(item_type).inc()
+
+    def get_item_serializer(self):
+        """Returns a picklable CompositeItemSerializer producing the output of this exporter, or None when the
+        fields of some item type are only known from the first item."""
+        if any(self.field_mapping.get(item_type) is None for item_type in self.filename_mapping):
+            return None
+        return CompositeItemSerializer(
+            {item_type: 'json' if str(filename).endswith('.json') else 'csv'
+             for item_type, filename in self.filename_mapping.items()},
+            self.field_mapping, self.converter)
+
+    def export_serialized_items(self, serialized_items):
+        for item_type, (data, item_count) in serialized_items.items():
+            exporter = self.exporter_mapping.get(item_type)
+            if exporter is None:
+                raise ValueError('Exporter for item type {} not found'.format(item_type))
+            exporter.export_serialized(data)
+
+            counter = self.counter_mapping.get(item_type)
+            if counter is not None:
+                counter.increment(item_count)
+            EXPORTED_ITEMS.labels(item_type).inc(item_count)
+
+    def sync(self):
+        """Flushes the output files to disk and returns their sizes by item type, skipping outputs that are not
+        files."""
+        offsets = {}
+        for item_type, file in self.file_mapping.items():
+            if not is_regular_file(self.filename_mapping[item_type]):
+                continue
+            file.flush()
+            os.fsync(file.fileno())
+            offsets[item_type] = file.tell()
+        return offsets
 
     def close(self):
         for item_type, file in self.file_mapping.items():
+            if is_regular_file(self.filename_mapping[item_type]):
+                OUTPUT_FILE_BYTES.labels(item_type).set(file.tell())
             close_silently(file)
             counter = self.counter_mapping[item_type]
             if counter is not None:
                 self.logger.info('{} items exported: {}'.format(item_type, counter.increment() - 1))
+
+
+# Serializes items the way CompositeItemExporter writes them, so that serialization can run in another process.
+# serialize_items returns the serialized data and the number of items for every item type.
+class CompositeItemSerializer:
+    def __init__(self, format_mapping, field_mapping, converter):
+        self.format_mapping = format_mapping
+        self.field_mapping = field_mapping
+        self.converter = converter
+
+    def serialize_items(self, items):
+        buffers = {}
+        exporters = {}
+        item_counts = {}
+        for item in items:
+            item_type = item.get('type')
+            exporter = exporters.get(item_type)
+            if exporter is None:
+                if item_type not in self.format_mapping:
+                    raise ValueError('Exporter for item type {} not found'.format(item_type))
+                buffers[item_type] = io.BytesIO()
+                exporter = self._create_exporter(item_type, buffers[item_type])
+                exporters[item_type] = exporter
+                item_counts[item_type] = 0
+            exporter.export_item(self.converter.convert_item(item))
+            item_counts[item_type] += 1
+        return {item_type: (buffer.getvalue(), item_counts[item_type]) for item_type, buffer in buffers.items()}
+
+    def _create_exporter(self, item_type, file):
+        fields = self.field_mapping.get(item_type)
+        if self.format_mapping[item_type] == 'json':
+            return JsonLinesItemExporter(file, fields_to_export=fields)
+        return CsvItemExporter(file, include_headers_line=False, fields_to_export=fields)
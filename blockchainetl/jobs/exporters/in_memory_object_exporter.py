@@ -0,0 +1,45 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Collects the objects exported by jobs, grouped by their class, for handing domain objects to other jobs in the same
+# process without mapping them to dicts
+class InMemoryObjectExporter:
+    def __init__(self, object_types):
+        self.object_types = object_types
+        self.objects = {}
+
+    def open(self):
+        for object_type in self.object_types:
+            self.objects[object_type] = []
+
+    def export_item(self, obj):
+        objects = self.objects.get(type(obj))
+        if objects is None:
+            raise ValueError('Unexpected object type {}'.format(type(obj).__name__))
+        objects.append(obj)
+
+    def close(self):
+        pass
+
+    def get_items(self, object_type):
+        return self.objects[object_type]
@@ -20,13 +20,14 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import json
 import typing as t
 import uuid
 from itertools import zip_longest
 
 import boto3
 
+from blockchainetl import json_codec
+
 _KINESIS_BATCH_LIMIT = 500
 
 
@@ -79,4 +80,4 @@ class KinesisItemExporter:
 
 
 def _serialize_item(item: dict) -> bytes:
-    return json.dumps(item).encode()
+    return json_codec.dumps_item_bytes(item)
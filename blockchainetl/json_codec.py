@@ -0,0 +1,156 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+JSON encoding and decoding for the hot paths: RPC requests and responses and exported items.
+RPC requests and responses use orjson when it's installed and the standard library otherwise. Exported items are
+encoded exactly like json.dumps unless compact items are enabled with set_compact_items, which uses orjson when it's
+installed and the standard library with the same output otherwise.
+"""
+
+import decimal
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson only supports 64 bit integers. It raises on larger ints when encoding but silently decodes them as floats,
+# so documents with long integer literals are decoded with the standard library.
+LONG_INTEGER_PATTERN = re.compile(rb'[:,\[]\s*-?\d{19}')
+
+
+def encode_default(o):
+    if isinstance(o, decimal.Decimal):
+        return float(round(o, 8))
+    if isinstance(o, (bytes, bytearray)):
+        return '0x' + o.hex()
+    raise TypeError(repr(o) + ' is not JSON serializable')
+
+
+# Encodes like json.dumps. With compact=True it produces the same bytes as orjson: no spaces after separators and
+# non-ASCII characters as UTF-8 instead of escapes.
+class StdlibJsonCodec:
+    name = 'json'
+
+    def __init__(self, compact=False):
+        self.compact = compact
+        if compact:
+            self._encoder = json.JSONEncoder(default=encode_default, separators=(',', ':'), ensure_ascii=False)
+        else:
+            self._encoder = json.JSONEncoder(default=encode_default)
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj)
+
+    def dumps_bytes(self, obj):
+        return self._encoder.encode(obj).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonJsonCodec:
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ValueError('orjson is not installed. Install it with pip install ethereum-etl[orjson]')
+        self._fallback = StdlibJsonCodec(compact=True)
+
+    def dumps(self, obj):
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        try:
+            return orjson.dumps(obj, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Integers over 64 bits e.g. wei values
+            return self._fallback.dumps_bytes(obj)
+
+    def loads(self, data):
+        data_bytes = data.encode('utf-8') if isinstance(data, str) else data
+        if LONG_INTEGER_PATTERN.search(data_bytes) is not None:
+            return self._fallback.loads(data)
+        try:
+            return orjson.loads(data_bytes)
+        except orjson.JSONDecodeError:
+            # NaN, Infinity and other extensions supported by the standard library
+            return self._fallback.loads(data)
+
+
+def get_default_codec():
+    return OrjsonJsonCodec() if orjson is not None else StdlibJsonCodec()
+
+
+_codec = get_default_codec()
+
+
+def set_codec(codec):
+    global _codec
+    _codec = codec
+
+
+def get_codec():
+    return _codec
+
+
+def get_compact_codec():
+    return OrjsonJsonCodec() if orjson is not None else StdlibJsonCodec(compact=True)
+
+
+_item_codec = StdlibJsonCodec()
+_compact_items = False
+
+
+# Compact items change the bytes of every JSON output, so they are opt-in
+def set_compact_items(compact):
+    global _item_codec, _compact_items
+    _item_codec = get_compact_codec() if compact else StdlibJsonCodec()
+    _compact_items = compact
+
+
+def is_compact_items():
+    return _compact_items
+
+
+def dumps_item(item):
+    return _item_codec.dumps(item)
+
+
+def dumps_item_bytes(item):
+    return _item_codec.dumps_bytes(item)
+
+
+def dumps(obj):
+    return _codec.dumps(obj)
+
+
+def dumps_bytes(obj):
+    return _codec.dumps_bytes(obj)
+
+
+def loads(data):
+    return _codec.loads(data)
@@ -0,0 +1,198 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import contextlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+DEFAULT_MAX_EVENTS = 1000000
+
+_recorder = None
+
+
+# Records spans as Chrome trace events (https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU),
+# which chrome://tracing and https://ui.perfetto.dev show as a timeline per thread. Only the latest max_events spans
+# are kept, so that a long running stream doesn't run out of memory. With sampling_interval_seconds, the stacks of
+# all threads are also sampled at that interval, which the viewers show as a CPU profile.
+class TraceRecorder:
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS, sampling_interval_seconds=None):
+        self.sampling_interval_seconds = sampling_interval_seconds
+        self._pid = os.getpid()
+        self._events = deque(maxlen=max_events)
+        self._thread_names = {}
+        self._samples = deque(maxlen=max_events)
+        self._stack_frames = {}
+        self._stack_frame_ids = {}
+        self._async_span_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        if self.sampling_interval_seconds is not None:
+            self._sampler = threading.Thread(target=self._sample_periodically, name='TraceSampler', daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop_sampling.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            ended_at = time.perf_counter()
+            thread = threading.current_thread()
+            event = {
+                'name': name, 'ph': 'X', 'pid': self._pid, 'tid': thread.ident,
+                'ts': started_at * 1e6, 'dur': (ended_at - started_at) * 1e6,
+            }
+            if args:
+                event['args'] = args
+            if thread.ident not in self._thread_names:
+                self._thread_names[thread.ident] = thread.name
+            self._events.append(event)
+
+    # Spans of coroutines interleave on the event loop thread, so they are recorded as async events, which the viewers
+    # show on separate tracks instead of nesting them into each other
+    @contextlib.contextmanager
+    def async_span(self, name, **args):
+        span_id = next(self._async_span_ids)
+        self._events.append(self._async_event(name, 'b', span_id, args))
+        try:
+            yield
+        finally:
+            self._events.append(self._async_event(name, 'e', span_id, None))
+
+    def _async_event(self, name, phase, span_id, args):
+        event = {
+            'name': name, 'cat': name, 'ph': phase, 'id': span_id, 'pid': self._pid,
+            'tid': threading.get_ident(), 'ts': time.perf_counter() * 1e6,
+        }
+        if args:
+            event['args'] = args
+        return event
+
+    def write(self, filename):
+        with self._lock:
+            samples = list(self._samples)
+            stack_frames = dict(self._stack_frames)
+        thread_name_events = [{
+            'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid, 'args': {'name': thread_name}
+        } for tid, thread_name in list(self._thread_names.items())]
+        trace = {
+            'traceEvents': thread_name_events + list(self._events),
+            'displayTimeUnit': 'ms',
+        }
+        if samples:
+            trace['samples'] = samples
+            trace['stackFrames'] = stack_frames
+        with open(filename, 'w') as file:
+            json.dump(trace, file)
+
+    def _sample_periodically(self):
+        sampler_ident = threading.get_ident()
+        while not self._stop_sampling.wait(self.sampling_interval_seconds):
+            ts = time.perf_counter() * 1e6
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == sampler_ident:
+                    continue
+                with self._lock:
+                    self._samples.append({
+                        'cpu': 0, 'tid': tid, 'ts': ts, 'name': thread_names.get(tid, str(tid)),
+                        'sf': self._get_stack_frame_id(frame), 'weight': 1,
+                    })
+
+    def _get_stack_frame_id(self, frame):
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        parent_id = None
+        for frame in reversed(frames):
+            code = frame.f_code
+            key = (parent_id, code.co_filename, code.co_name, code.co_firstlineno)
+            frame_id = self._stack_frame_ids.get(key)
+            if frame_id is None:
+                frame_id = str(len(self._stack_frame_ids))
+                self._stack_frame_ids[key] = frame_id
+                stack_frame = {
+                    'name': '{} {}:{}'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno),
+                    'category': os.path.basename(code.co_filename),
+                }
+                if parent_id is not None:
+                    stack_frame['parent'] = parent_id
+                self._stack_frames[frame_id] = stack_frame
+            parent_id = frame_id
+        return parent_id
+
+
+# Records a span with the current TraceRecorder, and does nothing when profiling is off
+def span(name, **args):
+    recorder = _recorder
+    if recorder is None:
+        return contextlib.nullcontext()
+    return recorder.span(name, **args)
+
+
+def async_span(name, **args):
+    recorder = _recorder
+    if recorder is None:
+        return contextlib.nullcontext()
+    return recorder.async_span(name, **args)
+
+
+def describe_batch(batch):
+    args = {'size': len(batch)}
+    if isinstance(batch[0], (int, str)):
+        args['first_item'] = batch[0]
+        args['last_item'] = batch[-1]
+    return args
+
+
+@contextlib.contextmanager
+def profiling(filename, sampling_interval_ms=None):
+    """Records spans while in the context and writes them to filename as a Chrome trace. Does nothing if filename
+    is None."""
+    global _recorder
+    if filename is None:
+        yield
+        return
+    sampling_interval_seconds = sampling_interval_ms / 1000 if sampling_interval_ms is not None else None
+    _recorder = TraceRecorder(sampling_interval_seconds=sampling_interval_seconds).start()
+    try:
+        yield
+    finally:
+        recorder, _recorder = _recorder, None
+        recorder.stop()
+        recorder.write(filename)
@@ -24,11 +24,21 @@
 import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from blockchainetl.streaming.streamer_adapter_stub import StreamerAdapterStub
 from blockchainetl.file_utils import smart_open
+from blockchainetl.metrics import registry
 
+CURRENT_BLOCK = registry.gauge('blockchainetl_streamer_current_block', 'The latest block of the node.')
+LAST_SYNCED_BLOCK = registry.gauge('blockchainetl_streamer_last_synced_block', 'The last block streamed.')
 
+
+# With pipelined, the next block range is extracted from the node while the previous one is exported to the sink in
+# a separate thread, so that node and sink latencies overlap instead of adding up. The last synced block is written
+# by the export thread after the sink accepted the range, so it still advances in order.
+# With a head_source, e.g. a newHeads subscription, the streamer waits for the next block from it instead of sleeping
+# for period_seconds, and still polls every period_seconds in case the head source misses blocks.
 class Streamer:
     def __init__(
             self,
@@ -40,7 +50,9 @@ class Streamer:
             period_seconds=10,
             block_batch_size=10,
             retry_errors=True,
-            pid_file=None):
+            pid_file=None,
+            pipelined=False,
+            head_source=None):
         self.blockchain_streamer_adapter = blockchain_streamer_adapter
         self.last_synced_block_file = last_synced_block_file
         self.lag = lag
@@ -56,37 +68,64 @@ class Streamer:
 
         self.last_synced_block = read_last_synced_block(self.last_synced_block_file)
 
+        self.pipelined = pipelined
+        self.head_source = head_source
+        # The last block extracted from the node, ahead of last_synced_block while its range is being exported
+        self.last_extracted_block = self.last_synced_block
+        self._export_executor = None
+        self._pending_export = None
+
     def stream(self):
         try:
             if self.pid_file is not None:
                 logging.info('Creating pid file {}'.format(self.pid_file))
                 write_to_file(self.pid_file, str(os.getpid()))
             self.blockchain_streamer_adapter.open()
+            if self.head_source is not None:
+                self.head_source.start()
+            if self.pipelined:
+                self._export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='StreamerExport')
             self._do_stream()
         finally:
+            if self._export_executor is not None:
+                # Lets the range being exported finish, so that its last synced block is written
+                self._export_executor.shutdown(wait=True)
+            if self.head_source is not None:
+                self.head_source.stop()
             self.blockchain_streamer_adapter.close()
             if self.pid_file is not None:
                 logging.info('Deleting pid file {}'.format(self.pid_file))
                 delete_file(self.pid_file)
 
     def _do_stream(self):
-        while True and (self.end_block is None or self.last_synced_block < self.end_block):
+        while True and not self._reached_end_block():
             synced_blocks = 0
 
             try:
-                synced_blocks = self._sync_cycle()
+                synced_blocks = self._pipelined_sync_cycle() if self.pipelined else self._sync_cycle()
             except Exception as e:
                 # https://stackoverflow.com/a/4992124/1580227
                 logging.exception('An exception occurred while syncing block data.')
                 if not self.retry_errors:
                     raise e
 
-            if synced_blocks <= 0:
-                logging.info('Nothing to sync. Sleeping for {} seconds...'.format(self.period_seconds))
-                time.sleep(self.period_seconds)
+            if synced_blocks <= 0 and not self._reached_end_block():
+                self._wait_for_new_block()
+
+    def _wait_for_new_block(self):
+        if self.head_source is None:
+            logging.info('Nothing to sync. Sleeping for {} seconds...'.format(self.period_seconds))
+            time.sleep(self.period_seconds)
+        else:
+            logging.info('Nothing to sync. Waiting for a new block for up to {} seconds...'.format(self.period_seconds))
+            self.head_source.wait_for_new_head(self.period_seconds)
+
+    def _reached_end_block(self):
+        return self.end_block is not None and self.last_synced_block >= self.end_block
 
     def _sync_cycle(self):
         current_block = self.blockchain_streamer_adapter.get_current_block_number()
+        CURRENT_BLOCK.labels().set(current_block)
 
         target_block = self._calculate_target_block(current_block, self.last_synced_block)
         blocks_to_sync = max(target_block - self.last_synced_block, 0)
@@ -99,9 +138,53 @@ class Streamer:
             logging.info('Writing last synced block {}'.format(target_block))
             write_last_synced_block(self.last_synced_block_file, target_block)
             self.last_synced_block = target_block
+            self.last_extracted_block = target_block
+            LAST_SYNCED_BLOCK.labels().set(target_block)
+
+        return blocks_to_sync
+
+    def _pipelined_sync_cycle(self):
+        current_block = self.blockchain_streamer_adapter.get_current_block_number()
+        CURRENT_BLOCK.labels().set(current_block)
+
+        target_block = self._calculate_target_block(current_block, self.last_extracted_block)
+        blocks_to_sync = max(target_block - self.last_extracted_block, 0)
+
+        logging.info('Current block {}, target block {}, last extracted block {}, blocks to sync {}'.format(
+            current_block, target_block, self.last_extracted_block, blocks_to_sync))
+
+        items = None
+        if blocks_to_sync != 0:
+            items = self.blockchain_streamer_adapter.extract_all(self.last_extracted_block + 1, target_block)
+
+        # Only one range is exported at a time, which keeps the checkpoints in order and bounds memory to two ranges
+        self._wait_for_export()
+
+        if items is not None:
+            self._pending_export = self._export_executor.submit(
+                self._export_range, items, self.last_extracted_block + 1, target_block)
+            self.last_extracted_block = target_block
 
         return blocks_to_sync
 
+    def _export_range(self, items, start_block, end_block):
+        self.blockchain_streamer_adapter.export_items(items, start_block, end_block)
+        logging.info('Writing last synced block {}'.format(end_block))
+        write_last_synced_block(self.last_synced_block_file, end_block)
+        self.last_synced_block = end_block
+        LAST_SYNCED_BLOCK.labels().set(end_block)
+
+    def _wait_for_export(self):
+        pending_export, self._pending_export = self._pending_export, None
+        if pending_export is None:
+            return
+        try:
+            pending_export.result()
+        except Exception:
+            # The ranges extracted after the failed one are dropped and extracted again
+            self.last_extracted_block = self.last_synced_block
+            raise
+
     def _calculate_target_block(self, current_block, last_synced_block):
         target_block = current_block - self.lag
         target_block = min(target_block, last_synced_block + self.block_batch_size)
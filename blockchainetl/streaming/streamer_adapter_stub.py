@@ -9,5 +9,11 @@ class StreamerAdapterStub:
     def export_all(self, start_block, end_block):
         pass
 
+    def extract_all(self, start_block, end_block):
+        return []
+
+    def export_items(self, items, start_block, end_block):
+        pass
+
     def close(self):
         pass
@@ -23,4 +23,5 @@
 
 from ethereumetl.cli import cli
 
-cli()
+if __name__ == '__main__':
+    cli()
@@ -25,6 +25,7 @@ logging_basic_config()
 
 import click
 
+from blockchainetl import json_codec
 from ethereumetl.cli.export_all import export_all
 from ethereumetl.cli.export_blocks_and_transactions import export_blocks_and_transactions
 from ethereumetl.cli.export_contracts import export_contracts
@@ -49,9 +50,12 @@ from ethereumetl.cli.stream import stream
 
 @click.group()
 @click.version_option(version='2.3.1')
+@click.option('--compact-json', is_flag=True, default=False,
+              help='Write JSON items without spaces after separators and with non-ASCII characters as UTF-8. '
+                   'Faster with orjson installed.')
 @click.pass_context
-def cli(ctx):
-    pass
+def cli(ctx, compact_json):
+    json_codec.set_compact_items(compact_json)
 
 
 # export
@@ -30,6 +30,7 @@ from blockchainetl.logging_utils import logging_basic_config
 from ethereumetl.web3_utils import build_web3
 
 from ethereumetl.jobs.export_all_common import export_all_common
+from ethereumetl.progress_logger import configure_progress_output
 from ethereumetl.providers.auto import get_provider_from_uri
 from ethereumetl.service.eth_service import EthService
 from ethereumetl.utils import check_classic_provider_uri
@@ -116,9 +117,13 @@ def get_partitions(start, end, partition_batch_size, provider_uri):
 @click.option('-w', '--max-workers', default=5, show_default=True, type=int, help='The maximum number of workers.')
 @click.option('-B', '--export-batch-size', default=100, show_default=True, type=int, help='The number of requests in JSON RPC batches.')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
+@click.option('--progress-file', default=None, show_default=True, type=str,
+              help='Append progress reports with rates and ETA to this file as JSON lines, every minute and at the '
+                   'end of each stage.')
 def export_all(start, end, partition_batch_size, provider_uri, output_dir, max_workers, export_batch_size,
-               chain='ethereum'):
+               chain='ethereum', progress_file=None):
     """Exports all data for a range of blocks."""
+    configure_progress_output(progress_file)
     provider_uri = check_classic_provider_uri(chain, provider_uri)
     export_all_common(get_partitions(start, end, partition_batch_size, provider_uri),
                       output_dir, provider_uri, max_workers, export_batch_size)
@@ -23,11 +23,16 @@
 
 import click
 
+from ethereumetl.enumeration.retry_strategy import RetryStrategy
 from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
 from ethereumetl.jobs.exporters.blocks_and_transactions_item_exporter import blocks_and_transactions_item_exporter
+from blockchainetl.jobs.export_ledger import ExportLedger
 from blockchainetl.logging_utils import logging_basic_config
-from ethereumetl.providers.auto import get_provider_from_uri
-from ethereumetl.thread_local_proxy import ThreadLocalProxy
+from blockchainetl.metrics import start_metrics_server
+from blockchainetl.profiling import profiling
+from ethereumetl.progress_logger import configure_progress_output
+from ethereumetl.providers.auto import get_batch_provider_from_uri
+from ethereumetl.providers.caching import close_response_cache, wrap_with_response_cache
 from ethereumetl.utils import check_classic_provider_uri
 
 logging_basic_config()
@@ -47,20 +52,87 @@ logging_basic_config()
               help='The output file for transactions. '
                    'If not provided transactions will not be exported. Use "-" for stdout')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
+@click.option('--use-asyncio', is_flag=True, default=False, show_default=True,
+              help='Send batch requests with the asyncio HTTP provider. --max-workers is then the number of '
+                   'batch requests kept in flight over a pool of keep-alive connections.')
+@click.option('--cache-dir', default=None, show_default=True, type=str,
+              help='The directory of the on-disk cache of RPC responses for finalized blocks. '
+                   'If not provided responses are not cached.')
+@click.option('--cache-max-size-mb', default=10240, show_default=True, type=int,
+              help='The maximum size of the response cache, the oldest entries are evicted first.')
+@click.option('--finality-depth', default=64, show_default=True, type=int,
+              help='Only responses for blocks at least this many blocks below the head are cached.')
+@click.option('--max-requests-per-second', default=None, show_default=True, type=float,
+              help='The maximum number of JSON-RPC requests per second sent to each provider uri.')
+@click.option('--max-compute-units-per-second', default=None, show_default=True, type=float,
+              help='The maximum number of compute units per second sent to each provider uri, '
+                   'as billed by hosted node providers.')
+@click.option('--target-batch-bytes', default=None, show_default=True, type=int,
+              help='Size batches so that each response is about this many bytes, e.g. 5000000, based on the '
+                   'response sizes seen so far. --batch-size is then the maximum batch size.')
+@click.option('--retry-strategy', default=RetryStrategy.ITEM, show_default=True,
+              type=click.Choice(RetryStrategy.ALL),
+              help='How failed batches are retried: item retries every item on its own, bisect splits the batch '
+                   'in halves until the failing items are isolated.')
+@click.option('--adaptive', is_flag=True, default=False, show_default=True,
+              help='Adjust the batch size and the number of batches in flight to the observed latency, throughput '
+                   'and errors of the node. --batch-size and --max-workers are then the starting values.')
+@click.option('--mapping-processes', default=None, show_default=True, type=int,
+              help='Decode, map and serialize responses in this many worker processes instead of the worker '
+                   'threads, to use more than one CPU core.')
+@click.option('--ordered', is_flag=True, default=False, show_default=True,
+              help='Write the output in the order of the input, holding back batches that complete early.')
+@click.option('--ledger-file', default=None, show_default=True, type=str,
+              help='A file recording the progress of the export. If the export is interrupted, running the same '
+                   'command again resumes it from the last recorded block.')
+@click.option('--metrics-port', default=None, show_default=True, type=int,
+              help='Serve metrics in the Prometheus text format at http://127.0.0.1:<port>/metrics.')
+@click.option('--progress-file', default=None, show_default=True, type=str,
+              help='Append progress reports with rates and ETA to this file as JSON lines, every minute and at the '
+                   'end of each stage.')
+@click.option('--profile', default=None, show_default=True, type=str,
+              help='Write a timeline of the fetch, decode, map and export spans of every batch to this file, in the '
+                   'Chrome trace format that chrome://tracing and https://ui.perfetto.dev open.')
+@click.option('--profile-sampling-interval-ms', default=None, show_default=True, type=float,
+              help='With --profile, also sample the stacks of all threads at this interval, which the trace viewers '
+                   'show as a CPU profile.')
 def export_blocks_and_transactions(start_block, end_block, batch_size, provider_uri, max_workers, blocks_output,
-                                   transactions_output, chain='ethereum'):
+                                   transactions_output, chain='ethereum', use_asyncio=False, cache_dir=None,
+                                   cache_max_size_mb=10240, finality_depth=64, max_requests_per_second=None,
+                                   max_compute_units_per_second=None, target_batch_bytes=None,
+                                   retry_strategy=RetryStrategy.ITEM, adaptive=False,
+                                   mapping_processes=None, ordered=False,
+                                   ledger_file=None, metrics_port=None, progress_file=None, profile=None,
+                                   profile_sampling_interval_ms=None):
     """Exports blocks and transactions."""
+    configure_progress_output(progress_file)
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
     provider_uri = check_classic_provider_uri(chain, provider_uri)
     if blocks_output is None and transactions_output is None:
         raise ValueError('Either --blocks-output or --transactions-output options must be provided')
 
+    batch_web3_provider = wrap_with_response_cache(
+        get_batch_provider_from_uri(provider_uri, use_asyncio, requests_per_second=max_requests_per_second,
+                                    compute_units_per_second=max_compute_units_per_second),
+        cache_dir, cache_max_size_mb, finality_depth)
     job = ExportBlocksJob(
         start_block=start_block,
         end_block=end_block,
         batch_size=batch_size,
-        batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+        batch_web3_provider=batch_web3_provider,
         max_workers=max_workers,
         item_exporter=blocks_and_transactions_item_exporter(blocks_output, transactions_output),
         export_blocks=blocks_output is not None,
-        export_transactions=transactions_output is not None)
-    job.run()
+        export_transactions=transactions_output is not None,
+        target_batch_bytes=target_batch_bytes,
+        retry_strategy=retry_strategy,
+        adaptive=adaptive,
+        mapping_processes=mapping_processes,
+        ordered=ordered,
+        ledger=ExportLedger(ledger_file) if ledger_file is not None else None)
+    try:
+        with profiling(profile, sampling_interval_ms=profile_sampling_interval_ms):
+            job.run()
+    finally:
+        close_response_cache(batch_web3_provider)
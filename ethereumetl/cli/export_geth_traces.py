@@ -27,6 +27,7 @@ from ethereumetl.jobs.export_geth_traces_job import ExportGethTracesJob
 from ethereumetl.jobs.exporters.geth_traces_item_exporter import geth_traces_item_exporter
 from blockchainetl.logging_utils import logging_basic_config
 from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.providers.caching import close_response_cache, wrap_with_response_cache
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 
 logging_basic_config()
@@ -42,14 +43,28 @@ logging_basic_config()
 @click.option('-p', '--provider-uri', required=True, type=str,
               help='The URI of the web3 provider e.g. '
                    'file://$HOME/Library/Ethereum/geth.ipc or http://localhost:8545/')
-def export_geth_traces(start_block, end_block, batch_size, output, max_workers, provider_uri):
+@click.option('--cache-dir', default=None, show_default=True, type=str,
+              help='The directory of the on-disk cache of RPC responses for finalized blocks. '
+                   'If not provided responses are not cached.')
+@click.option('--cache-max-size-mb', default=10240, show_default=True, type=int,
+              help='The maximum size of the response cache, the oldest entries are evicted first.')
+@click.option('--finality-depth', default=64, show_default=True, type=int,
+              help='Only responses for blocks at least this many blocks below the head are cached.')
+def export_geth_traces(start_block, end_block, batch_size, output, max_workers, provider_uri, cache_dir=None,
+                       cache_max_size_mb=10240, finality_depth=64):
     """Exports traces from geth node."""
+    batch_web3_provider = wrap_with_response_cache(
+        ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+        cache_dir, cache_max_size_mb, finality_depth)
     job = ExportGethTracesJob(
         start_block=start_block,
         end_block=end_block,
         batch_size=batch_size,
-        batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+        batch_web3_provider=batch_web3_provider,
         max_workers=max_workers,
         item_exporter=geth_traces_item_exporter(output))
 
-    job.run()
+    try:
+        job.run()
+    finally:
+        close_response_cache(batch_web3_provider)
@@ -24,11 +24,15 @@
 import click
 
 from blockchainetl.file_utils import smart_open
+from ethereumetl.enumeration.retry_strategy import RetryStrategy
 from ethereumetl.jobs.export_receipts_job import ExportReceiptsJob
 from ethereumetl.jobs.exporters.receipts_and_logs_item_exporter import receipts_and_logs_item_exporter
 from blockchainetl.logging_utils import logging_basic_config
-from ethereumetl.thread_local_proxy import ThreadLocalProxy
-from ethereumetl.providers.auto import get_provider_from_uri
+from blockchainetl.metrics import start_metrics_server
+from blockchainetl.profiling import profiling
+from ethereumetl.progress_logger import configure_progress_output
+from ethereumetl.providers.auto import get_batch_provider_from_uri
+from ethereumetl.providers.caching import close_response_cache, wrap_with_response_cache
 from ethereumetl.utils import check_classic_provider_uri
 
 logging_basic_config()
@@ -48,18 +52,79 @@ logging_basic_config()
               help='The output file for receipt logs. '
                    'If not provided receipt logs will not be exported. Use "-" for stdout')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
+@click.option('--use-asyncio', is_flag=True, default=False, show_default=True,
+              help='Send batch requests with the asyncio HTTP provider. --max-workers is then the number of '
+                   'batch requests kept in flight over a pool of keep-alive connections.')
+@click.option('--cache-dir', default=None, show_default=True, type=str,
+              help='The directory of the on-disk cache of RPC responses for finalized blocks. '
+                   'If not provided responses are not cached.')
+@click.option('--cache-max-size-mb', default=10240, show_default=True, type=int,
+              help='The maximum size of the response cache, the oldest entries are evicted first.')
+@click.option('--finality-depth', default=64, show_default=True, type=int,
+              help='Only responses for blocks at least this many blocks below the head are cached.')
+@click.option('--max-requests-per-second', default=None, show_default=True, type=float,
+              help='The maximum number of JSON-RPC requests per second sent to each provider uri.')
+@click.option('--max-compute-units-per-second', default=None, show_default=True, type=float,
+              help='The maximum number of compute units per second sent to each provider uri, '
+                   'as billed by hosted node providers.')
+@click.option('--target-batch-bytes', default=None, show_default=True, type=int,
+              help='Size batches so that each response is about this many bytes, e.g. 5000000, based on the '
+                   'response sizes seen so far. --batch-size is then the maximum batch size.')
+@click.option('--retry-strategy', default=RetryStrategy.ITEM, show_default=True,
+              type=click.Choice(RetryStrategy.ALL),
+              help='How failed batches are retried: item retries every item on its own, bisect splits the batch '
+                   'in halves until the failing items are isolated.')
+@click.option('--adaptive', is_flag=True, default=False, show_default=True,
+              help='Adjust the batch size and the number of batches in flight to the observed latency, throughput '
+                   'and errors of the node. --batch-size and --max-workers are then the starting values.')
+@click.option('--mapping-processes', default=None, show_default=True, type=int,
+              help='Decode, map and serialize responses in this many worker processes instead of the worker '
+                   'threads, to use more than one CPU core.')
+@click.option('--ordered', is_flag=True, default=False, show_default=True,
+              help='Write the output in the order of the input, holding back batches that complete early.')
+@click.option('--metrics-port', default=None, show_default=True, type=int,
+              help='Serve metrics in the Prometheus text format at http://127.0.0.1:<port>/metrics.')
+@click.option('--progress-file', default=None, show_default=True, type=str,
+              help='Append progress reports with rates and ETA to this file as JSON lines, every minute and at the '
+                   'end of each stage.')
+@click.option('--profile', default=None, show_default=True, type=str,
+              help='Write a timeline of the fetch, decode, map and export spans of every batch to this file, in the '
+                   'Chrome trace format that chrome://tracing and https://ui.perfetto.dev open.')
+@click.option('--profile-sampling-interval-ms', default=None, show_default=True, type=float,
+              help='With --profile, also sample the stacks of all threads at this interval, which the trace viewers '
+                   'show as a CPU profile.')
 def export_receipts_and_logs(batch_size, transaction_hashes, provider_uri, max_workers, receipts_output, logs_output,
-                             chain='ethereum'):
+                             chain='ethereum', use_asyncio=False, cache_dir=None, cache_max_size_mb=10240,
+                             finality_depth=64, max_requests_per_second=None, max_compute_units_per_second=None,
+                             target_batch_bytes=None, retry_strategy=RetryStrategy.ITEM, adaptive=False,
+                             mapping_processes=None, ordered=False, metrics_port=None,
+                             progress_file=None, profile=None, profile_sampling_interval_ms=None):
     """Exports receipts and logs."""
+    configure_progress_output(progress_file)
+    if metrics_port is not None:
+        start_metrics_server(metrics_port)
     provider_uri = check_classic_provider_uri(chain, provider_uri)
+    batch_web3_provider = wrap_with_response_cache(
+        get_batch_provider_from_uri(provider_uri, use_asyncio, requests_per_second=max_requests_per_second,
+                                    compute_units_per_second=max_compute_units_per_second),
+        cache_dir, cache_max_size_mb, finality_depth)
     with smart_open(transaction_hashes, 'r') as transaction_hashes_file:
         job = ExportReceiptsJob(
             transaction_hashes_iterable=(transaction_hash.strip() for transaction_hash in transaction_hashes_file),
             batch_size=batch_size,
-            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+            batch_web3_provider=batch_web3_provider,
             max_workers=max_workers,
             item_exporter=receipts_and_logs_item_exporter(receipts_output, logs_output),
             export_receipts=receipts_output is not None,
-            export_logs=logs_output is not None)
+            export_logs=logs_output is not None,
+            target_batch_bytes=target_batch_bytes,
+            retry_strategy=retry_strategy,
+            adaptive=adaptive,
+            mapping_processes=mapping_processes,
+            ordered=ordered)
 
-        job.run()
+        try:
+            with profiling(profile, sampling_interval_ms=profile_sampling_interval_ms):
+                job.run()
+        finally:
+            close_response_cache(batch_web3_provider)
@@ -26,8 +26,12 @@ import click
 from ethereumetl.web3_utils import build_web3
 
 from ethereumetl.jobs.export_traces_job import ExportTracesJob
+from blockchainetl.jobs.export_ledger import ExportLedger
 from blockchainetl.logging_utils import logging_basic_config
+from blockchainetl.profiling import profiling
+from ethereumetl.progress_logger import configure_progress_output
 from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.providers.caching import close_response_cache, wrap_with_response_cache
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 from ethereumetl.jobs.exporters.traces_item_exporter import traces_item_exporter
 
@@ -47,20 +51,50 @@ logging_basic_config()
 @click.option('--daofork-traces/--no-daofork-traces', default=False, show_default=True, help='Whether to include daofork traces')
 @click.option('-t', '--timeout', default=60, show_default=True, type=int, help='IPC or HTTP request timeout.')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
+@click.option('--cache-dir', default=None, show_default=True, type=str,
+              help='The directory of the on-disk cache of RPC responses for finalized blocks. '
+                   'If not provided responses are not cached.')
+@click.option('--cache-max-size-mb', default=10240, show_default=True, type=int,
+              help='The maximum size of the response cache, the oldest entries are evicted first.')
+@click.option('--finality-depth', default=64, show_default=True, type=int,
+              help='Only responses for blocks at least this many blocks below the head are cached.')
+@click.option('--ledger-file', default=None, show_default=True, type=str,
+              help='A file recording the progress of the export. If the export is interrupted, running the same '
+                   'command again resumes it from the last recorded block.')
+@click.option('--progress-file', default=None, show_default=True, type=str,
+              help='Append progress reports with rates and ETA to this file as JSON lines, every minute and at the '
+                   'end of each stage.')
+@click.option('--profile', default=None, show_default=True, type=str,
+              help='Write a timeline of the fetch, decode, map and export spans of every batch to this file, in the '
+                   'Chrome trace format that chrome://tracing and https://ui.perfetto.dev open.')
+@click.option('--profile-sampling-interval-ms', default=None, show_default=True, type=float,
+              help='With --profile, also sample the stacks of all threads at this interval, which the trace viewers '
+                   'show as a CPU profile.')
 def export_traces(start_block, end_block, batch_size, output, max_workers, provider_uri,
-                  genesis_traces, daofork_traces, timeout=60, chain='ethereum'):
+                  genesis_traces, daofork_traces, timeout=60, chain='ethereum', cache_dir=None, cache_max_size_mb=10240,
+                  finality_depth=64, ledger_file=None, progress_file=None, profile=None,
+                  profile_sampling_interval_ms=None):
     """Exports traces from parity node."""
+    configure_progress_output(progress_file)
     if chain == 'classic' and daofork_traces == True:
         raise ValueError(
             'Classic chain does not include daofork traces. Disable daofork traces with --no-daofork-traces option.')
+    provider = wrap_with_response_cache(
+        ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, timeout=timeout)),
+        cache_dir, cache_max_size_mb, finality_depth)
     job = ExportTracesJob(
         start_block=start_block,
         end_block=end_block,
         batch_size=batch_size,
-        web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri, timeout=timeout))),
+        web3=ThreadLocalProxy(lambda: build_web3(provider)),
         item_exporter=traces_item_exporter(output),
         max_workers=max_workers,
         include_genesis_traces=genesis_traces,
-        include_daofork_traces=daofork_traces)
+        include_daofork_traces=daofork_traces,
+        ledger=ExportLedger(ledger_file) if ledger_file is not None else None)
 
-    job.run()
+    try:
+        with profiling(profile, sampling_interval_ms=profile_sampling_interval_ms):
+            job.run()
+    finally:
+        close_response_cache(provider)
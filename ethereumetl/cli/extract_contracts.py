@@ -22,9 +22,9 @@
 
 
 import csv
-import json
 
 import click
+from blockchainetl import json_codec
 from blockchainetl.csv_utils import set_max_field_size_limit
 from blockchainetl.file_utils import smart_open
 from ethereumetl.jobs.exporters.contracts_item_exporter import contracts_item_exporter
@@ -46,7 +46,7 @@ def extract_contracts(traces, batch_size, output, max_workers):
 
     with smart_open(traces, 'r') as traces_file:
         if traces.endswith('.json'):
-            traces_iterable = (json.loads(line) for line in traces_file)
+            traces_iterable = (json_codec.loads(line) for line in traces_file)
         else:
             traces_iterable = csv.DictReader(traces_file)
         job = ExtractContractsJob(
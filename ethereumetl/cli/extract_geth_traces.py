@@ -20,10 +20,10 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import csv
-import json
 
 import click
 
+from blockchainetl import json_codec
 from blockchainetl.file_utils import smart_open
 from ethereumetl.jobs.exporters.traces_item_exporter import traces_item_exporter
 from ethereumetl.jobs.extract_geth_traces_job import ExtractGethTracesJob
@@ -41,7 +41,7 @@ def extract_geth_traces(input, batch_size, output, max_workers):
     """Extracts geth traces from JSON lines file."""
     with smart_open(input, 'r') as geth_traces_file:
         if input.endswith('.json'):
-            traces_iterable = (json.loads(line) for line in geth_traces_file)
+            traces_iterable = (json_codec.loads(line) for line in geth_traces_file)
         else:
             traces_iterable = (trace for trace in csv.DictReader(geth_traces_file))
         job = ExtractGethTracesJob(
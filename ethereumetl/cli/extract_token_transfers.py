@@ -23,9 +23,9 @@
 
 import click
 import csv
-import json
 
 from ethereumetl.csv_utils import set_max_field_size_limit
+from blockchainetl import json_codec
 from blockchainetl.file_utils import smart_open
 from blockchainetl.jobs.exporters.converters.int_to_string_item_converter import IntToStringItemConverter
 from ethereumetl.jobs.exporters.token_transfers_item_exporter import token_transfers_item_exporter
@@ -46,7 +46,7 @@ def extract_token_transfers(logs, batch_size, output, max_workers, values_as_str
     """Extracts ERC20/ERC721 transfers from logs file."""
     with smart_open(logs, 'r') as logs_file:
         if logs.endswith('.json'):
-            logs_reader = (json.loads(line) for line in logs_file)
+            logs_reader = (json_codec.loads(line) for line in logs_file)
         else:
             logs_reader = csv.DictReader(logs_file)
         converters = [IntToStringItemConverter(keys=['value'])] if values_as_strings else []
@@ -22,9 +22,9 @@
 
 
 import csv
-import json
 
 import click
+from blockchainetl import json_codec
 from blockchainetl.csv_utils import set_max_field_size_limit
 from blockchainetl.file_utils import smart_open
 from blockchainetl.jobs.exporters.converters.int_to_string_item_converter import IntToStringItemConverter
@@ -53,7 +53,7 @@ def extract_tokens(contracts, provider_uri, output, max_workers, values_as_strin
 
     with smart_open(contracts, 'r') as contracts_file:
         if contracts.endswith('.json'):
-            contracts_iterable = (json.loads(line) for line in contracts_file)
+            contracts_iterable = (json_codec.loads(line) for line in contracts_file)
         else:
             contracts_iterable = csv.DictReader(contracts_file)
         converters = [IntToStringItemConverter(keys=['decimals', 'total_supply'])] if values_as_strings else []
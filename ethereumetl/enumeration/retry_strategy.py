@@ -0,0 +1,7 @@
+class RetryStrategy:
+    # Retry every item of a failed batch on its own
+    ITEM = 'item'
+    # Split a failed batch in halves until the failing items are isolated
+    BISECT = 'bisect'
+
+    ALL = [ITEM, BISECT]
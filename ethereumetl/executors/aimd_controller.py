@@ -0,0 +1,148 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import logging
+import threading
+import time
+
+DEFAULT_TARGET_LATENCY_SECONDS = 10
+DEFAULT_WINDOW_SECONDS = 10
+DEFAULT_MAX_ERROR_RATE = 0.05
+DEFAULT_DECREASE_FACTOR = 0.5
+
+# Throughput changes smaller than this between windows are treated as noise
+THROUGHPUT_TOLERANCE = 0.1
+
+
+# Adjusts batch size and concurrency with additive increase / multiplicative decrease.
+# Batch size follows the latency of single batches: it grows by batch_size_increment once per window of concurrency
+# batches that succeeded within target_latency_seconds, i.e. about once per round trip like TCP congestion control,
+# and is cut by decrease_factor when a batch is slower or fails.
+# Concurrency follows the throughput and error rate measured over windows of window_seconds: it grows by one worker
+# while throughput keeps up and is cut by decrease_factor when the error rate goes over max_error_rate or throughput
+# drops, which means the node is saturated.
+# Batches started before the latest decrease don't decrease again, they were sent with the old values.
+class AimdController:
+    def __init__(self, batch_size, concurrency, max_batch_size, max_concurrency, min_batch_size=1, min_concurrency=1,
+                 batch_size_increment=1, target_latency_seconds=DEFAULT_TARGET_LATENCY_SECONDS,
+                 window_seconds=DEFAULT_WINDOW_SECONDS, max_error_rate=DEFAULT_MAX_ERROR_RATE,
+                 decrease_factor=DEFAULT_DECREASE_FACTOR):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.min_batch_size = min_batch_size
+        self.min_concurrency = min_concurrency
+        self.batch_size_increment = batch_size_increment
+        self.target_latency_seconds = target_latency_seconds
+        self.window_seconds = window_seconds
+        self.max_error_rate = max_error_rate
+        self.decrease_factor = decrease_factor
+
+        self._lock = threading.Lock()
+        self._latest_batch_size_decrease_time = None
+        self._fast_batches = 0
+        self._window_start_time = None
+        self._window_items = 0
+        self._window_batches = 0
+        self._window_errors = 0
+        self._previous_throughput = None
+        self.logger = logging.getLogger('AimdController')
+
+    def on_batch_done(self, batch_size, started_at, latency_seconds, success, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._update_batch_size(started_at, latency_seconds, success, now)
+            self._update_window(batch_size, started_at, success, now)
+
+    def _update_batch_size(self, started_at, latency_seconds, success, now):
+        if success and latency_seconds <= self.target_latency_seconds:
+            self._fast_batches += 1
+            if self._fast_batches >= self.concurrency:
+                self.batch_size = min(self.batch_size + self.batch_size_increment, self.max_batch_size)
+                self._fast_batches = 0
+        elif self._latest_batch_size_decrease_time is None or started_at >= self._latest_batch_size_decrease_time:
+            new_batch_size = max(int(self.batch_size * self.decrease_factor), self.min_batch_size)
+            if new_batch_size != self.batch_size:
+                self.logger.info('Reducing batch size to {} after a batch {} in {:.1f} seconds.'.format(
+                    new_batch_size, 'succeeded' if success else 'failed', latency_seconds))
+                self.batch_size = new_batch_size
+            self._latest_batch_size_decrease_time = now
+            self._fast_batches = 0
+
+    def _update_window(self, batch_size, started_at, success, now):
+        if self._window_start_time is None:
+            self._window_start_time = started_at
+        self._window_batches += 1
+        if success:
+            self._window_items += batch_size
+        else:
+            self._window_errors += 1
+
+        elapsed = now - self._window_start_time
+        if elapsed < self.window_seconds:
+            return
+
+        throughput = self._window_items / elapsed
+        error_rate = self._window_errors / self._window_batches
+        previous_throughput = self._previous_throughput
+        if error_rate > self.max_error_rate:
+            self._decrease_concurrency('error rate {:.1%}'.format(error_rate))
+        elif previous_throughput is not None and throughput < previous_throughput * (1 - THROUGHPUT_TOLERANCE):
+            self._decrease_concurrency('throughput dropped from {:.1f} to {:.1f} items/s'.format(
+                previous_throughput, throughput))
+        elif self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+            self.logger.debug('Increasing concurrency to {} at {:.1f} items/s.'.format(self.concurrency, throughput))
+
+        self._previous_throughput = throughput
+        self._window_start_time = now
+        self._window_items = 0
+        self._window_batches = 0
+        self._window_errors = 0
+
+    def _decrease_concurrency(self, reason):
+        new_concurrency = max(int(self.concurrency * self.decrease_factor), self.min_concurrency)
+        if new_concurrency != self.concurrency:
+            self.logger.info('Reducing concurrency to {}, {}.'.format(new_concurrency, reason))
+            self.concurrency = new_concurrency
+
+
+# A semaphore whose limit can change while permits are held, used to cap the number of batches in flight.
+class AdjustableSemaphore:
+    def __init__(self, limit_getter):
+        self._limit_getter = limit_getter
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= self._limit_getter():
+                # The limit can grow without a release, so waiting is bounded
+                self._condition.wait(timeout=1)
+            self._in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
@@ -0,0 +1,167 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from blockchainetl.profiling import async_span, describe_batch
+from ethereumetl.enumeration.retry_strategy import RetryStrategy
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor, RETRY_EXCEPTIONS, \
+    get_rate_limited_backoff_seconds
+from ethereumetl.metrics import BATCH_RETRIES, get_stage_name
+from ethereumetl.misc.rate_limited_error import RateLimitedError
+from ethereumetl.utils import dynamic_batch_iterator
+
+ASYNC_RETRY_EXCEPTIONS = RETRY_EXCEPTIONS + (aiohttp.ClientError, asyncio.TimeoutError)
+
+
+# Executes coroutine work handlers in batches on a single event loop. Instead of max_workers threads
+# each blocking on one request, up to max_workers batches are kept in flight concurrently.
+# Batch size is adjusted and failed batches are retried the same way as in BatchWorkExecutor.
+class AsyncBatchWorkExecutor(BatchWorkExecutor):
+    def __init__(self, starting_batch_size, max_workers, retry_exceptions=ASYNC_RETRY_EXCEPTIONS, max_retries=5,
+                 max_rate_limited_retries=10, target_batch_bytes=None, retry_strategy=RetryStrategy.ITEM,
+                 adaptive=False, reorder_window=None):
+        super().__init__(starting_batch_size, max_workers, retry_exceptions=retry_exceptions,
+                         max_retries=max_retries, max_rate_limited_retries=max_rate_limited_retries,
+                         target_batch_bytes=target_batch_bytes, retry_strategy=retry_strategy, adaptive=adaptive,
+                         reorder_window=reorder_window)
+        self.loop = asyncio.new_event_loop()
+        self.logger = logging.getLogger('AsyncBatchWorkExecutor')
+
+    def _create_executor(self):
+        return None
+
+    def execute(self, work_iterable, work_handler, total_items=None, result_handler=None, item_name='items'):
+        self.stage = get_stage_name(work_handler)
+        self.progress_logger.name = self.stage
+        self.progress_logger.start(total_items=total_items, item_name=item_name)
+        reorder_buffer = self._create_reorder_buffer(result_handler)
+        self.run(self._execute(work_iterable, work_handler, reorder_buffer))
+
+    def run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    async def _execute(self, work_iterable, work_handler, reorder_buffer=None):
+        pending = set()
+        try:
+            for batch in dynamic_batch_iterator(work_iterable, lambda: self.batch_size):
+                # The oldest batch not handled yet is always in flight when the reorder buffer is full
+                while len(pending) >= self._get_concurrency() or \
+                        (reorder_buffer is not None and reorder_buffer.is_full()):
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    # Will throw an exception here if the batch failed
+                    for task in done:
+                        task.result()
+                if reorder_buffer is None:
+                    coroutine = self._fail_safe_execute(work_handler, batch)
+                else:
+                    coroutine = self._ordered_execute(reorder_buffer, reorder_buffer.reserve(), work_handler, batch)
+                pending.add(self.loop.create_task(coroutine))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        except BaseException:
+            # Fail fast: don't leave other batches running after one failed
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            raise
+
+    async def _fail_safe_execute(self, work_handler, batch):
+        with async_span(self.stage, **describe_batch(batch)):
+            started_at = time.monotonic()
+            try:
+                results = [await execute_with_rate_limited_retries_async(work_handler, batch,
+                                                                         max_retries=self.max_rate_limited_retries)]
+                self._on_batch_succeeded(len(batch), started_at)
+            except self.retry_exceptions:
+                self.logger.exception('An exception occurred while executing work_handler.')
+                self._on_batch_failed(len(batch), started_at)
+                BATCH_RETRIES.labels(self.stage).inc()
+                results = await self._retry_failed_batch_async(work_handler, batch)
+
+            self._track_batch(len(batch), started_at)
+            return results
+
+    async def _ordered_execute(self, reorder_buffer, sequence, work_handler, batch):
+        results = await self._fail_safe_execute(work_handler, batch)
+        reorder_buffer.complete(sequence, [item for result in results for item in result])
+
+    async def _retry_failed_batch_async(self, work_handler, batch):
+        results = []
+        if self.retry_strategy == RetryStrategy.BISECT and len(batch) > 1:
+            middle = len(batch) // 2
+            self.logger.info('The batch of size {} will be retried in halves.'.format(len(batch)))
+            for half in (batch[:middle], batch[middle:]):
+                try:
+                    results.append(await execute_with_rate_limited_retries_async(
+                        work_handler, half, max_retries=self.max_rate_limited_retries))
+                except self.retry_exceptions:
+                    self.logger.exception('An exception occurred while executing work_handler.')
+                    results.extend(await self._retry_failed_batch_async(work_handler, half))
+        else:
+            self.logger.info('The batch of size {} will be retried one item at a time.'.format(len(batch)))
+            for item in batch:
+                results.append(await execute_with_retries_async(work_handler, [item],
+                                                                max_retries=self.max_retries,
+                                                                retry_exceptions=self.retry_exceptions))
+        return results
+
+    def shutdown(self):
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.close()
+        self.progress_logger.finish()
+
+
+async def execute_with_retries_async(func, *args, max_retries=5, retry_exceptions=ASYNC_RETRY_EXCEPTIONS,
+                                     sleep_seconds=1):
+    for i in range(max_retries):
+        try:
+            return await func(*args)
+        except retry_exceptions as e:
+            logging.exception('An exception occurred while executing execute_with_retries_async. Retry #{}'.format(i))
+            if i < max_retries - 1:
+                retry_sleep_seconds = get_rate_limited_backoff_seconds(e, i) \
+                    if isinstance(e, RateLimitedError) else sleep_seconds
+                logging.info('The request will be retried after {} seconds. Retry #{}'.format(retry_sleep_seconds, i))
+                await asyncio.sleep(retry_sleep_seconds)
+                continue
+            else:
+                raise
+
+
+async def execute_with_rate_limited_retries_async(func, *args, max_retries=10):
+    for i in range(max_retries):
+        try:
+            return await func(*args)
+        except RateLimitedError as e:
+            if i == max_retries - 1:
+                raise
+            backoff_seconds = get_rate_limited_backoff_seconds(e, i)
+            logging.warning('Rate limited, the batch will be retried after {:.1f} seconds. Retry #{}'.format(
+                backoff_seconds, i))
+            await asyncio.sleep(backoff_seconds)
@@ -21,13 +21,21 @@
 # SOFTWARE.
 
 import logging
+import random
 import time
 
 from requests.exceptions import Timeout as RequestsTimeout, HTTPError, TooManyRedirects
 from web3._utils.threads import Timeout as Web3Timeout
 
+from blockchainetl.profiling import span, describe_batch
+from ethereumetl.enumeration.retry_strategy import RetryStrategy
+from ethereumetl.executors.aimd_controller import AdjustableSemaphore, AimdController
 from ethereumetl.executors.bounded_executor import BoundedExecutor
 from ethereumetl.executors.fail_safe_executor import FailSafeExecutor
+from ethereumetl.executors.reorder_buffer import ReorderBuffer
+from ethereumetl.metrics import BATCH_DURATION, BATCH_ITEMS, BATCH_RETRIES, BATCH_SIZE, REORDER_BUFFER_BATCHES, \
+    get_stage_name
+from ethereumetl.misc.rate_limited_error import RateLimitedError
 from ethereumetl.misc.retriable_value_error import RetriableValueError
 from ethereumetl.progress_logger import ProgressLogger
 from ethereumetl.utils import dynamic_batch_iterator
@@ -37,43 +45,180 @@ RETRY_EXCEPTIONS = (ConnectionError, HTTPError, RequestsTimeout, TooManyRedirect
 
 BATCH_CHANGE_COOLDOWN_PERIOD_SECONDS = 2 * 60
 
+MAX_RATE_LIMITED_BACKOFF_SECONDS = 30
+
+BYTES_PER_ITEM_SMOOTHING = 0.3
+
+# Adaptive batch size and concurrency go up to this many times the starting values
+ADAPTIVE_MAX_FACTOR = 8
+
+PROGRESS_LOG_INTERVAL_SECONDS = 60
+
 
 # Executes the given work in batches, reducing the batch size exponentially in case of errors.
+# Batches that are rate limited by the node are retried whole after a backoff, splitting them
+# into single item requests would only make more requests while the node is throttling.
+# With target_batch_bytes, batches are sized so that responses are about that many bytes, based on the bytes per item
+# of the previous responses reported with record_batch_bytes. starting_batch_size is then the maximum batch size.
+# Failed batches are retried one item at a time, or with RetryStrategy.BISECT split in halves recursively so that
+# a single bad item in a batch of n costs about 2 * log2(n) requests instead of n.
+# With adaptive=True, batch size and the number of batches in flight are adjusted by an AimdController from the
+# observed latency, throughput and errors, starting from starting_batch_size and max_workers.
+# With a result_handler passed to execute, work handlers return lists of results and result_handler gets the results
+# of every batch in submission order, through a ReorderBuffer of reorder_window batches (2 * max_workers by default).
 class BatchWorkExecutor:
-    def __init__(self, starting_batch_size, max_workers, retry_exceptions=RETRY_EXCEPTIONS, max_retries=5):
+    def __init__(self, starting_batch_size, max_workers, retry_exceptions=RETRY_EXCEPTIONS, max_retries=5,
+                 max_rate_limited_retries=10, target_batch_bytes=None, retry_strategy=RetryStrategy.ITEM,
+                 adaptive=False, reorder_window=None):
+        if adaptive and target_batch_bytes is not None:
+            raise ValueError('adaptive and target_batch_bytes can not be used together')
+        self.controller = AimdController(
+            batch_size=starting_batch_size, concurrency=max_workers,
+            max_batch_size=starting_batch_size * ADAPTIVE_MAX_FACTOR,
+            max_concurrency=max_workers * ADAPTIVE_MAX_FACTOR) if adaptive else None
+        self._in_flight_limiter = AdjustableSemaphore(self._get_concurrency) if adaptive else None
         self.batch_size = starting_batch_size
         self.max_batch_size = starting_batch_size
         self.latest_batch_size_change_time = None
-        self.max_workers = max_workers
-        # Using bounded executor prevents unlimited queue growth
-        # and allows monitoring in-progress futures and failing fast in case of errors.
-        self.executor = FailSafeExecutor(BoundedExecutor(1, self.max_workers))
+        self.target_batch_bytes = target_batch_bytes
+        self.max_target_batch_bytes = target_batch_bytes
+        self.bytes_per_item = None
+        self.max_workers = self.controller.max_concurrency if adaptive else max_workers
+        self.reorder_window = reorder_window if reorder_window is not None else 2 * self.max_workers
+        self.executor = self._create_executor()
         self.retry_exceptions = retry_exceptions
         self.max_retries = max_retries
-        self.progress_logger = ProgressLogger()
+        self.max_rate_limited_retries = max_rate_limited_retries
+        if retry_strategy not in RetryStrategy.ALL:
+            raise ValueError('Unknown retry strategy {}, supported strategies are {}'.format(
+                retry_strategy, ', '.join(RetryStrategy.ALL)))
+        self.retry_strategy = retry_strategy
+        self.progress_logger = ProgressLogger(log_interval_seconds=PROGRESS_LOG_INTERVAL_SECONDS)
+        self.stage = None
         self.logger = logging.getLogger('BatchWorkExecutor')
 
-    def execute(self, work_iterable, work_handler, total_items=None):
-        self.progress_logger.start(total_items=total_items)
+    def execute(self, work_iterable, work_handler, total_items=None, result_handler=None, item_name='items'):
+        self.stage = get_stage_name(work_handler)
+        self.progress_logger.name = self.stage
+        self.progress_logger.start(total_items=total_items, item_name=item_name)
+        reorder_buffer = self._create_reorder_buffer(result_handler)
         for batch in dynamic_batch_iterator(work_iterable, lambda: self.batch_size):
-            self.executor.submit(self._fail_safe_execute, work_handler, batch)
+            if reorder_buffer is None:
+                args = (self._fail_safe_execute, work_handler, batch)
+            else:
+                args = (self._ordered_execute, reorder_buffer, reorder_buffer.reserve(), work_handler, batch)
+            if self._in_flight_limiter is None:
+                self.executor.submit(*args)
+            else:
+                self._in_flight_limiter.acquire()
+                future = self.executor.submit(*args)
+                future.add_done_callback(lambda _: self._in_flight_limiter.release())
+
+    def _create_executor(self):
+        # Using bounded executor prevents unlimited queue growth
+        # and allows monitoring in-progress futures and failing fast in case of errors.
+        return FailSafeExecutor(BoundedExecutor(1, self.max_workers))
 
+    # Returns the results of work_handler for the batch, or for the parts of the batch if it was retried in parts
     def _fail_safe_execute(self, work_handler, batch):
+        with span(self.stage, **describe_batch(batch)):
+            started_at = time.monotonic()
+            try:
+                results = [execute_with_rate_limited_retries(
+                    work_handler, batch, max_retries=self.max_rate_limited_retries)]
+                self._on_batch_succeeded(len(batch), started_at)
+            except self.retry_exceptions:
+                self.logger.exception('An exception occurred while executing work_handler.')
+                self._on_batch_failed(len(batch), started_at)
+                BATCH_RETRIES.labels(self.stage).inc()
+                results = self._retry_failed_batch(work_handler, batch)
+
+            self._track_batch(len(batch), started_at)
+            return results
+
+    def _track_batch(self, batch_size, started_at):
+        self.progress_logger.track(batch_size)
+        BATCH_ITEMS.labels(self.stage).inc(batch_size)
+        BATCH_DURATION.labels(self.stage).observe(time.monotonic() - started_at)
+        BATCH_SIZE.labels(self.stage).set(self.batch_size)
+
+    def _create_reorder_buffer(self, result_handler):
+        if result_handler is None:
+            return None
+        return ReorderBuffer(result_handler, self.reorder_window,
+                             held_batches_gauge=REORDER_BUFFER_BATCHES.labels(self.stage))
+
+    def _ordered_execute(self, reorder_buffer, sequence, work_handler, batch):
         try:
-            work_handler(batch)
-            self._try_increase_batch_size(len(batch))
-        except self.retry_exceptions:
-            self.logger.exception('An exception occurred while executing work_handler.')
-            self._try_decrease_batch_size(len(batch))
+            results = self._fail_safe_execute(work_handler, batch)
+        except BaseException as e:
+            reorder_buffer.fail(e)
+            raise
+        reorder_buffer.complete(sequence, [item for result in results for item in result])
+
+    def _retry_failed_batch(self, work_handler, batch):
+        results = []
+        if self.retry_strategy == RetryStrategy.BISECT and len(batch) > 1:
+            middle = len(batch) // 2
+            self.logger.info('The batch of size {} will be retried in halves.'.format(len(batch)))
+            for half in (batch[:middle], batch[middle:]):
+                try:
+                    results.append(execute_with_rate_limited_retries(
+                        work_handler, half, max_retries=self.max_rate_limited_retries))
+                except self.retry_exceptions:
+                    self.logger.exception('An exception occurred while executing work_handler.')
+                    results.extend(self._retry_failed_batch(work_handler, half))
+        else:
             self.logger.info('The batch of size {} will be retried one item at a time.'.format(len(batch)))
             for item in batch:
-                execute_with_retries(work_handler, [item],
-                                     max_retries=self.max_retries, retry_exceptions=self.retry_exceptions)
+                results.append(execute_with_retries(work_handler, [item],
+                                                    max_retries=self.max_retries,
+                                                    retry_exceptions=self.retry_exceptions))
+        return results
+
+    def _get_concurrency(self):
+        return self.controller.concurrency if self.controller is not None else self.max_workers
+
+    def _on_batch_succeeded(self, batch_size, started_at):
+        if self.controller is not None:
+            self._record_batch(batch_size, started_at, True)
+        else:
+            self._try_increase_batch_size(batch_size)
+
+    def _on_batch_failed(self, batch_size, started_at):
+        if self.controller is not None:
+            self._record_batch(batch_size, started_at, False)
+        else:
+            self._try_decrease_batch_size(batch_size)
+
+    def _record_batch(self, batch_size, started_at, success):
+        now = time.monotonic()
+        self.controller.on_batch_done(batch_size, started_at, now - started_at, success, now=now)
+        self.batch_size = self.controller.batch_size
 
-        self.progress_logger.track(len(batch))
+    # Called by work handlers with the response size of a batch of batch_size items
+    def record_batch_bytes(self, batch_size, size_bytes):
+        if self.target_batch_bytes is None or size_bytes is None or batch_size == 0:
+            return
+        observed_bytes_per_item = size_bytes / batch_size
+        bytes_per_item = self.bytes_per_item
+        self.bytes_per_item = observed_bytes_per_item if bytes_per_item is None \
+            else (1 - BYTES_PER_ITEM_SMOOTHING) * bytes_per_item + BYTES_PER_ITEM_SMOOTHING * observed_bytes_per_item
+        self._update_batch_size_from_bytes()
+
+    def _update_batch_size_from_bytes(self):
+        if self.bytes_per_item is None:
+            return
+        new_batch_size = max(1, min(int(self.target_batch_bytes / max(self.bytes_per_item, 1)), self.max_batch_size))
+        if new_batch_size != self.batch_size:
+            self.logger.debug('Setting batch size to {} for {:.0f} bytes per item.'.format(
+                new_batch_size, self.bytes_per_item))
+            self.batch_size = new_batch_size
 
     # Some acceptable race conditions are possible
     def _try_decrease_batch_size(self, current_batch_size):
+        if self.target_batch_bytes is not None:
+            self._try_decrease_target_batch_bytes()
         batch_size = self.batch_size
         if batch_size == current_batch_size and batch_size > 1:
             new_batch_size = int(current_batch_size / 2)
@@ -81,7 +226,19 @@ class BatchWorkExecutor:
             self.batch_size = new_batch_size
             self.latest_batch_size_change_time = time.time()
 
+    def _try_decrease_target_batch_bytes(self):
+        latest_batch_size_change_time = self.latest_batch_size_change_time
+        # Batches in flight when the target was decreased may fail too, they don't decrease it further
+        if latest_batch_size_change_time is None or \
+                time.time() - latest_batch_size_change_time > BATCH_CHANGE_COOLDOWN_PERIOD_SECONDS / 10:
+            self.target_batch_bytes = max(int(self.target_batch_bytes / 2), 1)
+            self.logger.info('Reducing target batch bytes to {}.'.format(self.target_batch_bytes))
+            self.latest_batch_size_change_time = time.time()
+
     def _try_increase_batch_size(self, current_batch_size):
+        if self.target_batch_bytes is not None:
+            self._try_increase_target_batch_bytes()
+            return
         if current_batch_size * 2 <= self.max_batch_size:
             current_time = time.time()
             latest_batch_size_change_time = self.latest_batch_size_change_time
@@ -93,6 +250,18 @@ class BatchWorkExecutor:
                 self.batch_size = new_batch_size
                 self.latest_batch_size_change_time = current_time
 
+    def _try_increase_target_batch_bytes(self):
+        if self.target_batch_bytes * 2 <= self.max_target_batch_bytes:
+            current_time = time.time()
+            latest_batch_size_change_time = self.latest_batch_size_change_time
+            seconds_since_last_change = current_time - latest_batch_size_change_time \
+                if latest_batch_size_change_time is not None else 0
+            if seconds_since_last_change > BATCH_CHANGE_COOLDOWN_PERIOD_SECONDS:
+                self.target_batch_bytes = self.target_batch_bytes * 2
+                self.logger.info('Increasing target batch bytes to {}.'.format(self.target_batch_bytes))
+                self.latest_batch_size_change_time = current_time
+                self._update_batch_size_from_bytes()
+
     def shutdown(self):
         self.executor.shutdown()
         self.progress_logger.finish()
@@ -102,11 +271,34 @@ def execute_with_retries(func, *args, max_retries=5, retry_exceptions=RETRY_EXCE
     for i in range(max_retries):
         try:
             return func(*args)
-        except retry_exceptions:
+        except retry_exceptions as e:
             logging.exception('An exception occurred while executing execute_with_retries. Retry #{}'.format(i))
             if i < max_retries - 1:
-                logging.info('The request will be retried after {} seconds. Retry #{}'.format(sleep_seconds, i))
-                time.sleep(sleep_seconds)
+                retry_sleep_seconds = get_rate_limited_backoff_seconds(e, i) \
+                    if isinstance(e, RateLimitedError) else sleep_seconds
+                logging.info('The request will be retried after {} seconds. Retry #{}'.format(retry_sleep_seconds, i))
+                time.sleep(retry_sleep_seconds)
                 continue
             else:
                 raise
+
+
+def execute_with_rate_limited_retries(func, *args, max_retries=10):
+    for i in range(max_retries):
+        try:
+            return func(*args)
+        except RateLimitedError as e:
+            if i == max_retries - 1:
+                raise
+            backoff_seconds = get_rate_limited_backoff_seconds(e, i)
+            logging.warning('Rate limited, the batch will be retried after {:.1f} seconds. Retry #{}'.format(
+                backoff_seconds, i))
+            time.sleep(backoff_seconds)
+
+
+def get_rate_limited_backoff_seconds(rate_limited_error, attempt):
+    if rate_limited_error.retry_after is not None:
+        # A misconfigured or hostile Retry-After header must not stall the export
+        return min(rate_limited_error.retry_after, MAX_RATE_LIMITED_BACKOFF_SECONDS)
+    # Jitter spreads the retries of concurrent workers
+    return min(2 ** attempt, MAX_RATE_LIMITED_BACKOFF_SECONDS) * random.uniform(0.5, 1.5)
@@ -0,0 +1,70 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+# Runs a DAG of named tasks on a shared pool of max_workers threads. A task starts as soon as all the tasks it depends
+# on are done and gets their results as arguments, in the order of its dependencies. Dependencies must be added
+# before the tasks that depend on them, which also rules out cycles. After the first failure no more tasks are
+# started, and the failure is raised from run() once the running tasks are done.
+class DagScheduler:
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._tasks = {}
+
+    def add_task(self, name, func, dependencies=()):
+        if name in self._tasks:
+            raise ValueError('Task {} is already added'.format(name))
+        for dependency in dependencies:
+            if dependency not in self._tasks:
+                raise ValueError('Task {} depends on {} which is not added yet'.format(name, dependency))
+        self._tasks[name] = (func, tuple(dependencies))
+
+    def run(self):
+        """Runs all the tasks and returns a dict of their results by name."""
+        results = {}
+        pending = dict(self._tasks)
+        running = {}
+        failure = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                if failure is None:
+                    for name, (func, dependencies) in list(pending.items()):
+                        if all(dependency in results for dependency in dependencies):
+                            del pending[name]
+                            args = [results[dependency] for dependency in dependencies]
+                            running[executor.submit(func, *args)] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        if failure is None:
+                            failure = e
+        if failure is not None:
+            raise failure
+        return results
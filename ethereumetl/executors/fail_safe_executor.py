@@ -20,29 +20,45 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import threading
 
+
+# Fail safe in this case means fail fast. The first exception raised by a submitted function cancels the work that
+# hasn't started yet and is raised from the next call to submit() or shutdown(). Failures are picked up by done
+# callbacks, so submit() doesn't scan the futures in flight.
 class FailSafeExecutor:
 
     def __init__(self, delegate):
         self._delegate = delegate
-        self._futures = []
+        self._futures = set()
+        self._failure = None
+        self._lock = threading.Lock()
 
     def submit(self, fn, *args, **kwargs):
-        self._check_completed_futures()
+        self._raise_if_failed()
         future = self._delegate.submit(fn, *args, **kwargs)
-        self._futures.append(future)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._on_future_done)
 
         return future
 
     def shutdown(self):
         self._delegate.shutdown(wait=True)
-        self._check_completed_futures()
+        self._raise_if_failed()
         assert len(self._futures) == 0
 
-    def _check_completed_futures(self):
-        """Fail safe in this case means fail fast. TODO: Add retry logic"""
-        for future in self._futures.copy():
-            if future.done():
-                # Will throw an exception here if the future failed
-                future.result()
-                self._futures.remove(future)
+    def _on_future_done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+            if future.cancelled() or future.exception() is None or self._failure is not None:
+                return
+            self._failure = future.exception()
+            pending_futures = list(self._futures)
+        # Cancelling runs the done callbacks of the cancelled futures, so it has to happen outside of the lock
+        for pending_future in pending_futures:
+            pending_future.cancel()
+
+    def _raise_if_failed(self):
+        if self._failure is not None:
+            raise self._failure
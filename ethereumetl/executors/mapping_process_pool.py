@@ -0,0 +1,87 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from blockchainetl import json_codec
+
+
+# Runs CPU bound mapping and serialization in worker processes, so that it isn't limited by the GIL of the threads
+# doing I/O. Functions and arguments sent to the pool must be picklable, i.e. module level functions.
+# Worker processes are started from a fork server where available, otherwise spawned. Forking the exporting process
+# directly is not safe: the metrics server, profiler, health check and scheduler threads may hold locks in the parent
+# that are never released in the child, and worker processes don't inherit the JSON item format, so it's passed on.
+class MappingProcessPool:
+    def __init__(self, max_processes):
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._executor = ProcessPoolExecutor(max_workers=max_processes,
+                                             mp_context=multiprocessing.get_context(start_method),
+                                             initializer=json_codec.set_compact_items,
+                                             initargs=(json_codec.is_compact_items(),))
+        # Starts the worker processes
+        self._executor.submit(int).result()
+
+    def map(self, fn, *args):
+        return self._executor.submit(fn, *args).result()
+
+    async def map_async(self, fn, *args):
+        return await asyncio.wrap_future(self._executor.submit(fn, *args))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def make_raw_batch_request(batch_web3_provider, text):
+    # Providers that only return decoded responses, e.g. over IPC or with a cache, are sent the decoded response
+    make_request = getattr(batch_web3_provider, 'make_raw_batch_request', None) or \
+        batch_web3_provider.make_batch_request
+    return make_request(text)
+
+
+async def make_raw_batch_request_async(batch_web3_provider, text):
+    make_request = getattr(batch_web3_provider, 'make_raw_batch_request', None) or \
+        batch_web3_provider.make_batch_request
+    return await make_request(text)
+
+
+def get_raw_response_size_bytes(response):
+    return len(response) if isinstance(response, bytes) else getattr(response, 'size_bytes', None)
+
+
+def decode_raw_response(response):
+    return json_codec.loads(response) if isinstance(response, bytes) else response
+
+
+# Items mapped in a worker process are serialized there too when the exporter supports it
+def serialize_mapped_items(items, item_serializer):
+    return item_serializer.serialize_items(items) if item_serializer is not None else items
+
+
+def export_mapped_items(item_exporter, mapped_items):
+    if isinstance(mapped_items, dict):
+        item_exporter.export_serialized_items(mapped_items)
+    else:
+        for item in mapped_items:
+            item_exporter.export_item(item)
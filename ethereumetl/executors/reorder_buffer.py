@@ -0,0 +1,76 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import threading
+
+
+# Passes the results of batches to result_handler in the order the batches were submitted, whatever order they
+# complete in. At most window batches can be reserved and not yet handled, so reserve() blocks when a slow batch
+# holds back window - 1 completed ones. Memory is then bounded by the window rather than by the whole work.
+# The number of completed batches held back is reported to held_batches_gauge if given.
+class ReorderBuffer:
+    def __init__(self, result_handler, window, held_batches_gauge=None):
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.result_handler = result_handler
+        self.window = window
+        self.held_batches_gauge = held_batches_gauge
+        self._next_sequence = 0
+        self._next_sequence_to_handle = 0
+        self._completed = {}
+        self._failure = None
+        self._condition = threading.Condition()
+
+    def is_full(self):
+        return self._next_sequence - self._next_sequence_to_handle >= self.window
+
+    def reserve(self):
+        """Returns the sequence number of the next batch, waiting for a free slot in the window."""
+        with self._condition:
+            while self.is_full() and self._failure is None:
+                self._condition.wait()
+            if self._failure is not None:
+                raise self._failure
+            sequence = self._next_sequence
+            self._next_sequence += 1
+            return sequence
+
+    def complete(self, sequence, result):
+        with self._condition:
+            self._completed[sequence] = result
+            try:
+                while self._next_sequence_to_handle in self._completed:
+                    self.result_handler(self._completed.pop(self._next_sequence_to_handle))
+                    self._next_sequence_to_handle += 1
+            except BaseException as e:
+                self._failure = e
+                raise
+            finally:
+                if self.held_batches_gauge is not None:
+                    self.held_batches_gauge.set(len(self._completed))
+                self._condition.notify_all()
+
+    def fail(self, exception):
+        with self._condition:
+            self._failure = exception
+            self._condition.notify_all()
@@ -0,0 +1,74 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import time
+
+import click
+
+from ethereumetl.fake_node.chain import SyntheticChain
+from ethereumetl.fake_node.server import FakeNode, FakeNodeServer
+
+
+@click.command(context_settings=dict(help_option_names=['-h', '--help']))
+@click.option('--host', default='127.0.0.1', show_default=True, type=str, help='The host to serve HTTP on.')
+@click.option('--port', default=8545, show_default=True, type=int, help='The port to serve HTTP on.')
+@click.option('--ipc-path', default=None, show_default=True, type=str, help='The unix socket to serve IPC on.')
+@click.option('--height', default=1000000, show_default=True, type=int, help='The chain height.')
+@click.option('--transactions-per-block', default=100, show_default=True, type=int,
+              help='The average number of transactions per block.')
+@click.option('--logs-per-transaction', default=2, show_default=True, type=int,
+              help='The average number of logs per transaction.')
+@click.option('--blocks-per-second', default=None, show_default=True, type=float,
+              help='Grow the chain from --height at this rate, for streaming.')
+@click.option('--recorded-dir', default=None, show_default=True, type=str,
+              help='A directory with recorded responses named like the test resources.')
+@click.option('--latency-ms', default=0, show_default=True, type=float, help='The latency added to every request.')
+@click.option('--latency-jitter-ms', default=0, show_default=True, type=float,
+              help='The maximum random latency added on top of --latency-ms.')
+@click.option('--error-rate', default=0, show_default=True, type=float,
+              help='The share of JSON-RPC requests answered with an error.')
+@click.option('--rate-limit-rate', default=0, show_default=True, type=float,
+              help='The share of HTTP requests answered with 429.')
+@click.option('--http-error-rate', default=0, show_default=True, type=float,
+              help='The share of HTTP requests answered with 500.')
+@click.option('--seed', default=0, show_default=True, type=int, help='The seed for the chain and injected failures.')
+def fake_node(host, port, ipc_path, height, transactions_per_block, logs_per_transaction, blocks_per_second,
+              recorded_dir, latency_ms, latency_jitter_ms, error_rate, rate_limit_rate, http_error_rate, seed):
+    """Serves a deterministic synthetic chain over JSON-RPC for benchmarks."""
+    chain = SyntheticChain(height=height, transactions_per_block=transactions_per_block,
+                           logs_per_transaction=logs_per_transaction, seed=seed,
+                           blocks_per_second=blocks_per_second)
+    node = FakeNode(chain, recorded_dir=recorded_dir, latency_ms=latency_ms, latency_jitter_ms=latency_jitter_ms,
+                    error_rate=error_rate, rate_limit_rate=rate_limit_rate, http_error_rate=http_error_rate,
+                    seed=seed)
+    server = FakeNodeServer(node, host=host, port=port, ipc_path=ipc_path).start()
+    click.echo('Serving on {}'.format(server.uri) + (' and {}'.format(server.ipc_uri) if ipc_path else ''))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    fake_node()
@@ -0,0 +1,302 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import functools
+import hashlib
+import random
+import time
+
+from ethereumetl.service.token_transfer_extractor import TRANSFER_EVENT_TOPIC
+
+ZERO_HASH = '0x' + '00' * 32
+EMPTY_BLOOM = '0x' + '00' * 256
+GENESIS_TIMESTAMP = 1438269973
+SECONDS_PER_BLOCK = 12
+
+ERC20_SIGHASHES = ['18160ddd', '70a08231', 'a9059cbb', '23b872dd', '095ea7b3', 'dd62ed3e',
+                   '06fdde03', '95d89b41', '313ce567']
+# PUSH4 of every ERC20 function sighash followed by STOP, enough for contracts to be detected as ERC20 tokens
+ERC20_BYTECODE = '0x' + ''.join('63' + sighash for sighash in ERC20_SIGHASHES) + '00'
+
+
+def hash_hex(*parts, length=32):
+    digest = hashlib.sha256(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return digest[:length * 2]
+
+
+def address_from_int(value):
+    return '0x' + hash_hex('address', value, length=20)
+
+
+# Deterministic synthetic chain. Every block, transaction, receipt, log and trace is derived from the seed and its
+# position, so any block can be served in any order without storing the chain. Transaction hashes encode the
+# block number and the transaction index so receipts can be looked up by hash.
+# With blocks_per_second set the head grows from height over time, for streaming. reorg replaces the latest blocks
+# with blocks with other hashes, for testing reorg handling.
+class SyntheticChain:
+    def __init__(self, height=1000000, transactions_per_block=100, logs_per_transaction=2,
+                 contract_creation_rate=0.01, seed=0, blocks_per_second=None):
+        self.height = height
+        self.transactions_per_block = transactions_per_block
+        self.logs_per_transaction = logs_per_transaction
+        self.contract_creation_rate = contract_creation_rate
+        self.seed = seed
+        self.blocks_per_second = blocks_per_second
+        self._started_at = time.time()
+        self._fork_blocks = []
+
+    def head(self):
+        if self.blocks_per_second is None:
+            return self.height
+        return self.height + int((time.time() - self._started_at) * self.blocks_per_second)
+
+    def reorg(self, depth):
+        self._fork_blocks.append(self.head() - depth + 1)
+
+    def block_hash(self, number):
+        if number < 0:
+            return ZERO_HASH
+        forks = sum(1 for fork_block in self._fork_blocks if fork_block <= number)
+        if forks == 0:
+            return '0x' + hash_hex('block', self.seed, number)
+        return '0x' + hash_hex('block', self.seed, number, 'fork', forks)
+
+    def transaction_hash(self, number, index):
+        return '0x{:012x}{:06x}{}'.format(number, index, hash_hex('tx', self.seed, number, index, length=23))
+
+    def get_block(self, number, full_transactions):
+        if number < 0 or number > self.head():
+            return None
+        transaction_count = self._transaction_count(number)
+        transactions = [self._transaction(number, index) if full_transactions
+                        else self.transaction_hash(number, index) for index in range(transaction_count)]
+        return {
+            'number': hex(number),
+            'hash': self.block_hash(number),
+            'parentHash': self.block_hash(number - 1),
+            'nonce': '0x0000000000000000',
+            'sha3Uncles': '0x' + hash_hex('uncles', self.seed, number),
+            'logsBloom': EMPTY_BLOOM,
+            'transactionsRoot': '0x' + hash_hex('transactions', self.seed, number),
+            'stateRoot': '0x' + hash_hex('state', self.seed, number),
+            'receiptsRoot': '0x' + hash_hex('receipts', self.seed, number),
+            'miner': address_from_int(number % 100),
+            'difficulty': '0x0',
+            'totalDifficulty': hex(58750003716598352816469),
+            'size': hex(600 + 150 * transaction_count),
+            'extraData': '0x',
+            'gasLimit': hex(30000000),
+            'gasUsed': hex(21000 * transaction_count),
+            'timestamp': hex(GENESIS_TIMESTAMP + SECONDS_PER_BLOCK * number),
+            'baseFeePerGas': hex(10 ** 9 + number % 1000),
+            'transactions': transactions,
+            'uncles': [],
+            'withdrawals': [],
+            'withdrawalsRoot': '0x' + hash_hex('withdrawals', self.seed, number),
+        }
+
+    def get_transaction_receipt(self, transaction_hash):
+        number, index = self._parse_transaction_hash(transaction_hash)
+        if number is None or number > self.head() or index >= self._transaction_count(number):
+            return None
+        transaction = self._transaction(number, index)
+        log_index = self._log_offsets(number)[index]
+        logs = [self._log(number, index, log_index + i) for i in range(self._log_count(number, index))]
+        return {
+            'transactionHash': transaction['hash'],
+            'transactionIndex': hex(index),
+            'blockHash': transaction['blockHash'],
+            'blockNumber': transaction['blockNumber'],
+            'from': transaction['from'],
+            'to': transaction['to'],
+            'cumulativeGasUsed': hex(21000 * (index + 1)),
+            'gasUsed': hex(21000),
+            'effectiveGasPrice': transaction['gasPrice'],
+            'contractAddress': self._created_contract_address(number, index) if transaction['to'] is None else None,
+            'logs': logs,
+            'logsBloom': EMPTY_BLOOM,
+            'status': '0x1',
+            'type': transaction['type'],
+        }
+
+    def get_logs(self, from_block, to_block, addresses=None, topics=None):
+        logs = []
+        for number in range(max(from_block, 0), min(to_block, self.head()) + 1):
+            for index in range(self._transaction_count(number)):
+                log_index = self._log_offsets(number)[index]
+                for i in range(self._log_count(number, index)):
+                    log = self._log(number, index, log_index + i)
+                    if addresses and log['address'] not in addresses:
+                        continue
+                    if topics and topics[0] and log['topics'][0] not in (
+                            topics[0] if isinstance(topics[0], list) else [topics[0]]):
+                        continue
+                    logs.append(log)
+        return logs
+
+    def trace_block(self, number):
+        if number < 0 or number > self.head():
+            return None
+        traces = []
+        for index in range(self._transaction_count(number)):
+            transaction = self._transaction(number, index)
+            trace = {
+                'blockHash': transaction['blockHash'],
+                'blockNumber': number,
+                'subtraces': 0,
+                'traceAddress': [],
+                'transactionHash': transaction['hash'],
+                'transactionPosition': index,
+            }
+            if transaction['to'] is None:
+                trace['type'] = 'create'
+                trace['action'] = {'from': transaction['from'], 'gas': transaction['gas'],
+                                   'init': transaction['input'], 'value': transaction['value']}
+                trace['result'] = {'address': self._created_contract_address(number, index),
+                                   'code': ERC20_BYTECODE, 'gasUsed': hex(21000)}
+            else:
+                trace['type'] = 'call'
+                trace['action'] = {'callType': 'call', 'from': transaction['from'], 'to': transaction['to'],
+                                   'gas': transaction['gas'], 'input': transaction['input'],
+                                   'value': transaction['value']}
+                trace['result'] = {'gasUsed': hex(21000), 'output': '0x'}
+            traces.append(trace)
+        traces.append({
+            'action': {'author': address_from_int(number % 100), 'rewardType': 'block', 'value': hex(2 * 10 ** 18)},
+            'blockHash': self.block_hash(number),
+            'blockNumber': number,
+            'result': None,
+            'subtraces': 0,
+            'traceAddress': [],
+            'type': 'reward',
+        })
+        return traces
+
+    def debug_trace_block(self, number):
+        if number < 0 or number > self.head():
+            return None
+        transaction_traces = []
+        for index in range(self._transaction_count(number)):
+            transaction = self._transaction(number, index)
+            is_create = transaction['to'] is None
+            transaction_traces.append({'result': {
+                'type': 'CREATE' if is_create else 'CALL',
+                'from': transaction['from'],
+                'to': self._created_contract_address(number, index) if is_create else transaction['to'],
+                'value': transaction['value'],
+                'gas': transaction['gas'],
+                'gasUsed': hex(21000),
+                'input': transaction['input'],
+                'output': ERC20_BYTECODE if is_create else '0x',
+            }})
+        return transaction_traces
+
+    def get_code(self, address):
+        return ERC20_BYTECODE
+
+    def call(self, data):
+        sighash = data[2:10] if data is not None else None
+        if sighash == '06fdde03':
+            return encode_abi_string('Synthetic Token')
+        if sighash == '95d89b41':
+            return encode_abi_string('SYN')
+        if sighash == '313ce567':
+            return encode_abi_uint(18)
+        if sighash == '18160ddd':
+            return encode_abi_uint(10 ** 27)
+        return '0x'
+
+    def _transaction_count(self, number):
+        return random.Random(hash_hex('count', self.seed, number)).randint(0, 2 * self.transactions_per_block)
+
+    def _log_count(self, number, index):
+        return random.Random(hash_hex('logs', self.seed, number, index)).randint(0, 2 * self.logs_per_transaction)
+
+    @functools.lru_cache(maxsize=1024)
+    def _log_offsets(self, number):
+        offsets = []
+        log_index = 0
+        for index in range(self._transaction_count(number)):
+            offsets.append(log_index)
+            log_index += self._log_count(number, index)
+        return offsets
+
+    def _transaction(self, number, index):
+        rng = random.Random(hash_hex('tx', self.seed, number, index))
+        is_create = rng.random() < self.contract_creation_rate
+        return {
+            'hash': self.transaction_hash(number, index),
+            'nonce': hex(rng.randint(0, 10000)),
+            'blockHash': self.block_hash(number),
+            'blockNumber': hex(number),
+            'transactionIndex': hex(index),
+            'from': address_from_int(rng.randint(0, 100000)),
+            'to': None if is_create else address_from_int(rng.randint(0, 100000)),
+            'value': hex(rng.randint(0, 10 ** 20)),
+            'gas': hex(100000),
+            'gasPrice': hex(2 * 10 ** 9),
+            'maxFeePerGas': hex(3 * 10 ** 9),
+            'maxPriorityFeePerGas': hex(10 ** 9),
+            'input': '0x' + hash_hex('input', self.seed, number, index, length=rng.randint(0, 4) * 32)
+            if not is_create else ERC20_BYTECODE,
+            'type': '0x2',
+            'chainId': '0x1',
+            'v': '0x1',
+            'r': '0x' + hash_hex('r', self.seed, number, index),
+            's': '0x' + hash_hex('s', self.seed, number, index),
+        }
+
+    def _log(self, number, transaction_index, log_index):
+        rng = random.Random(hash_hex('log', self.seed, number, log_index))
+        return {
+            'address': address_from_int(rng.randint(0, 1000)),
+            'topics': [TRANSFER_EVENT_TOPIC,
+                       '0x' + '00' * 12 + address_from_int(rng.randint(0, 100000))[2:],
+                       '0x' + '00' * 12 + address_from_int(rng.randint(0, 100000))[2:]],
+            'data': encode_abi_uint(rng.randint(0, 10 ** 24)),
+            'blockNumber': hex(number),
+            'blockHash': self.block_hash(number),
+            'transactionHash': self.transaction_hash(number, transaction_index),
+            'transactionIndex': hex(transaction_index),
+            'logIndex': hex(log_index),
+            'removed': False,
+        }
+
+    def _created_contract_address(self, number, index):
+        return '0x' + hash_hex('contract', self.seed, number, index, length=20)
+
+    @staticmethod
+    def _parse_transaction_hash(transaction_hash):
+        if not isinstance(transaction_hash, str) or len(transaction_hash) != 66:
+            return None, None
+        return int(transaction_hash[2:14], 16), int(transaction_hash[14:20], 16)
+
+
+def encode_abi_uint(value):
+    return '0x' + '{:064x}'.format(value)
+
+
+def encode_abi_string(value):
+    data = value.encode('utf-8').hex()
+    padded_length = (len(data) + 63) // 64 * 64
+    return '0x' + '{:064x}'.format(32) + '{:064x}'.format(len(value.encode('utf-8'))) + data.ljust(padded_length, '0')
@@ -0,0 +1,322 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import itertools
+import logging
+import os
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import JSONDecodeError, JSONDecoder
+
+from blockchainetl import json_codec
+from ethereumetl.fake_node.chain import SyntheticChain
+
+INJECTED_ERROR_CODE = -32000
+RATE_LIMITED_ERROR_CODE = -32005
+READ_CHUNK_SIZE = 1024 * 1024
+
+FINALITY_TAGS = ('latest', 'pending', 'safe', 'finalized')
+
+
+# Answers JSON-RPC requests from a SyntheticChain, or from recorded responses when recorded_dir is set. Recorded
+# responses use the file names of the test resources (web3_response.<method>_<params>.json); requests without a
+# recording fall back to the synthetic chain.
+# latency_ms (plus up to latency_jitter_ms) is added to every HTTP request or IPC message, error_rate is the share
+# of requests answered with a JSON-RPC error, rate_limit_rate the share answered with HTTP 429 (a -32005 error
+# over IPC) and http_error_rate the share answered with HTTP 500. Injected failures are drawn from a seeded random
+# generator, so a run with the same requests sees the same failures.
+class FakeNode:
+    def __init__(self, chain=None, recorded_dir=None, latency_ms=0, latency_jitter_ms=0, error_rate=0,
+                 rate_limit_rate=0, http_error_rate=0, seed=0):
+        self.chain = chain if chain is not None else SyntheticChain(seed=seed)
+        self.recorded_dir = recorded_dir
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.http_error_rate = http_error_rate
+        self.request_count = 0
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._filters = {}
+        self._filter_ids = itertools.count(1)
+
+    def handle(self, body):
+        """Returns an HTTP status code and the response body for a JSON-RPC request body."""
+        self._sleep()
+        with self._random_lock:
+            status_draw = self._random.random()
+        if status_draw < self.http_error_rate:
+            return 500, b'Injected server error'
+        if status_draw < self.http_error_rate + self.rate_limit_rate:
+            return 429, b'Too many requests'
+
+        try:
+            request = json_codec.loads(body)
+        except (JSONDecodeError, ValueError):
+            return 200, json_codec.dumps_bytes(error_response(None, -32700, 'Parse error'))
+        return 200, json_codec.dumps_bytes(self.handle_request(request))
+
+    def handle_request(self, request):
+        if isinstance(request, list):
+            return [self._handle_request_item(request_item) for request_item in request]
+        return self._handle_request_item(request)
+
+    def _handle_request_item(self, request_item):
+        request_id = request_item.get('id')
+        method = request_item.get('method')
+        params = request_item.get('params') or []
+        with self._random_lock:
+            self.request_count += 1
+            error_draw = self._random.random()
+        if error_draw < self.error_rate:
+            return error_response(request_id, INJECTED_ERROR_CODE, 'Injected error')
+
+        recorded_result = self._read_recorded_result(method, params)
+        if recorded_result is not None:
+            return {'jsonrpc': '2.0', 'id': request_id, 'result': recorded_result}
+
+        handler = getattr(self, '_' + method, None) if isinstance(method, str) else None
+        if handler is None:
+            return error_response(request_id, -32601, 'The method {} does not exist/is not available'.format(method))
+        try:
+            result = handler(*params)
+        except (TypeError, ValueError) as e:
+            return error_response(request_id, -32602, 'Invalid params: {}'.format(e))
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    def _sleep(self):
+        if self.latency_ms <= 0 and self.latency_jitter_ms <= 0:
+            return
+        with self._random_lock:
+            jitter_ms = self._random.uniform(0, self.latency_jitter_ms)
+        time.sleep((self.latency_ms + jitter_ms) / 1000)
+
+    def _read_recorded_result(self, method, params):
+        if self.recorded_dir is None:
+            return None
+        path = os.path.join(self.recorded_dir, build_file_name(method, params))
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as file:
+            return json_codec.loads(file.read()).get('result')
+
+    def _parse_block_number(self, block_number):
+        if block_number == 'earliest':
+            return 0
+        if block_number in FINALITY_TAGS:
+            return self.chain.head()
+        return int(block_number, 16) if isinstance(block_number, str) else int(block_number)
+
+    def _web3_clientVersion(self):
+        return 'FakeNode/v1.0.0'
+
+    def _net_version(self):
+        return '1'
+
+    def _eth_chainId(self):
+        return '0x1'
+
+    def _eth_blockNumber(self):
+        return hex(self.chain.head())
+
+    def _eth_getBlockByNumber(self, block_number, full_transactions=False):
+        return self.chain.get_block(self._parse_block_number(block_number), full_transactions)
+
+    def _eth_getTransactionReceipt(self, transaction_hash):
+        return self.chain.get_transaction_receipt(transaction_hash)
+
+    def _eth_getLogs(self, filter_params):
+        addresses = filter_params.get('address')
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        return self.chain.get_logs(
+            self._parse_block_number(filter_params.get('fromBlock', 'latest')),
+            self._parse_block_number(filter_params.get('toBlock', 'latest')),
+            addresses=[address.lower() for address in addresses] if addresses else None,
+            topics=filter_params.get('topics'))
+
+    def _eth_newFilter(self, filter_params):
+        filter_id = hex(next(self._filter_ids))
+        self._filters[filter_id] = filter_params
+        return filter_id
+
+    def _eth_getFilterLogs(self, filter_id):
+        filter_params = self._filters.get(filter_id)
+        if filter_params is None:
+            raise ValueError('filter not found')
+        return self._eth_getLogs(filter_params)
+
+    def _eth_uninstallFilter(self, filter_id):
+        return self._filters.pop(filter_id, None) is not None
+
+    def _eth_getCode(self, address, block_number='latest'):
+        return self.chain.get_code(address)
+
+    def _eth_call(self, transaction, block_number='latest'):
+        return self.chain.call(transaction.get('data') or transaction.get('input'))
+
+    def _trace_block(self, block_number):
+        return self.chain.trace_block(self._parse_block_number(block_number))
+
+    def _debug_traceBlockByNumber(self, block_number, options=None):
+        return self.chain.debug_trace_block(self._parse_block_number(block_number))
+
+
+def error_response(request_id, code, message):
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}}
+
+
+def build_file_name(method, params):
+    return 'web3_response.' + method + '_' + '_'.join([param_to_str(param) for param in params]) + '.json'
+
+
+def param_to_str(param):
+    if isinstance(param, dict):
+        return '_'.join([str(key) + '_' + param_to_str(param[key]) for key in sorted(param)])
+    elif isinstance(param, list):
+        return '_'.join([param_to_str(param_item) for param_item in param])
+    else:
+        return str(param).lower()
+
+
+# Serves a FakeNode over HTTP and, with ipc_path set, over a unix socket. Both servers run on daemon threads
+# between start() and stop().
+class FakeNodeServer:
+    def __init__(self, node, host='127.0.0.1', port=0, ipc_path=None):
+        self.node = node
+        self.host = host
+        self.port = port
+        self.ipc_path = ipc_path
+        self._http_server = None
+        self._ipc_server = None
+        self._threads = []
+
+    @property
+    def uri(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    @property
+    def ipc_uri(self):
+        return 'file://' + self.ipc_path if self.ipc_path is not None else None
+
+    def start(self):
+        self._http_server = ThreadingHTTPServer((self.host, self.port), build_http_handler(self.node))
+        self._http_server.daemon_threads = True
+        self.port = self._http_server.server_address[1]
+        self._start_thread(self._http_server.serve_forever)
+
+        if self.ipc_path is not None:
+            if os.path.exists(self.ipc_path):
+                os.remove(self.ipc_path)
+            self._ipc_server = socketserver.ThreadingUnixStreamServer(self.ipc_path, build_ipc_handler(self.node))
+            self._ipc_server.daemon_threads = True
+            self._start_thread(self._ipc_server.serve_forever)
+        return self
+
+    def stop(self):
+        for server in (self._http_server, self._ipc_server):
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._ipc_server is not None and os.path.exists(self.ipc_path):
+            os.remove(self.ipc_path)
+        self._http_server = None
+        self._ipc_server = None
+
+    def _start_thread(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def build_http_handler(node):
+    class FakeNodeHTTPHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately, with Nagle's algorithm every response would wait for a delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            status, response_body = node.handle(body)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response_body)))
+            self.end_headers()
+            self.wfile.write(response_body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeNodeHTTPHandler
+
+
+# Reads concatenated JSON messages from the connection and answers each on its own thread, so pipelined requests
+# are answered concurrently like on a real node. HTTP failures are turned into JSON-RPC errors.
+def build_ipc_handler(node):
+    class FakeNodeIPCHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            decoder = JSONDecoder()
+            write_lock = threading.Lock()
+            buffer = ''
+            while True:
+                chunk = self.request.recv(READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                buffer += chunk.decode('utf-8')
+                while True:
+                    buffer = buffer.lstrip()
+                    try:
+                        request, end = decoder.raw_decode(buffer)
+                    except JSONDecodeError:
+                        break
+                    buffer = buffer[end:]
+                    threading.Thread(target=self._answer, args=(request, write_lock), daemon=True).start()
+
+        def _answer(self, request, write_lock):
+            status, response_body = node.handle(json_codec.dumps_bytes(request))
+            if status != 200:
+                code = RATE_LIMITED_ERROR_CODE if status == 429 else INJECTED_ERROR_CODE
+                request_items = request if isinstance(request, list) else [request]
+                response = [error_response(item.get('id'), code, response_body.decode('utf-8'))
+                            for item in request_items]
+                response_body = json_codec.dumps_bytes(response if isinstance(request, list) else response[0])
+            try:
+                with write_lock:
+                    self.request.sendall(response_body + b'\n')
+            except OSError:
+                logging.getLogger('FakeNodeIPCHandler').debug('The IPC client has disconnected.')
+
+    return FakeNodeIPCHandler
@@ -22,13 +22,17 @@
 
 
 import csv
+import functools
 import logging
 import os
-import shutil
+import threading
 from time import time
 
 from ethereumetl.csv_utils import set_max_field_size_limit
 from blockchainetl.file_utils import smart_open
+from blockchainetl.jobs.exporters.multi_item_exporter import MultiItemExporter
+from ethereumetl.executors.channel import Channel
+from ethereumetl.executors.dag_scheduler import DagScheduler
 from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
 from ethereumetl.jobs.export_contracts_job import ExportContractsJob
 from ethereumetl.jobs.export_receipts_job import ExportReceiptsJob
@@ -63,12 +67,71 @@ def extract_csv_column_unique(input, output, column):
             output_file.write(row[column] + '\n')
 
 
+# Puts the unique non-empty values of field in the items of item_type into a channel, e.g. the hashes of the exported
+# transactions for the receipts stage. Closing the exporter closes the channel, which ends the consuming stage.
+class FieldChannelItemExporter:
+    def __init__(self, item_type, field, channel):
+        self.item_type = item_type
+        self.field = field
+        self.channel = channel
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def open(self):
+        pass
+
+    def export_items(self, items):
+        for item in items:
+            self.export_item(item)
+
+    def export_item(self, item):
+        if item.get('type') != self.item_type:
+            return
+        value = item.get(self.field)
+        if not value:
+            return
+        with self._lock:
+            if value in self._seen:
+                return
+            self._seen.add(value)
+        self.channel.put(value)
+
+    def close(self):
+        self.channel.close()
+
+
+# Closes the channels of the stage however it ends. Closing the input channel unblocks the producing stage if this one
+# failed, closing the output channels ends the consuming stages. A job doesn't close its exporter when it fails.
+def run_stage(job, channels):
+    try:
+        job.run()
+    finally:
+        for channel in channels:
+            channel.close()
+
+
+# Splits max_workers between the stages that run at the same time, so that together they don't have more batches
+# in flight than a single export with max_workers. Every stage gets at least one worker.
+def split_max_workers(max_workers, stage_count):
+    return [max(max_workers // stage_count + (1 if index < max_workers % stage_count else 0), 1)
+            for index in range(stage_count)]
+
+
+# The stages of a partition run at the same time on a DagScheduler and stream their inputs through channels:
+# receipts are fetched for the transactions of the block batches exported so far, contracts for the receipts
+# exported so far and tokens for the token transfers exported so far. max_workers is split between the stages.
 def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_size):
+    stage_names = ['blocks_and_transactions', 'receipts_and_logs', 'contracts']
+    if is_log_filter_supported(provider_uri):
+        stage_names += ['token_transfers', 'tokens']
+    stage_max_workers = dict(zip(stage_names, split_max_workers(max_workers, len(stage_names))))
 
     for batch_start_block, batch_end_block, partition_dir in partitions:
         # # # start # # #
 
         start_time = time()
+        # One thread per stage, as the stages wait on each other's channels
+        scheduler = DagScheduler(max_workers=len(stage_names))
 
         padded_batch_start_block = str(batch_start_block).zfill(8)
         padded_batch_end_block = str(batch_end_block).zfill(8)
@@ -112,21 +175,25 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
             transactions_file=transactions_file,
         ))
 
+        transaction_hashes = Channel()
         job = ExportBlocksJob(
             start_block=batch_start_block,
             end_block=batch_end_block,
             batch_size=batch_size,
             batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
-            max_workers=max_workers,
-            item_exporter=blocks_and_transactions_item_exporter(blocks_file, transactions_file),
+            max_workers=stage_max_workers['blocks_and_transactions'],
+            item_exporter=MultiItemExporter([
+                blocks_and_transactions_item_exporter(blocks_file, transactions_file),
+                FieldChannelItemExporter('transaction', 'hash', transaction_hashes)]),
             export_blocks=blocks_file is not None,
             export_transactions=transactions_file is not None)
-        job.run()
+        scheduler.add_task('blocks_and_transactions', functools.partial(run_stage, job, [transaction_hashes]))
 
         # # # token_transfers # # #
 
         token_transfers_file = None
         if is_log_filter_supported(provider_uri):
+            token_addresses = Channel()
             token_transfers_output_dir = '{output_dir}/token_transfers{partition_dir}'.format(
                 output_dir=output_dir,
                 partition_dir=partition_dir,
@@ -147,27 +214,14 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
                 end_block=batch_end_block,
                 batch_size=batch_size,
                 web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri))),
-                item_exporter=token_transfers_item_exporter(token_transfers_file),
-                max_workers=max_workers)
-            job.run()
+                item_exporter=MultiItemExporter([
+                    token_transfers_item_exporter(token_transfers_file),
+                    FieldChannelItemExporter('token_transfer', 'token_address', token_addresses)]),
+                max_workers=stage_max_workers['token_transfers'])
+            scheduler.add_task('token_transfers', functools.partial(run_stage, job, [token_addresses]))
 
         # # # receipts_and_logs # # #
 
-        cache_output_dir = '{output_dir}/.tmp{partition_dir}'.format(
-            output_dir=output_dir,
-            partition_dir=partition_dir,
-        )
-        os.makedirs(os.path.dirname(cache_output_dir), exist_ok=True)
-
-        transaction_hashes_file = '{cache_output_dir}/transaction_hashes_{file_name_suffix}.csv'.format(
-            cache_output_dir=cache_output_dir,
-            file_name_suffix=file_name_suffix,
-        )
-        logger.info('Extracting hash column from transaction file {transactions_file}'.format(
-            transactions_file=transactions_file,
-        ))
-        extract_csv_column_unique(transactions_file, transaction_hashes_file, 'hash')
-
         receipts_output_dir = '{output_dir}/receipts{partition_dir}'.format(
             output_dir=output_dir,
             partition_dir=partition_dir,
@@ -194,28 +248,22 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
             logs_file=logs_file,
         ))
 
-        with smart_open(transaction_hashes_file, 'r') as transaction_hashes:
-            job = ExportReceiptsJob(
-                transaction_hashes_iterable=(transaction_hash.strip() for transaction_hash in transaction_hashes),
-                batch_size=batch_size,
-                batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
-                max_workers=max_workers,
-                item_exporter=receipts_and_logs_item_exporter(receipts_file, logs_file),
-                export_receipts=receipts_file is not None,
-                export_logs=logs_file is not None)
-            job.run()
+        contract_addresses = Channel()
+        job = ExportReceiptsJob(
+            transaction_hashes_iterable=transaction_hashes,
+            batch_size=batch_size,
+            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+            max_workers=stage_max_workers['receipts_and_logs'],
+            item_exporter=MultiItemExporter([
+                receipts_and_logs_item_exporter(receipts_file, logs_file),
+                FieldChannelItemExporter('receipt', 'contract_address', contract_addresses)]),
+            export_receipts=receipts_file is not None,
+            export_logs=logs_file is not None)
+        scheduler.add_task('receipts_and_logs', functools.partial(
+            run_stage, job, [transaction_hashes, contract_addresses]))
 
         # # # contracts # # #
 
-        contract_addresses_file = '{cache_output_dir}/contract_addresses_{file_name_suffix}.csv'.format(
-            cache_output_dir=cache_output_dir,
-            file_name_suffix=file_name_suffix,
-        )
-        logger.info('Extracting contract_address from receipt file {receipts_file}'.format(
-            receipts_file=receipts_file
-        ))
-        extract_csv_column_unique(receipts_file, contract_addresses_file, 'contract_address')
-
         contracts_output_dir = '{output_dir}/contracts{partition_dir}'.format(
             output_dir=output_dir,
             partition_dir=partition_dir,
@@ -231,29 +279,17 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
             contracts_file=contracts_file,
         ))
 
-        with smart_open(contract_addresses_file, 'r') as contract_addresses_file:
-            contract_addresses = (contract_address.strip() for contract_address in contract_addresses_file
-                                  if contract_address.strip())
-            job = ExportContractsJob(
-                contract_addresses_iterable=contract_addresses,
-                batch_size=batch_size,
-                batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
-                item_exporter=contracts_item_exporter(contracts_file),
-                max_workers=max_workers)
-            job.run()
+        job = ExportContractsJob(
+            contract_addresses_iterable=contract_addresses,
+            batch_size=batch_size,
+            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+            item_exporter=contracts_item_exporter(contracts_file),
+            max_workers=stage_max_workers['contracts'])
+        scheduler.add_task('contracts', functools.partial(run_stage, job, [contract_addresses]))
 
         # # # tokens # # #
 
         if token_transfers_file is not None:
-            token_addresses_file = '{cache_output_dir}/token_addresses_{file_name_suffix}'.format(
-                cache_output_dir=cache_output_dir,
-                file_name_suffix=file_name_suffix,
-            )
-            logger.info('Extracting token_address from token_transfers file {token_transfers_file}'.format(
-                token_transfers_file=token_transfers_file,
-            ))
-            extract_csv_column_unique(token_transfers_file, token_addresses_file, 'token_address')
-
             tokens_output_dir = '{output_dir}/tokens{partition_dir}'.format(
                 output_dir=output_dir,
                 partition_dir=partition_dir,
@@ -269,16 +305,15 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
                 tokens_file=tokens_file,
             ))
 
-            with smart_open(token_addresses_file, 'r') as token_addresses:
-                job = ExportTokensJob(
-                    token_addresses_iterable=(token_address.strip() for token_address in token_addresses),
-                    web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri))),
-                    item_exporter=tokens_item_exporter(tokens_file),
-                    max_workers=max_workers)
-                job.run()
+            job = ExportTokensJob(
+                token_addresses_iterable=token_addresses,
+                web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri))),
+                item_exporter=tokens_item_exporter(tokens_file),
+                max_workers=stage_max_workers['tokens'])
+            scheduler.add_task('tokens', functools.partial(run_stage, job, [token_addresses]))
 
         # # # finish # # #
-        shutil.rmtree(os.path.dirname(cache_output_dir))
+        scheduler.run()
         end_time = time()
         time_diff = round(end_time - start_time, 5)
         logger.info('Exporting blocks {block_range} took {time_diff} seconds'.format(
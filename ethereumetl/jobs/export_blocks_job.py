@@ -21,17 +21,28 @@
 # SOFTWARE.
 
 
-import json
+import logging
 
+from blockchainetl.profiling import async_span, span
+from ethereumetl.enumeration.retry_strategy import RetryStrategy
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+from ethereumetl.executors.mapping_process_pool import MappingProcessPool, decode_raw_response, \
+    export_mapped_items, get_raw_response_size_bytes, make_raw_batch_request, make_raw_batch_request_async, \
+    serialize_mapped_items
 from blockchainetl.jobs.base_job import BaseJob
-from ethereumetl.json_rpc_requests import generate_get_block_by_number_json_rpc
+from ethereumetl.json_rpc_requests import generate_get_block_by_number_json_rpc, encode_json_rpc_batch
 from ethereumetl.mappers.block_mapper import EthBlockMapper
 from ethereumetl.mappers.transaction_mapper import EthTransactionMapper
+from ethereumetl.providers.async_rpc import is_async_provider
 from ethereumetl.utils import rpc_response_batch_to_results, validate_range
 
 
 # Exports blocks and transactions
+# With mapping_processes, responses are decoded, mapped and serialized in that many worker processes.
+# With ordered, blocks and transactions are exported in block order.
+# With an ExportLedger, they are exported in order and the ledger records the progress, so that a run that crashed
+# resumes after the last recorded batch.
 class ExportBlocksJob(BaseJob):
     def __init__(
             self,
@@ -42,14 +53,28 @@ class ExportBlocksJob(BaseJob):
             max_workers,
             item_exporter,
             export_blocks=True,
-            export_transactions=True):
+            export_transactions=True,
+            target_batch_bytes=None,
+            retry_strategy=RetryStrategy.ITEM,
+            adaptive=False,
+            mapping_processes=None,
+            ordered=False,
+            ledger=None):
         validate_range(start_block, end_block)
         self.start_block = start_block
         self.end_block = end_block
 
         self.batch_web3_provider = batch_web3_provider
+        self.is_async = is_async_provider(batch_web3_provider)
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
+        if self.is_async:
+            self.batch_work_executor = AsyncBatchWorkExecutor(
+                batch_size, max_workers, target_batch_bytes=target_batch_bytes, retry_strategy=retry_strategy,
+                adaptive=adaptive)
+        else:
+            self.batch_work_executor = BatchWorkExecutor(
+                batch_size, max_workers, target_batch_bytes=target_batch_bytes, retry_strategy=retry_strategy,
+                adaptive=adaptive)
         self.item_exporter = item_exporter
 
         self.export_blocks = export_blocks
@@ -57,35 +82,112 @@ class ExportBlocksJob(BaseJob):
         if not self.export_blocks and not self.export_transactions:
             raise ValueError('At least one of export_blocks or export_transactions must be True')
 
-        self.block_mapper = EthBlockMapper()
-        self.transaction_mapper = EthTransactionMapper()
+        if ledger is not None and not hasattr(item_exporter, 'sync'):
+            raise ValueError('A ledger requires an item exporter writing to files')
+        self.ledger = ledger
+        self.ordered = ordered or ledger is not None
+        self.resume_block = start_block
+        self.mapping_pool = MappingProcessPool(mapping_processes) if mapping_processes else None
+        get_item_serializer = getattr(item_exporter, 'get_item_serializer', None)
+        self.item_serializer = get_item_serializer() \
+            if self.mapping_pool is not None and get_item_serializer is not None else None
 
     def _start(self):
-        self.item_exporter.open()
+        if self.ledger is None:
+            self.item_exporter.open()
+            return
+        last_block, offsets = self.ledger.open(self.start_block, self.end_block)
+        self.item_exporter.open(offsets=offsets)
+        if last_block is not None:
+            self.resume_block = last_block + 1
+            logging.info('Resuming from block {} recorded in the ledger'.format(self.resume_block))
 
     def _export(self):
         self.batch_work_executor.execute(
-            range(self.start_block, self.end_block + 1),
-            self._export_batch,
-            total_items=self.end_block - self.start_block + 1
+            range(self.resume_block, self.end_block + 1),
+            self._export_batch_async if self.is_async else self._export_batch,
+            total_items=self.end_block - self.resume_block + 1,
+            result_handler=self._export_ordered if self.ordered else None,
+            item_name='blocks'
         )
 
     def _export_batch(self, block_number_batch):
         blocks_rpc = list(generate_get_block_by_number_json_rpc(block_number_batch, self.export_transactions))
-        response = self.batch_web3_provider.make_batch_request(json.dumps(blocks_rpc))
-        results = rpc_response_batch_to_results(response)
-        blocks = [self.block_mapper.json_dict_to_block(result) for result in results]
+        if self.mapping_pool is None:
+            with span('fetch', blocks=len(block_number_batch)):
+                response = self.batch_web3_provider.make_batch_request(encode_json_rpc_batch(blocks_rpc))
+            self._record_response_size(block_number_batch, response)
+            return self._handle_mapped_items(block_number_batch, self._map_response(response))
+        else:
+            with span('fetch', blocks=len(block_number_batch)):
+                response = make_raw_batch_request(self.batch_web3_provider, encode_json_rpc_batch(blocks_rpc))
+            self._record_response_size(block_number_batch, response)
+            with span('map'):
+                mapped_items = self.mapping_pool.map(*self._get_mapping_args(response))
+            return self._handle_mapped_items(block_number_batch, mapped_items)
 
-        for block in blocks:
-            self._export_block(block)
+    async def _export_batch_async(self, block_number_batch):
+        blocks_rpc = list(generate_get_block_by_number_json_rpc(block_number_batch, self.export_transactions))
+        if self.mapping_pool is None:
+            with async_span('fetch', blocks=len(block_number_batch)):
+                response = await self.batch_web3_provider.make_batch_request(encode_json_rpc_batch(blocks_rpc))
+            self._record_response_size(block_number_batch, response)
+            return self._handle_mapped_items(block_number_batch, self._map_response(response))
+        else:
+            with async_span('fetch', blocks=len(block_number_batch)):
+                response = await make_raw_batch_request_async(
+                    self.batch_web3_provider, encode_json_rpc_batch(blocks_rpc))
+            self._record_response_size(block_number_batch, response)
+            with async_span('map'):
+                mapped_items = await self.mapping_pool.map_async(*self._get_mapping_args(response))
+            return self._handle_mapped_items(block_number_batch, mapped_items)
+
+    def _handle_mapped_items(self, block_number_batch, mapped_items):
+        if self.ordered:
+            # Exported by _export_ordered once all the previous batches are exported
+            return [(block_number_batch[-1], mapped_items)]
+        with span('export', last_block=block_number_batch[-1]):
+            export_mapped_items(self.item_exporter, mapped_items)
+
+    def _export_ordered(self, results):
+        for last_block, mapped_items in results:
+            with span('export', last_block=last_block):
+                export_mapped_items(self.item_exporter, mapped_items)
+            if self.ledger is not None:
+                self.ledger.record(last_block, self.item_exporter.sync())
+
+    def _record_response_size(self, block_number_batch, response):
+        self.batch_work_executor.record_batch_bytes(len(block_number_batch), get_raw_response_size_bytes(response))
 
-    def _export_block(self, block):
-        if self.export_blocks:
-            self.item_exporter.export_item(self.block_mapper.block_to_dict(block))
-        if self.export_transactions:
-            for tx in block.transactions:
-                self.item_exporter.export_item(self.transaction_mapper.transaction_to_dict(tx))
+    def _map_response(self, response):
+        return map_blocks_response(response, self.export_blocks, self.export_transactions, None)
+
+    def _get_mapping_args(self, response):
+        return map_blocks_response, response, self.export_blocks, self.export_transactions, self.item_serializer
 
     def _end(self):
+        if self.is_async:
+            self.batch_work_executor.run(self.batch_web3_provider.close())
         self.batch_work_executor.shutdown()
+        if self.mapping_pool is not None:
+            self.mapping_pool.shutdown()
         self.item_exporter.close()
+        if self.ledger is not None:
+            self.ledger.close()
+
+
+# Module level so that it can run in a worker process
+def map_blocks_response(response, export_blocks, export_transactions, item_serializer):
+    block_mapper = EthBlockMapper()
+    transaction_mapper = EthTransactionMapper()
+    items = []
+    with span('decode'):
+        response = decode_raw_response(response)
+    with span('map'):
+        for result in rpc_response_batch_to_results(response):
+            block = block_mapper.json_dict_to_block(result)
+            if export_blocks:
+                items.append(block_mapper.block_to_dict(block))
+            if export_transactions:
+                items.extend(transaction_mapper.transaction_to_dict(tx) for tx in block.transactions)
+    return serialize_mapped_items(items, item_serializer)
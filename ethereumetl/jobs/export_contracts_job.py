@@ -21,11 +21,9 @@
 # SOFTWARE.
 
 
-import json
-
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from blockchainetl.jobs.base_job import BaseJob
-from ethereumetl.json_rpc_requests import generate_get_code_json_rpc
+from ethereumetl.json_rpc_requests import generate_get_code_json_rpc, encode_json_rpc_batch
 from ethereumetl.mappers.contract_mapper import EthContractMapper
 
 from ethereumetl.service.eth_contract_service import EthContractService
@@ -58,15 +56,16 @@ class ExportContractsJob(BaseJob):
 
     def _export_contracts(self, contract_addresses):
         contracts_code_rpc = list(generate_get_code_json_rpc(contract_addresses))
-        response_batch = self.batch_web3_provider.make_batch_request(json.dumps(contracts_code_rpc))
+        response_batch = self.batch_web3_provider.make_batch_request(encode_json_rpc_batch(contracts_code_rpc))
+
+        contract_addresses_by_request_id = {request['id']: contract_address for request, contract_address
+                                            in zip(contracts_code_rpc, contract_addresses)}
 
         contracts = []
         for response in response_batch:
-            # request id is the index of the contract address in contract_addresses list
-            request_id = response['id']
             result = rpc_response_to_result(response)
 
-            contract_address = contract_addresses[request_id]
+            contract_address = contract_addresses_by_request_id[response['id']]
             contract = self._get_contract(contract_address, result)
             contracts.append(contract)
 
@@ -20,10 +20,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import json
-
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
-from ethereumetl.json_rpc_requests import generate_trace_block_by_number_json_rpc
+from ethereumetl.json_rpc_requests import generate_trace_block_by_number_json_rpc, encode_json_rpc_batch
 from blockchainetl.jobs.base_job import BaseJob
 from ethereumetl.mappers.geth_trace_mapper import EthGethTraceMapper
 from ethereumetl.utils import validate_range, rpc_response_to_result
@@ -57,15 +55,18 @@ class ExportGethTracesJob(BaseJob):
         self.batch_work_executor.execute(
             range(self.start_block, self.end_block + 1),
             self._export_batch,
-            total_items=self.end_block - self.start_block + 1
+            total_items=self.end_block - self.start_block + 1,
+            item_name='blocks'
         )
 
     def _export_batch(self, block_number_batch):
         trace_block_rpc = list(generate_trace_block_by_number_json_rpc(block_number_batch))
-        response = self.batch_web3_provider.make_batch_request(json.dumps(trace_block_rpc))
+        response = self.batch_web3_provider.make_batch_request(encode_json_rpc_batch(trace_block_rpc))
+        block_numbers_by_request_id = {request['id']: block_number for request, block_number
+                                       in zip(trace_block_rpc, block_number_batch)}
 
         for response_item in response:
-            block_number = response_item.get('id')
+            block_number = block_numbers_by_request_id[response_item.get('id')]
             result = rpc_response_to_result(response_item)
 
             geth_trace = self.geth_trace_mapper.json_dict_to_geth_trace({
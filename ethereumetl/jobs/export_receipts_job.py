@@ -21,17 +21,26 @@
 # SOFTWARE.
 
 
-import json
-
 from blockchainetl.jobs.base_job import BaseJob
+from blockchainetl.profiling import async_span, span
+from ethereumetl.enumeration.retry_strategy import RetryStrategy
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
-from ethereumetl.json_rpc_requests import generate_get_receipt_json_rpc
+from ethereumetl.executors.mapping_process_pool import MappingProcessPool, decode_raw_response, \
+    export_mapped_items, get_raw_response_size_bytes, make_raw_batch_request, make_raw_batch_request_async, \
+    serialize_mapped_items
+from ethereumetl.json_rpc_requests import generate_get_receipt_json_rpc, encode_json_rpc_batch
 from ethereumetl.mappers.receipt_log_mapper import EthReceiptLogMapper
 from ethereumetl.mappers.receipt_mapper import EthReceiptMapper
+from ethereumetl.providers.async_rpc import is_async_provider
 from ethereumetl.utils import rpc_response_batch_to_results
 
 
 # Exports receipts and logs
+# With mapping_processes, responses are decoded, mapped and serialized in that many worker processes.
+# With ordered, receipts and logs are exported in the order of transaction_hashes_iterable.
+# With export_domain_objects, EthReceipt and EthReceiptLog objects are exported instead of dicts, for handing them to
+# other jobs in the same process without mapping them to dicts and back.
 class ExportReceiptsJob(BaseJob):
     def __init__(
             self,
@@ -41,11 +50,25 @@ class ExportReceiptsJob(BaseJob):
             max_workers,
             item_exporter,
             export_receipts=True,
-            export_logs=True):
+            export_logs=True,
+            target_batch_bytes=None,
+            retry_strategy=RetryStrategy.ITEM,
+            adaptive=False,
+            mapping_processes=None,
+            ordered=False,
+            export_domain_objects=False):
         self.batch_web3_provider = batch_web3_provider
         self.transaction_hashes_iterable = transaction_hashes_iterable
+        self.is_async = is_async_provider(batch_web3_provider)
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
+        if self.is_async:
+            self.batch_work_executor = AsyncBatchWorkExecutor(
+                batch_size, max_workers, target_batch_bytes=target_batch_bytes, retry_strategy=retry_strategy,
+                adaptive=adaptive)
+        else:
+            self.batch_work_executor = BatchWorkExecutor(
+                batch_size, max_workers, target_batch_bytes=target_batch_bytes, retry_strategy=retry_strategy,
+                adaptive=adaptive)
         self.item_exporter = item_exporter
 
         self.export_receipts = export_receipts
@@ -53,30 +76,115 @@ class ExportReceiptsJob(BaseJob):
         if not self.export_receipts and not self.export_logs:
             raise ValueError('At least one of export_receipts or export_logs must be True')
 
-        self.receipt_mapper = EthReceiptMapper()
-        self.receipt_log_mapper = EthReceiptLogMapper()
+        if export_domain_objects and mapping_processes:
+            raise ValueError('Domain objects can\'t be exported from mapping processes')
+        self.export_domain_objects = export_domain_objects
+        self.ordered = ordered
+        self.mapping_pool = MappingProcessPool(mapping_processes) if mapping_processes else None
+        get_item_serializer = getattr(item_exporter, 'get_item_serializer', None)
+        self.item_serializer = get_item_serializer() \
+            if self.mapping_pool is not None and get_item_serializer is not None else None
 
     def _start(self):
         self.item_exporter.open()
 
     def _export(self):
-        self.batch_work_executor.execute(self.transaction_hashes_iterable, self._export_receipts)
+        self.batch_work_executor.execute(
+            self.transaction_hashes_iterable,
+            self._export_receipts_async if self.is_async else self._export_receipts,
+            result_handler=self._export_ordered if self.ordered else None
+        )
 
     def _export_receipts(self, transaction_hashes):
         receipts_rpc = list(generate_get_receipt_json_rpc(transaction_hashes))
-        response = self.batch_web3_provider.make_batch_request(json.dumps(receipts_rpc))
-        results = rpc_response_batch_to_results(response)
-        receipts = [self.receipt_mapper.json_dict_to_receipt(result) for result in results]
-        for receipt in receipts:
-            self._export_receipt(receipt)
-
-    def _export_receipt(self, receipt):
-        if self.export_receipts:
-            self.item_exporter.export_item(self.receipt_mapper.receipt_to_dict(receipt))
-        if self.export_logs:
-            for log in receipt.logs:
-                self.item_exporter.export_item(self.receipt_log_mapper.receipt_log_to_dict(log))
+        if self.mapping_pool is None:
+            with span('fetch', receipts=len(transaction_hashes)):
+                response = self.batch_web3_provider.make_batch_request(encode_json_rpc_batch(receipts_rpc))
+            self._record_response_size(transaction_hashes, response)
+            return self._handle_mapped_items(self._map_response(response))
+        else:
+            with span('fetch', receipts=len(transaction_hashes)):
+                response = make_raw_batch_request(self.batch_web3_provider, encode_json_rpc_batch(receipts_rpc))
+            self._record_response_size(transaction_hashes, response)
+            with span('map'):
+                mapped_items = self.mapping_pool.map(*self._get_mapping_args(response))
+            return self._handle_mapped_items(mapped_items)
+
+    async def _export_receipts_async(self, transaction_hashes):
+        receipts_rpc = list(generate_get_receipt_json_rpc(transaction_hashes))
+        if self.mapping_pool is None:
+            with async_span('fetch', receipts=len(transaction_hashes)):
+                response = await self.batch_web3_provider.make_batch_request(encode_json_rpc_batch(receipts_rpc))
+            self._record_response_size(transaction_hashes, response)
+            return self._handle_mapped_items(self._map_response(response))
+        else:
+            with async_span('fetch', receipts=len(transaction_hashes)):
+                response = await make_raw_batch_request_async(
+                    self.batch_web3_provider, encode_json_rpc_batch(receipts_rpc))
+            self._record_response_size(transaction_hashes, response)
+            with async_span('map'):
+                mapped_items = await self.mapping_pool.map_async(*self._get_mapping_args(response))
+            return self._handle_mapped_items(mapped_items)
+
+    def _handle_mapped_items(self, mapped_items):
+        if self.ordered:
+            # Exported by _export_ordered once all the previous batches are exported
+            return [mapped_items]
+        with span('export'):
+            export_mapped_items(self.item_exporter, mapped_items)
+
+    def _export_ordered(self, mapped_items_list):
+        for mapped_items in mapped_items_list:
+            with span('export'):
+                export_mapped_items(self.item_exporter, mapped_items)
+
+    def _record_response_size(self, transaction_hashes, response):
+        self.batch_work_executor.record_batch_bytes(len(transaction_hashes), get_raw_response_size_bytes(response))
+
+    def _map_response(self, response):
+        if self.export_domain_objects:
+            return map_receipts_response_to_domain_objects(response, self.export_receipts, self.export_logs)
+        return map_receipts_response(response, self.export_receipts, self.export_logs, None)
+
+    def _get_mapping_args(self, response):
+        return map_receipts_response, response, self.export_receipts, self.export_logs, self.item_serializer
 
     def _end(self):
+        if self.is_async:
+            self.batch_work_executor.run(self.batch_web3_provider.close())
         self.batch_work_executor.shutdown()
+        if self.mapping_pool is not None:
+            self.mapping_pool.shutdown()
         self.item_exporter.close()
+
+
+# Module level so that it can run in a worker process
+def map_receipts_response(response, export_receipts, export_logs, item_serializer):
+    receipt_mapper = EthReceiptMapper()
+    receipt_log_mapper = EthReceiptLogMapper()
+    items = []
+    with span('decode'):
+        response = decode_raw_response(response)
+    with span('map'):
+        for result in rpc_response_batch_to_results(response):
+            receipt = receipt_mapper.json_dict_to_receipt(result)
+            if export_receipts:
+                items.append(receipt_mapper.receipt_to_dict(receipt))
+            if export_logs:
+                items.extend(receipt_log_mapper.receipt_log_to_dict(log) for log in receipt.logs)
+    return serialize_mapped_items(items, item_serializer)
+
+
+def map_receipts_response_to_domain_objects(response, export_receipts, export_logs):
+    receipt_mapper = EthReceiptMapper()
+    items = []
+    with span('decode'):
+        response = decode_raw_response(response)
+    with span('map'):
+        for result in rpc_response_batch_to_results(response):
+            receipt = receipt_mapper.json_dict_to_receipt(result)
+            if export_receipts:
+                items.append(receipt)
+            if export_logs:
+                items.extend(receipt.logs)
+    return items
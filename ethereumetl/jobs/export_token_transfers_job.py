@@ -60,7 +60,8 @@ class ExportTokenTransfersJob(BaseJob):
         self.batch_work_executor.execute(
             range(self.start_block, self.end_block + 1),
             self._export_batch,
-            total_items=self.end_block - self.start_block + 1
+            total_items=self.end_block - self.start_block + 1,
+            item_name='blocks'
         )
 
     def _export_batch(self, block_number_batch):
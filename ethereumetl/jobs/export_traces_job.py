@@ -23,6 +23,7 @@ import logging
 
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from blockchainetl.jobs.base_job import BaseJob
+from blockchainetl.profiling import span
 from ethereumetl.mainnet_daofork_state_changes import DAOFORK_BLOCK_NUMBER
 from ethereumetl.mappers.trace_mapper import EthTraceMapper
 from ethereumetl.service.eth_special_trace_service import EthSpecialTraceService
@@ -32,6 +33,9 @@ from ethereumetl.service.trace_status_calculator import calculate_trace_statuses
 from ethereumetl.utils import validate_range
 
 
+# With an ExportLedger, traces are exported in block order and the ledger records the progress, so that a run that
+# crashed resumes after the last recorded block.
+# With export_domain_objects, EthTrace objects are exported instead of dicts.
 class ExportTracesJob(BaseJob):
     def __init__(
             self,
@@ -42,7 +46,9 @@ class ExportTracesJob(BaseJob):
             item_exporter,
             max_workers,
             include_genesis_traces=False,
-            include_daofork_traces=False):
+            include_daofork_traces=False,
+            ledger=None,
+            export_domain_objects=False):
         validate_range(start_block, end_block)
         self.start_block = start_block
         self.end_block = end_block
@@ -59,14 +65,29 @@ class ExportTracesJob(BaseJob):
         self.include_genesis_traces = include_genesis_traces
         self.include_daofork_traces = include_daofork_traces
 
+        if ledger is not None and not hasattr(item_exporter, 'sync'):
+            raise ValueError('A ledger requires an item exporter writing to files')
+        self.ledger = ledger
+        self.resume_block = start_block
+        self.export_domain_objects = export_domain_objects
+
     def _start(self):
-        self.item_exporter.open()
+        if self.ledger is None:
+            self.item_exporter.open()
+            return
+        last_block, offsets = self.ledger.open(self.start_block, self.end_block)
+        self.item_exporter.open(offsets=offsets)
+        if last_block is not None:
+            self.resume_block = last_block + 1
+            logging.info('Resuming from block {} recorded in the ledger'.format(self.resume_block))
 
     def _export(self):
         self.batch_work_executor.execute(
-            range(self.start_block, self.end_block + 1),
+            range(self.resume_block, self.end_block + 1),
             self._export_batch,
-            total_items=self.end_block - self.start_block + 1
+            total_items=self.end_block - self.resume_block + 1,
+            result_handler=self._export_ordered if self.ledger is not None else None,
+            item_name='blocks'
         )
 
     def _export_batch(self, block_number_batch):
@@ -87,24 +108,42 @@ class ExportTracesJob(BaseJob):
 
         # TODO: Change to traceFilter when this issue is fixed
         # https://github.com/paritytech/parity-ethereum/issues/9822
-        json_traces = self.web3.parity.traceBlock(block_number)
+        with span('fetch', block=block_number):
+            json_traces = self.web3.parity.traceBlock(block_number)
 
         if json_traces is None:
             raise ValueError('Response from the node is None. Is the node fully synced? Is the node started with tracing enabled? Is trace_block API enabled?')
 
-        traces = [self.trace_mapper.json_dict_to_trace(json_trace) for json_trace in json_traces]
-        all_traces.extend(traces)
+        with span('map', block=block_number):
+            traces = [self.trace_mapper.json_dict_to_trace(json_trace) for json_trace in json_traces]
+            all_traces.extend(traces)
+
+            calculate_trace_statuses(all_traces)
+            calculate_trace_ids(all_traces)
+            calculate_trace_indexes(all_traces)
+
+            trace_items = all_traces if self.export_domain_objects \
+                else [self.trace_mapper.trace_to_dict(trace) for trace in all_traces]
+        if self.ledger is not None:
+            # Exported by _export_ordered once all the previous blocks are exported
+            return [(block_number, trace_items)]
+        self._export_trace_items(block_number, trace_items)
 
-        calculate_trace_statuses(all_traces)
-        calculate_trace_ids(all_traces)
-        calculate_trace_indexes(all_traces)
+    def _export_ordered(self, results):
+        for block_number, trace_items in results:
+            self._export_trace_items(block_number, trace_items)
+            self.ledger.record(block_number, self.item_exporter.sync())
 
-        for trace in all_traces:
-            self.item_exporter.export_item(self.trace_mapper.trace_to_dict(trace))
+    def _export_trace_items(self, block_number, trace_items):
+        with span('export', block=block_number):
+            for trace_item in trace_items:
+                self.item_exporter.export_item(trace_item)
 
     def _end(self):
         self.batch_work_executor.shutdown()
         self.item_exporter.close()
+        if self.ledger is not None:
+            self.ledger.close()
 
 
 def calculate_trace_indexes(traces):
@@ -22,29 +22,35 @@
 
 
 from ethereumetl.domain.contract import EthContract
+from ethereumetl.domain.trace import EthTrace
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from blockchainetl.jobs.base_job import BaseJob
 from ethereumetl.mappers.contract_mapper import EthContractMapper
+from ethereumetl.mappers.trace_mapper import EthTraceMapper
 
 from ethereumetl.service.eth_contract_service import EthContractService
-from ethereumetl.utils import to_int_or_none
 
 
 # Extract contracts
+# traces_iterable yields trace dicts or EthTrace objects. With export_domain_objects, EthContract objects are exported
+# instead of dicts.
 class ExtractContractsJob(BaseJob):
     def __init__(
             self,
             traces_iterable,
             batch_size,
             max_workers,
-            item_exporter):
+            item_exporter,
+            export_domain_objects=False):
         self.traces_iterable = traces_iterable
+        self.export_domain_objects = export_domain_objects
 
         self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
         self.item_exporter = item_exporter
 
         self.contract_service = EthContractService()
         self.contract_mapper = EthContractMapper()
+        self.trace_mapper = EthTraceMapper()
 
     def _start(self):
         self.item_exporter.open()
@@ -53,21 +59,19 @@ class ExtractContractsJob(BaseJob):
         self.batch_work_executor.execute(self.traces_iterable, self._extract_contracts)
 
     def _extract_contracts(self, traces):
-        for trace in traces:
-            trace['status'] = to_int_or_none(trace.get('status'))
-            trace['block_number'] = to_int_or_none(trace.get('block_number'))
+        traces = [trace if isinstance(trace, EthTrace) else self.trace_mapper.dict_to_trace(trace) for trace in traces]
 
         contract_creation_traces = [trace for trace in traces
-                                    if trace.get('trace_type') == 'create' and trace.get('to_address') is not None
-                                    and len(trace.get('to_address')) > 0 and trace.get('status') == 1]
+                                    if trace.trace_type == 'create' and trace.to_address is not None
+                                    and len(trace.to_address) > 0 and trace.status == 1]
 
         contracts = []
         for trace in contract_creation_traces:
             contract = EthContract()
-            contract.address = trace.get('to_address')
-            bytecode = trace.get('output')
+            contract.address = trace.to_address
+            bytecode = trace.output
             contract.bytecode = bytecode
-            contract.block_number = trace.get('block_number')
+            contract.block_number = trace.block_number
 
             function_sighashes = self.contract_service.get_function_sighashes(bytecode)
 
@@ -78,7 +82,10 @@ class ExtractContractsJob(BaseJob):
             contracts.append(contract)
 
         for contract in contracts:
-            self.item_exporter.export_item(self.contract_mapper.contract_to_dict(contract))
+            if self.export_domain_objects:
+                self.item_exporter.export_item(contract)
+            else:
+                self.item_exporter.export_item(self.contract_mapper.contract_to_dict(contract))
 
     def _end(self):
         self.batch_work_executor.shutdown()
@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from ethereumetl.domain.receipt_log import EthReceiptLog
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from blockchainetl.jobs.base_job import BaseJob
 from ethereumetl.mappers.token_transfer_mapper import EthTokenTransferMapper
@@ -27,14 +28,18 @@ from ethereumetl.mappers.receipt_log_mapper import EthReceiptLogMapper
 from ethereumetl.service.token_transfer_extractor import EthTokenTransferExtractor
 
 
+# logs_iterable yields log dicts or EthReceiptLog objects. With export_domain_objects, EthTokenTransfer objects are
+# exported instead of dicts.
 class ExtractTokenTransfersJob(BaseJob):
     def __init__(
             self,
             logs_iterable,
             batch_size,
             max_workers,
-            item_exporter):
+            item_exporter,
+            export_domain_objects=False):
         self.logs_iterable = logs_iterable
+        self.export_domain_objects = export_domain_objects
 
         self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
         self.item_exporter = item_exporter
@@ -49,14 +54,19 @@ class ExtractTokenTransfersJob(BaseJob):
     def _export(self):
         self.batch_work_executor.execute(self.logs_iterable, self._extract_transfers)
 
-    def _extract_transfers(self, log_dicts):
-        for log_dict in log_dicts:
-            self._extract_transfer(log_dict)
+    def _extract_transfers(self, logs):
+        for log in logs:
+            self._extract_transfer(log)
 
-    def _extract_transfer(self, log_dict):
-        log = self.receipt_log_mapper.dict_to_receipt_log(log_dict)
+    def _extract_transfer(self, log):
+        if not isinstance(log, EthReceiptLog):
+            log = self.receipt_log_mapper.dict_to_receipt_log(log)
         token_transfer = self.token_transfer_extractor.extract_transfer_from_log(log)
-        if token_transfer is not None:
+        if token_transfer is None:
+            return
+        if self.export_domain_objects:
+            self.item_exporter.export_item(token_transfer)
+        else:
             self.item_exporter.export_item(self.token_transfer_mapper.token_transfer_to_dict(token_transfer))
 
     def _end(self):
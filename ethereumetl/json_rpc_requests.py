@@ -20,13 +20,25 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import itertools
+
+from blockchainetl import json_codec
+
+# Request ids are unique in the process, so requests from different threads can be sent on the same connection
+# without rewriting their ids. next() on itertools.count is atomic.
+_request_ids = itertools.count()
+
+
+def next_request_id():
+    return next(_request_ids)
+
 
 def generate_get_block_by_number_json_rpc(block_numbers, include_transactions):
-    for idx, block_number in enumerate(block_numbers):
+    for block_number in block_numbers:
         yield generate_json_rpc(
             method='eth_getBlockByNumber',
             params=[hex(block_number), include_transactions],
-            request_id=idx
+            request_id=next_request_id()
         )
 
 
@@ -35,26 +47,25 @@ def generate_trace_block_by_number_json_rpc(block_numbers):
         yield generate_json_rpc(
             method='debug_traceBlockByNumber',
             params=[hex(block_number), {'tracer': 'callTracer'}],
-            # save block_number in request ID, so later we can identify block number in response
-            request_id=block_number,
+            request_id=next_request_id(),
         )
 
 
 def generate_get_receipt_json_rpc(transaction_hashes):
-    for idx, transaction_hash in enumerate(transaction_hashes):
+    for transaction_hash in transaction_hashes:
         yield generate_json_rpc(
             method='eth_getTransactionReceipt',
             params=[transaction_hash],
-            request_id=idx
+            request_id=next_request_id()
         )
 
 
 def generate_get_code_json_rpc(contract_addresses, block='latest'):
-    for idx, contract_address in enumerate(contract_addresses):
+    for contract_address in contract_addresses:
         yield generate_json_rpc(
             method='eth_getCode',
             params=[contract_address, hex(block) if isinstance(block, int) else block],
-            request_id=idx
+            request_id=next_request_id()
         )
 
 
@@ -65,3 +76,15 @@ def generate_json_rpc(method, params, request_id=1):
         'params': params,
         'id': request_id,
     }
+
+
+# A JSON-RPC batch request encoded as text, with the ids of the requests in it. Providers that send requests from
+# several threads on one connection use the ids instead of decoding the text.
+class JsonRpcBatchText(str):
+    request_ids = None
+
+
+def encode_json_rpc_batch(requests):
+    text = JsonRpcBatchText(json_codec.dumps(requests))
+    text.request_ids = [request.get('id') for request in requests]
+    return text
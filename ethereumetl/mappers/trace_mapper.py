@@ -23,7 +23,7 @@
 
 from ethereumetl.domain.trace import EthTrace
 from ethereumetl.mainnet_daofork_state_changes import DAOFORK_BLOCK_NUMBER
-from ethereumetl.utils import hex_to_dec, to_normalized_address
+from ethereumetl.utils import hex_to_dec, to_int_or_none, to_normalized_address
 
 
 class EthTraceMapper(object):
@@ -169,6 +169,31 @@ class EthTraceMapper(object):
 
         return result
 
+    def dict_to_trace(self, dict):
+        trace = EthTrace()
+
+        trace.block_number = to_int_or_none(dict.get('block_number'))
+        trace.transaction_hash = dict.get('transaction_hash')
+        trace.transaction_index = to_int_or_none(dict.get('transaction_index'))
+        trace.from_address = dict.get('from_address')
+        trace.to_address = dict.get('to_address')
+        trace.value = dict.get('value')
+        trace.input = dict.get('input')
+        trace.output = dict.get('output')
+        trace.trace_type = dict.get('trace_type')
+        trace.call_type = dict.get('call_type')
+        trace.reward_type = dict.get('reward_type')
+        trace.gas = dict.get('gas')
+        trace.gas_used = dict.get('gas_used')
+        trace.subtraces = dict.get('subtraces')
+        trace.trace_address = dict.get('trace_address')
+        trace.error = dict.get('error')
+        trace.status = to_int_or_none(dict.get('status'))
+        trace.trace_id = dict.get('trace_id')
+        trace.trace_index = dict.get('trace_index')
+
+        return trace
+
     def trace_to_dict(self, trace):
         return {
             'type': 'trace',
@@ -0,0 +1,78 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import contextlib
+import re
+import time
+
+from blockchainetl.metrics import registry
+
+BATCH_ITEMS = registry.counter(
+    'ethereumetl_batch_items_total', 'Items processed by the batch work executor of a stage.', ['stage'])
+BATCH_DURATION = registry.histogram(
+    'ethereumetl_batch_duration_seconds', 'Time to process a batch, including retries.', ['stage'])
+BATCH_SIZE = registry.gauge(
+    'ethereumetl_batch_size', 'The current batch size of a stage.', ['stage'])
+BATCH_RETRIES = registry.counter(
+    'ethereumetl_batch_retries_total', 'Failed batches that were retried in parts.', ['stage'])
+REORDER_BUFFER_BATCHES = registry.gauge(
+    'ethereumetl_reorder_buffer_batches', 'Completed batches held back until the batches before them are exported.',
+    ['stage'])
+
+RPC_REQUESTS = registry.counter(
+    'ethereumetl_rpc_requests_total', 'JSON-RPC requests sent, counting every request in a batch.', ['method'])
+RPC_DURATION = registry.histogram(
+    'ethereumetl_rpc_duration_seconds', 'Latency of JSON-RPC requests, a batch counting as one.', ['method'])
+RPC_ERRORS = registry.counter(
+    'ethereumetl_rpc_errors_total', 'JSON-RPC requests that failed, a batch counting as one.', ['method'])
+
+RPC_METHOD_PATTERN = re.compile(r'"method":\s*"([^"]+)"')
+
+
+# Batches hold requests for a single method, so the first one names the batch
+def get_rpc_method(request_text):
+    match = RPC_METHOD_PATTERN.search(request_text)
+    return match.group(1) if match is not None else 'unknown'
+
+
+def track_rpc_batch(request_text):
+    return track_rpc_request(get_rpc_method(request_text), request_text.count('"method"'))
+
+
+@contextlib.contextmanager
+def track_rpc_request(method, request_count=1):
+    started_at = time.monotonic()
+    try:
+        yield
+    except Exception:
+        RPC_ERRORS.labels(method).inc()
+        raise
+    finally:
+        RPC_DURATION.labels(method).observe(time.monotonic() - started_at)
+        RPC_REQUESTS.labels(method).inc(request_count)
+
+
+# The stage of a work handler is the class it's defined in, e.g. ExportBlocksJob for ExportBlocksJob._export_batch
+def get_stage_name(work_handler):
+    qualified_name = getattr(work_handler, '__qualname__', type(work_handler).__name__)
+    return qualified_name.split('.')[0]
@@ -0,0 +1,17 @@
+from ethereumetl.misc.retriable_value_error import RetriableValueError
+
+
+# Raised when the node throttles requests, with HTTP 429 or a rate limit JSON-RPC error.
+# retry_after is the number of seconds to wait if the node specified it.
+class RateLimitedError(RetriableValueError):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    try:
+        return max(float(value), 0) if value is not None else None
+    except ValueError:
+        # HTTP dates are not supported
+        return None
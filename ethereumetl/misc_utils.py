@@ -22,10 +22,10 @@
 
 import contextlib
 import csv
-import json
 
 import six
 
+from blockchainetl import json_codec
 from ethereumetl.csv_utils import set_max_field_size_limit
 from blockchainetl.file_utils import get_file_handle, smart_open
 
@@ -38,7 +38,7 @@ def get_item_iterable(input_file):
         set_max_field_size_limit()
         reader = csv.DictReader(fh)
     else:
-        reader = (json.loads(line) for line in fh)
+        reader = (json_codec.loads(line) for line in fh)
 
     try:
         yield reader
@@ -64,7 +64,7 @@ def get_item_sink(output_file):
             writer.writerow(item)
     else:
         def sink(item):
-            fh.write(json.dumps(item) + '\n')
+            fh.write(json_codec.dumps_item(item) + '\n')
 
     try:
         yield sink
@@ -20,40 +20,83 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import json
 import logging
-from datetime import datetime
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
 
 from ethereumetl.atomic_counter import AtomicCounter
+from ethereumetl.metrics import RPC_REQUESTS
+
+_progress_output = None
+_progress_output_lock = threading.Lock()
+
+
+# Progress reports are also written as JSON lines to filename, for orchestrators to act on
+def configure_progress_output(filename):
+    global _progress_output
+    with _progress_output_lock:
+        if _progress_output is not None:
+            _progress_output.close()
+        _progress_output = open(filename, 'a') if filename is not None else None
+
+
+def write_progress_record(record):
+    with _progress_output_lock:
+        if _progress_output is not None:
+            _progress_output.write(json.dumps(record) + '\n')
+            _progress_output.flush()
 
 
 # Thread safe progress logger.
+# With log_interval_seconds, it also reports every that many seconds the items/s and RPC calls/s over the last
+# rate_window_seconds, and the ETA when the total is known. RPC calls are counted for the whole process.
 class ProgressLogger:
-    def __init__(self, name='work', logger=None, log_percentage_step=10, log_item_step=5000):
+    def __init__(self, name='work', logger=None, log_percentage_step=10, log_item_step=5000,
+                 log_interval_seconds=None, rate_window_seconds=300):
         self.name = name
         self.total_items = None
+        self.item_name = 'items'
 
         self.start_time = None
         self.end_time = None
         self.counter = AtomicCounter()
+        self.processed_items = 0
         self.log_percentage_step = log_percentage_step
         self.log_items_step = log_item_step
+        self.log_interval_seconds = log_interval_seconds
+        self.rate_window_seconds = rate_window_seconds
+        self._samples = deque()
+        self._stop_reporting = None
         if logger is not None:
             self.logger = logger
         else:
             self.logger = logging.getLogger('ProgressLogger')
 
-    def start(self, total_items=None):
+    def start(self, total_items=None, item_name='items'):
         self.total_items = total_items
+        self.item_name = item_name
         self.start_time = datetime.now()
         start_message = 'Started {}.'.format(self.name)
         if self.total_items is not None:
             start_message = start_message + ' Items to process: {}.'.format(self.total_items)
         self.logger.info(start_message)
 
+        self._samples = deque([(time.monotonic(), 0, RPC_REQUESTS.total())])
+        if self.log_interval_seconds is not None:
+            self._stop_reporting = threading.Event()
+            thread = threading.Thread(target=self._report_periodically, args=(self._stop_reporting,),
+                                      name='ProgressLogger', daemon=True)
+            thread.start()
+
     # A race condition is possible where a message for the same percentage is printed twice, but it's a minor issue
     def track(self, item_count=1):
         processed_items = self.counter.increment(item_count)
         processed_items_before = processed_items - item_count
+        if processed_items > self.processed_items:
+            self.processed_items = processed_items
 
         track_message = None
         if self.total_items is None:
@@ -69,7 +112,54 @@ class ProgressLogger:
         if track_message is not None:
             self.logger.info(track_message)
 
+    def report(self, now=None):
+        """Logs the rates and the ETA and writes them to the progress output. Returns the progress record."""
+        now = time.monotonic() if now is None else now
+        processed_items = self.processed_items
+        self._samples.append((now, processed_items, RPC_REQUESTS.total()))
+        while len(self._samples) > 2 and self._samples[1][0] <= now - self.rate_window_seconds:
+            self._samples.popleft()
+
+        first_time, first_processed_items, first_rpc_calls = self._samples[0]
+        elapsed_seconds = now - first_time
+        items_per_second = (processed_items - first_processed_items) / elapsed_seconds if elapsed_seconds > 0 else 0
+        rpc_calls_per_second = (self._samples[-1][2] - first_rpc_calls) / elapsed_seconds \
+            if elapsed_seconds > 0 else 0
+        eta_seconds = None
+        if self.total_items is not None and items_per_second > 0:
+            eta_seconds = max(self.total_items - processed_items, 0) / items_per_second
+
+        message = '{}: {} {} processed'.format(self.name, processed_items, self.item_name)
+        if self.total_items is not None:
+            message += ' of {}'.format(self.total_items)
+        message += ', {:.1f} {}/s, {:.1f} RPC calls/s'.format(items_per_second, self.item_name, rpc_calls_per_second)
+        if eta_seconds is not None:
+            message += ', ETA {}'.format(str(timedelta(seconds=int(eta_seconds))))
+        self.logger.info(message + '.')
+
+        record = {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'name': self.name,
+            'item_name': self.item_name,
+            'items_processed': processed_items,
+            'total_items': self.total_items,
+            'items_per_second': round(items_per_second, 3),
+            'rpc_calls_per_second': round(rpc_calls_per_second, 3),
+            'eta_seconds': round(eta_seconds, 1) if eta_seconds is not None else None,
+            'finished': False,
+        }
+        write_progress_record(record)
+        return record
+
+    def _report_periodically(self, stop_reporting):
+        while not stop_reporting.wait(self.log_interval_seconds):
+            self.report()
+
     def finish(self):
+        if self._stop_reporting is not None:
+            self._stop_reporting.set()
+            self._stop_reporting = None
+
         duration = None
         if self.start_time is not None:
             self.end_time = datetime.now()
@@ -80,3 +170,12 @@ class ProgressLogger:
             finish_message = finish_message + ' Took {}.'.format(str(duration))
 
         self.logger.info(finish_message)
+        write_progress_record({
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'name': self.name,
+            'item_name': self.item_name,
+            'items_processed': self.processed_items,
+            'total_items': self.total_items,
+            'finished': True,
+            'duration_seconds': duration.total_seconds() if duration is not None else None,
+        })
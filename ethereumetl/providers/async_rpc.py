@@ -0,0 +1,85 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import logging
+
+import aiohttp
+
+from blockchainetl import json_codec
+from ethereumetl.metrics import track_rpc_batch
+from ethereumetl.misc.rate_limited_error import RateLimitedError, parse_retry_after
+from ethereumetl.providers.batch_response import with_response_size
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+
+
+# Batch JSON-RPC provider for asyncio. All requests share one aiohttp session, so up to max_connections
+# keep-alive connections are reused by any number of in-flight batch requests.
+# The session is bound to the event loop it was created in; call close() before that loop is closed.
+class AsyncBatchHTTPProvider:
+
+    def __init__(self, endpoint_uri, timeout=60, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT):
+        self.endpoint_uri = endpoint_uri
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self.logger = logging.getLogger('AsyncBatchHTTPProvider')
+
+    async def make_batch_request(self, text):
+        raw_response = await self.make_raw_batch_request(text)
+        response = with_response_size(json_codec.loads(raw_response), len(raw_response))
+        self.logger.debug("Getting response HTTP. URI: %s, Request: %s, Response: %s",
+                          self.endpoint_uri, text, response)
+        return response
+
+    # Returns the undecoded response, so that decoding can be left to a worker process
+    async def make_raw_batch_request(self, text):
+        self.logger.debug("Making request HTTP. URI: %s, Request: %s", self.endpoint_uri, text)
+        session = self._get_session()
+        with track_rpc_batch(text):
+            async with session.post(self.endpoint_uri, data=text.encode('utf-8'),
+                                    headers={'Content-Type': 'application/json'}) as http_response:
+                if http_response.status == 429:
+                    raise RateLimitedError('Rate limited by {}'.format(self.endpoint_uri),
+                                           retry_after=parse_retry_after(http_response.headers.get('Retry-After')))
+                http_response.raise_for_status()
+                return await http_response.read()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+
+def is_async_provider(provider):
+    return asyncio.iscoroutinefunction(getattr(provider, 'make_batch_request', None))
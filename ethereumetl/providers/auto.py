@@ -25,15 +25,24 @@ from urllib.parse import urlparse
 
 from web3 import IPCProvider, HTTPProvider
 
+from ethereumetl.providers.async_rpc import AsyncBatchHTTPProvider
 from ethereumetl.providers.ipc import BatchIPCProvider
+from ethereumetl.providers.multi_endpoint import MultiEndpointBatchProvider
+from ethereumetl.providers.rate_limiter import AsyncRateLimitedBatchProvider, RateLimitedBatchProvider, \
+    get_rate_limiter
 from ethereumetl.providers.rpc import BatchHTTPProvider
+from ethereumetl.thread_local_proxy import ThreadLocalProxy
 
 DEFAULT_TIMEOUT = 60
 
 
-def get_provider_from_uri(uri_string, timeout=DEFAULT_TIMEOUT, batch=False):
+def get_provider_from_uri(uri_string, timeout=DEFAULT_TIMEOUT, batch=False, asynchronous=False):
     uri = urlparse(uri_string)
-    if uri.scheme == 'file':
+    if asynchronous:
+        if not batch or uri.scheme not in ('http', 'https'):
+            raise ValueError('Asyncio provider only supports batch requests over http and https {}'.format(uri_string))
+        return AsyncBatchHTTPProvider(uri_string, timeout=timeout)
+    elif uri.scheme == 'file':
         if batch:
             return BatchIPCProvider(uri.path, timeout=timeout)
         else:
@@ -47,3 +56,28 @@ def get_provider_from_uri(uri_string, timeout=DEFAULT_TIMEOUT, batch=False):
     else:
         raise ValueError('Unknown uri scheme {}'.format(uri_string))
 
+
+def get_batch_provider_from_uri(uri_string, use_asyncio=False, hedge_percentile=None,
+                                requests_per_second=None, compute_units_per_second=None):
+    uris = [uri.strip() for uri in uri_string.split(',')]
+
+    def rate_limited(provider, uri):
+        if requests_per_second is None and compute_units_per_second is None:
+            return provider
+        # Rate limiters are shared by all the providers of the same endpoint
+        rate_limiter = get_rate_limiter(uri, requests_per_second, compute_units_per_second)
+        if use_asyncio:
+            return AsyncRateLimitedBatchProvider(provider, rate_limiter)
+        return RateLimitedBatchProvider(provider, rate_limiter)
+
+    # Hedging also applies to a single uri, the duplicate request is likely to reach another node behind it
+    if len(uris) > 1 or hedge_percentile is not None:
+        if use_asyncio:
+            raise ValueError('Asyncio provider doesn\'t support multiple uris or hedging {}'.format(uri_string))
+        return MultiEndpointBatchProvider(
+            uris, lambda uri: rate_limited(ThreadLocalProxy(lambda: get_provider_from_uri(uri, batch=True)), uri),
+            hedge_percentile=hedge_percentile)
+    # The asyncio provider is shared by all the coroutines on one event loop, other providers are per thread
+    if use_asyncio:
+        return rate_limited(get_provider_from_uri(uris[0], batch=True, asynchronous=True), uris[0])
+    return rate_limited(ThreadLocalProxy(lambda: get_provider_from_uri(uris[0], batch=True)), uris[0])
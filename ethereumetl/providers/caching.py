@@ -0,0 +1,195 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from web3.providers.base import JSONBaseProvider
+
+from blockchainetl import json_codec
+from ethereumetl.json_rpc_requests import encode_json_rpc_batch
+from ethereumetl.misc.retriable_value_error import RetriableValueError
+from ethereumetl.providers.async_rpc import is_async_provider
+from ethereumetl.providers.segment_file_cache import SegmentFileCache
+
+DEFAULT_FINALITY_DEPTH = 64
+DEFAULT_CACHE_MAX_SIZE_MB = 10 * 1024
+HEAD_REFRESH_INTERVAL_SECONDS = 10
+
+
+def hex_to_block_number(value):
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.startswith('0x'):
+        return int(value, 16)
+    return None
+
+
+def block_number_from_first_param(params, result):
+    return hex_to_block_number(params[0]) if len(params) > 0 else None
+
+
+def block_number_from_result(params, result):
+    return hex_to_block_number(result.get('blockNumber')) if isinstance(result, dict) else None
+
+
+# Methods whose responses never change once the block they belong to is final,
+# mapped to a function returning that block number from the request params and the result
+CACHEABLE_METHODS = {
+    'eth_getBlockByNumber': block_number_from_first_param,
+    'eth_getTransactionReceipt': block_number_from_result,
+    'trace_block': block_number_from_first_param,
+    'debug_traceBlockByNumber': block_number_from_first_param,
+}
+
+
+def wrap_with_response_cache(provider, cache_dir, cache_max_size_mb=DEFAULT_CACHE_MAX_SIZE_MB,
+                             finality_depth=DEFAULT_FINALITY_DEPTH):
+    if cache_dir is None:
+        return provider
+    if is_async_provider(provider):
+        raise ValueError('Response cache is not supported with the asyncio provider')
+    cache = SegmentFileCache(cache_dir, max_size_bytes=cache_max_size_mb * 1024 * 1024)
+    return CachingBatchProvider(provider, cache, finality_depth=finality_depth)
+
+
+# Serves responses for finalized blocks from an on-disk cache, only the misses are sent to the node.
+# Cache keys are the hash of the method and params. A response is cached when the block it belongs to is
+# at least finality_depth blocks below the head, the head is polled with eth_blockNumber when needed.
+class CachingBatchProvider(JSONBaseProvider):
+
+    def __init__(self, provider, cache, finality_depth=DEFAULT_FINALITY_DEPTH):
+        super().__init__()
+        self.provider = provider
+        self.cache = cache
+        self.finality_depth = finality_depth
+        self.logger = logging.getLogger('CachingBatchProvider')
+        self._head_block = None
+        self._head_refreshed_at = 0
+        self._head_lock = threading.Lock()
+
+    def make_batch_request(self, text):
+        requests = json_codec.loads(text)
+        if not has_unique_ids(requests):
+            # Responses can't be matched to their requests
+            return self.provider.make_batch_request(text)
+        responses = [self._get_cached_response(request) for request in requests]
+        missing = [index for index, response in enumerate(responses) if response is None]
+        if len(missing) == 0:
+            return responses
+
+        missing_requests = [requests[index] for index in missing]
+        fetched = self.provider.make_batch_request(
+            text if len(missing) == len(requests) else encode_json_rpc_batch(missing_requests))
+        matched = match_batch_responses(missing_requests, fetched)
+        if matched is None:
+            # E.g. an error response for the whole batch, it is passed on to the caller but not cached
+            if len(missing) == len(requests):
+                return fetched
+            raise RetriableValueError('Unexpected batch response {}'.format(fetched))
+
+        self._cache_responses(zip(missing_requests, matched))
+        for index, response in zip(missing, matched):
+            responses[index] = response
+        return responses
+
+    def make_request(self, method, params):
+        request = {'jsonrpc': '2.0', 'method': method, 'params': list(params), 'id': None}
+        cached = self._get_cached_response(request)
+        if cached is not None:
+            return cached
+        response = self.provider.make_request(method, params)
+        self._cache_responses([(request, response)])
+        return response
+
+    def _get_cached_response(self, request):
+        key = cache_key(request)
+        result = self.cache.get(key) if key is not None else None
+        if result is None:
+            return None
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+
+    def _cache_responses(self, requests_and_responses):
+        items = []
+        for request, response in requests_and_responses:
+            key = cache_key(request)
+            result = response.get('result') if isinstance(response, dict) else None
+            if key is None or result is None:
+                continue
+            block_number = CACHEABLE_METHODS[request['method']](request.get('params', []), result)
+            if block_number is not None and self._is_final(block_number):
+                items.append((key, result))
+        self.cache.put_many(items)
+
+    def _is_final(self, block_number):
+        with self._head_lock:
+            if self._head_block is not None and block_number <= self._head_block - self.finality_depth:
+                return True
+            if time.time() - self._head_refreshed_at >= HEAD_REFRESH_INTERVAL_SECONDS:
+                self._refresh_head_block()
+            return self._head_block is not None and block_number <= self._head_block - self.finality_depth
+
+    def _refresh_head_block(self):
+        self._head_refreshed_at = time.time()
+        try:
+            response = self.provider.make_request('eth_blockNumber', [])
+            self._head_block = int(response['result'], 16)
+        except Exception:
+            self.logger.warning('Failed to get the head block, responses will not be cached.', exc_info=True)
+
+    def close(self):
+        self.logger.info('Response cache hits: {}, misses: {}.'.format(self.cache.hits, self.cache.misses))
+        self.cache.close()
+
+
+def close_response_cache(provider):
+    if isinstance(provider, CachingBatchProvider):
+        provider.close()
+
+
+def cache_key(request):
+    method = request.get('method')
+    if method not in CACHEABLE_METHODS:
+        return None
+    key_text = json.dumps([method, request.get('params', [])], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(key_text.encode('utf-8')).digest()
+
+
+def has_unique_ids(requests):
+    request_ids = [request.get('id') for request in requests]
+    return len(set(request_ids)) == len(request_ids)
+
+
+# Returns the responses in the order of the requests, or None when they can't all be matched by id.
+# Responses are never matched by position, a node may answer a batch in any order.
+def match_batch_responses(requests, responses):
+    if not isinstance(responses, list) or len(responses) != len(requests):
+        return None
+    responses_by_id = {response.get('id'): response for response in responses if isinstance(response, dict)}
+    request_ids = [request.get('id') for request in requests]
+    if set(responses_by_id.keys()) != set(request_ids):
+        return None
+    return [responses_by_id[request_id] for request_id in request_ids]
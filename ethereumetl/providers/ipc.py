@@ -21,63 +21,297 @@
 # SOFTWARE.
 
 
-import json
+import logging
 import socket
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
-from web3.providers.ipc import IPCProvider
+from web3.providers.ipc import IPCProvider, get_ipc_socket
 from web3._utils.threads import (
     Timeout,
 )
 
-try:
-    from json import JSONDecodeError
-except ImportError:
-    JSONDecodeError = ValueError
+from blockchainetl import json_codec
+from ethereumetl.json_rpc_requests import next_request_id
+from ethereumetl.metrics import track_rpc_batch, track_rpc_request
+from ethereumetl.providers.batch_response import with_response_size
+
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+MAX_IDLE_BUFFER_SIZE = 16 * 1024 * 1024
+
+DEFAULT_POOL_SIZE = 4
 
 
 # Mostly copied from web3.py/providers/ipc.py. Supports batch requests.
 # Will be removed once batch feature is added to web3.py https://github.com/ethereum/web3.py/issues/832
 # Also see this optimization https://github.com/ethereum/web3.py/pull/849
+# Batch requests go through a connection pool shared by all providers with the same ipc_path,
+# so a provider per thread (ThreadLocalProxy) doesn't mean a socket per thread.
 class BatchIPCProvider(IPCProvider):
-    _socket = None
+
+    def __init__(self, ipc_path=None, timeout=10, pool_size=DEFAULT_POOL_SIZE, *args, **kwargs):
+        super().__init__(ipc_path, timeout, *args, **kwargs)
+        self._connection_pool = get_ipc_connection_pool(self.ipc_path, pool_size)
 
     def make_batch_request(self, text):
-        request = text.encode('utf-8')
-        with self._lock, self._socket as sock:
-            try:
-                sock.sendall(request)
-            except BrokenPipeError:
-                # one extra attempt, then give up
-                sock = self._socket.reset()
-                sock.sendall(request)
-
-            raw_response = b""
-            with Timeout(self.timeout) as timeout:
-                while True:
-                    try:
-                        raw_response += sock.recv(4096)
-                    except socket.timeout:
-                        timeout.sleep(0)
-                        continue
-                    if raw_response == b"":
-                        timeout.sleep(0)
-                    elif has_valid_json_rpc_ending(raw_response):
-                        try:
-                            response = json.loads(raw_response.decode('utf-8'))
-                        except JSONDecodeError:
-                            timeout.sleep(0)
-                            continue
-                        else:
-                            return response
-                    else:
-                        timeout.sleep(0)
-                        continue
-
-
-# A valid JSON RPC response can only end in } or ] http://www.jsonrpc.org/specification
-def has_valid_json_rpc_ending(raw_response):
-    for valid_ending in [b"}\n", b"]\n"]:
-        if raw_response.endswith(valid_ending):
-            return True
-    else:
-        return False
+        with track_rpc_batch(text):
+            return self._connection_pool.make_batch_request(text, self.timeout)
+
+    def make_request(self, method, params):
+        with track_rpc_request(method):
+            return super().make_request(method, params)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_ipc_connection_pool(ipc_path, pool_size=DEFAULT_POOL_SIZE):
+    with _pools_lock:
+        pool = _pools.get(ipc_path)
+        if pool is None:
+            pool = IPCConnectionPool(ipc_path, pool_size)
+            _pools[ipc_path] = pool
+        return pool
+
+
+# A fixed number of IPC connections shared by all threads. Each request goes to the connection with the fewest
+# requests in flight, so callers don't wait for each other's responses.
+class IPCConnectionPool:
+    def __init__(self, ipc_path, pool_size=DEFAULT_POOL_SIZE):
+        self.ipc_path = ipc_path
+        self.pool_size = pool_size
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def make_batch_request(self, text, timeout):
+        return self._get_connection().make_request(text, timeout)
+
+    def _get_connection(self):
+        with self._lock:
+            self._connections = [connection for connection in self._connections if not connection.closed]
+            if len(self._connections) < self.pool_size:
+                connection = PipelinedIPCConnection(self.ipc_path)
+                self._connections.append(connection)
+                return connection
+            return min(self._connections, key=lambda c: c.in_flight_count)
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+
+
+# Sends requests on one socket without waiting for previous responses, a reader thread matches every response to its
+# request by id. Batches built with encode_json_rpc_batch have ids unique in the process and are sent as they are.
+# Other requests are decoded and their ids are replaced with unique ones, which are restored in the responses.
+class PipelinedIPCConnection:
+    def __init__(self, ipc_path):
+        self.sock = get_ipc_socket(ipc_path)
+        self.closed = False
+        # Maps a request id on the connection to the in-flight request it belongs to
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._reader = JsonRpcResponseReader(self.sock)
+        self.logger = logging.getLogger('PipelinedIPCConnection')
+        self._reader_thread = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader_thread.start()
+
+    @property
+    def in_flight_count(self):
+        return len(self._in_flight)
+
+    def make_request(self, text, timeout):
+        in_flight_request = InFlightRequest()
+        with self._in_flight_lock:
+            if self.closed:
+                raise ConnectionResetError('IPC connection is closed.')
+            request_ids = getattr(text, 'request_ids', None)
+            if self._can_send_as_is(request_ids):
+                data = text.encode('utf-8')
+                in_flight_request.request_ids = request_ids
+            else:
+                data = self._replace_ids(text, in_flight_request)
+            for request_id in in_flight_request.request_ids:
+                self._in_flight[request_id] = in_flight_request
+
+        try:
+            with self._send_lock:
+                self.sock.sendall(data)
+            return in_flight_request.future.result(timeout)
+        except FutureTimeoutError:
+            # A late response with a null id would otherwise close the connection under requests sent later, so the
+            # connection is not reused. Other requests in flight fail and are retried on a new connection.
+            error = socket.timeout('No response from the IPC connection in {} seconds.'.format(timeout))
+            self._fail(ConnectionResetError('IPC connection is closed after a timeout.'))
+            raise error
+        except OSError as e:
+            self._fail(e)
+            raise
+        finally:
+            self._remove(in_flight_request)
+
+    def _can_send_as_is(self, request_ids):
+        return request_ids is not None and None not in request_ids and len(set(request_ids)) == len(request_ids) \
+            and not any(request_id in self._in_flight for request_id in request_ids)
+
+    @staticmethod
+    def _replace_ids(text, in_flight_request):
+        request = json_codec.loads(text)
+        for request_item in request if isinstance(request, list) else [request]:
+            request_id = next_request_id()
+            in_flight_request.original_ids[request_id] = request_item.get('id')
+            request_item['id'] = request_id
+        in_flight_request.request_ids = list(in_flight_request.original_ids)
+        return json_codec.dumps_bytes(request)
+
+    def _read_responses(self):
+        try:
+            while True:
+                response = self._reader.read_response(timeout=None)
+                self._complete(response)
+        except Exception as e:
+            if not self.closed:
+                self.logger.exception('An exception occurred while reading from the IPC connection.')
+            self._fail(e)
+
+    def _complete(self, response):
+        response_items = response if isinstance(response, list) else [response]
+        response_ids = [response_item.get('id') for response_item in response_items]
+        with self._in_flight_lock:
+            in_flight_request = next(
+                (self._in_flight[response_id] for response_id in response_ids if response_id in self._in_flight),
+                None)
+            if in_flight_request is not None:
+                self._remove_locked(in_flight_request)
+            has_null_ids = in_flight_request is None and len(self._in_flight) > 0 \
+                and all(response_id is None for response_id in response_ids)
+
+        if has_null_ids:
+            # Errors like "parse error" have a null id. The node handles requests concurrently, so there's no telling
+            # which request the response belongs to. All requests in flight fail and are retried on a new connection.
+            self.logger.warning('Closing the IPC connection after a response with a null id {}'.format(
+                str(response)[:200]))
+            self._fail(ConnectionResetError('IPC connection is closed after a response with a null id.'))
+            return
+
+        if in_flight_request is None:
+            self.logger.warning('Dropped a response for an unknown request {}'.format(str(response)[:200]))
+            return
+
+        if in_flight_request.original_ids:
+            for response_item in response_items:
+                if response_item.get('id') in in_flight_request.original_ids:
+                    response_item['id'] = in_flight_request.original_ids[response_item['id']]
+        in_flight_request.future.set_result(response)
+
+    def _remove(self, in_flight_request):
+        with self._in_flight_lock:
+            self._remove_locked(in_flight_request)
+
+    def _remove_locked(self, in_flight_request):
+        for request_id in in_flight_request.request_ids:
+            self._in_flight.pop(request_id, None)
+
+    def _fail(self, exception):
+        with self._in_flight_lock:
+            self.closed = True
+            in_flight_requests = set(self._in_flight.values())
+            self._in_flight = {}
+        for in_flight_request in in_flight_requests:
+            in_flight_request.future.set_exception(exception)
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def close(self):
+        self._fail(ConnectionResetError('IPC connection is closed.'))
+
+
+class InFlightRequest:
+    def __init__(self):
+        self.future = Future()
+        self.request_ids = []
+        # Maps replaced request ids to the original ones
+        self.original_ids = {}
+
+
+# Reads JSON-RPC responses from a socket into one reusable bytearray with recv_into, so received bytes are never
+# concatenated. The node terminates every response with a newline, which is used as the frame boundary:
+# only the newly received bytes are searched for it, and each response is decoded exactly once.
+class JsonRpcResponseReader:
+    def __init__(self, sock, chunk_size=READ_CHUNK_SIZE):
+        self.sock = sock
+        self.chunk_size = chunk_size
+        self._buffer = bytearray(chunk_size)
+        # Unconsumed data is in self._buffer[self._start:self._end]
+        self._start = 0
+        self._end = 0
+        # Position up to which the unconsumed data has been searched for the frame boundary
+        self._scanned = 0
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        except (AttributeError, OSError):
+            pass
+
+    def read_response(self, timeout):
+        with Timeout(timeout) as timeout:
+            while True:
+                response = self._next_framed_response()
+                if response is not None:
+                    return response
+                try:
+                    self._receive()
+                except socket.timeout:
+                    timeout.sleep(0)
+
+    def _next_framed_response(self):
+        while True:
+            boundary = self._buffer.find(b'\n', self._scanned, self._end)
+            if boundary == -1:
+                self._scanned = self._end
+                return None
+            frame = self._buffer[self._start:boundary]
+            self._consume(boundary + 1)
+            # Skip empty lines between responses
+            if frame and not frame.isspace():
+                return with_response_size(json_codec.loads(frame), len(frame))
+
+    def _consume(self, position):
+        self._start = position
+        self._scanned = position
+        if self._start == self._end:
+            self._start = self._end = self._scanned = 0
+            if len(self._buffer) > MAX_IDLE_BUFFER_SIZE:
+                self._buffer = bytearray(self.chunk_size)
+
+    def _receive(self):
+        self._reserve(self.chunk_size)
+        with memoryview(self._buffer) as view:
+            if hasattr(self.sock, 'recv_into'):
+                received = self.sock.recv_into(view[self._end:])
+            else:
+                # Windows named pipes don't support recv_into
+                data = self.sock.recv(len(view) - self._end)
+                received = len(data)
+                view[self._end:self._end + received] = data
+        if received == 0:
+            raise ConnectionResetError('IPC connection was closed by the node.')
+        self._end += received
+
+    def _reserve(self, size):
+        if len(self._buffer) - self._end >= size:
+            return
+        if self._start > 0:
+            # Deleting from the front of a bytearray doesn't move the remaining data
+            del self._buffer[:self._start]
+            self._end -= self._start
+            self._scanned -= self._start
+            self._start = 0
+        if len(self._buffer) - self._end < size:
+            self._buffer.extend(bytes(max(size, len(self._buffer))))
+
@@ -0,0 +1,267 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import collections
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from requests.exceptions import Timeout as RequestsTimeout, HTTPError, TooManyRedirects
+from web3._utils.threads import Timeout as Web3Timeout
+from web3.providers.base import JSONBaseProvider
+
+from ethereumetl.misc.rate_limited_error import RateLimitedError
+
+FAILOVER_EXCEPTIONS = (ConnectionError, HTTPError, RequestsTimeout, TooManyRedirects, Web3Timeout, OSError,
+                       RateLimitedError)
+
+DEFAULT_HEALTH_CHECK_INTERVAL_SECONDS = 15
+DEFAULT_MAX_HEAD_LAG = 5
+LATENCY_SMOOTHING = 0.2
+ERROR_RATE_SMOOTHING = 0.1
+ERROR_RATE_PENALTY = 10
+MIN_COOLDOWN_SECONDS = 1
+MAX_COOLDOWN_SECONDS = 60
+
+LATENCY_WINDOW_SIZE = 1000
+MIN_LATENCY_SAMPLES_FOR_HEDGING = 20
+DEFAULT_MAX_HEDGE_RATIO = 0.1
+# Hedged requests run both attempts on this pool, so it bounds the number of concurrent requests
+HEDGE_EXECUTOR_MAX_WORKERS = 256
+
+
+# Routes requests between several nodes. Each endpoint's latency, error rate and head block are tracked from
+# the requests it serves and from periodic eth_blockNumber health checks. A request goes to a healthy endpoint
+# chosen with probability inversely proportional to its latency, and fails over to the next best endpoint
+# if it raises a connection error. Endpoints that fail are put on an exponential cooldown, endpoints whose head
+# is more than max_head_lag blocks behind the best head are skipped while there are others.
+# With hedge_percentile set, a request that has not returned after that percentile of recent latencies is sent
+# again to the next endpoint (or the same one when there is only one e.g. behind a load balancer), and the first
+# response wins. At most max_hedge_ratio of requests are hedged so that a slow cluster is not flooded.
+class MultiEndpointBatchProvider(JSONBaseProvider):
+
+    def __init__(self, endpoint_uris, provider_factory,
+                 health_check_interval_seconds=DEFAULT_HEALTH_CHECK_INTERVAL_SECONDS,
+                 max_head_lag=DEFAULT_MAX_HEAD_LAG,
+                 hedge_percentile=None,
+                 max_hedge_ratio=DEFAULT_MAX_HEDGE_RATIO):
+        super().__init__()
+        if len(endpoint_uris) == 0:
+            raise ValueError('At least one endpoint uri is required')
+        self.endpoints = [Endpoint(uri, provider_factory(uri)) for uri in endpoint_uris]
+        self.health_check_interval_seconds = health_check_interval_seconds
+        self.max_head_lag = max_head_lag
+        self._lock = threading.Lock()
+        self._health_check_thread = None
+        self._closed = threading.Event()
+        self.logger = logging.getLogger('MultiEndpointBatchProvider')
+
+        if hedge_percentile is not None and not 0 < hedge_percentile < 100:
+            raise ValueError('hedge_percentile must be between 0 and 100')
+        self.hedge_percentile = hedge_percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW_SIZE)
+        self._request_count = 0
+        self._hedged_count = 0
+        self._hedge_executor = None
+
+    def make_batch_request(self, text):
+        return self._execute(lambda provider: provider.make_batch_request(text))
+
+    def make_request(self, method, params):
+        return self._execute(lambda provider: provider.make_request(method, params))
+
+    def _execute(self, request_func):
+        self._start_health_checks()
+        endpoints = self._select_endpoints()
+        hedge_deadline = self._get_hedge_deadline()
+        if hedge_deadline is not None:
+            return self._execute_hedged(request_func, endpoints, hedge_deadline)
+        return self._execute_with_failover(request_func, endpoints)
+
+    def _execute_with_failover(self, request_func, endpoints):
+        for index, endpoint in enumerate(endpoints):
+            try:
+                return self._call(endpoint, request_func)
+            except FAILOVER_EXCEPTIONS:
+                if index == len(endpoints) - 1:
+                    raise
+                self.logger.exception('Request to {} failed, failing over to {}.'.format(
+                    endpoint.uri, endpoints[index + 1].uri))
+
+    def _execute_hedged(self, request_func, endpoints, hedge_deadline):
+        primary = self._hedge_executor.submit(self._call, endpoints[0], request_func)
+        done, _ = wait([primary], timeout=hedge_deadline)
+        if len(done) > 0 or not self._acquire_hedge():
+            try:
+                return primary.result()
+            except FAILOVER_EXCEPTIONS:
+                if len(endpoints) == 1:
+                    raise
+                return self._execute_with_failover(request_func, endpoints[1:])
+
+        hedge_endpoint = endpoints[1] if len(endpoints) > 1 else endpoints[0]
+        self.logger.debug('Request to {} takes longer than {:.3f}s, hedging to {}.'.format(
+            endpoints[0].uri, hedge_deadline, hedge_endpoint.uri))
+        pending = {primary, self._hedge_executor.submit(self._call, hedge_endpoint, request_func)}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower request is left to finish in the background, it still updates the latency stats
+                    return future.result()
+            if len(pending) == 0:
+                remaining_endpoints = endpoints[2:]
+                if len(remaining_endpoints) == 0:
+                    return future.result()
+                return self._execute_with_failover(request_func, remaining_endpoints)
+
+    def _call(self, endpoint, request_func):
+        start_time = time.time()
+        try:
+            response = request_func(endpoint.provider)
+        except FAILOVER_EXCEPTIONS:
+            self._record_failure(endpoint)
+            raise
+        self._record_response(endpoint, time.time() - start_time, response)
+        return response
+
+    def _get_hedge_deadline(self):
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            self._request_count += 1
+            if len(self._latencies) < MIN_LATENCY_SAMPLES_FOR_HEDGING:
+                return None
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_EXECUTOR_MAX_WORKERS)
+            latencies = sorted(self._latencies)
+        return latencies[min(int(len(latencies) * self.hedge_percentile / 100), len(latencies) - 1)]
+
+    def _acquire_hedge(self):
+        with self._lock:
+            if self._hedged_count >= self.max_hedge_ratio * self._request_count:
+                return False
+            self._hedged_count += 1
+            return True
+
+    def _select_endpoints(self):
+        now = time.time()
+        with self._lock:
+            heads = [endpoint.head_block for endpoint in self.endpoints if endpoint.head_block is not None]
+            min_head = max(heads) - self.max_head_lag if len(heads) > 0 else None
+            healthy = [endpoint for endpoint in self.endpoints if endpoint.is_healthy(now, min_head)]
+            unhealthy = [endpoint for endpoint in self.endpoints if endpoint not in healthy]
+            known_latencies = [endpoint.latency for endpoint in self.endpoints if endpoint.latency is not None]
+            # Endpoints without measurements are scored as the fastest one so that they get probed
+            default_latency = min(known_latencies) if len(known_latencies) > 0 else 1
+            scores = {endpoint.uri: endpoint.score(default_latency) for endpoint in self.endpoints}
+
+        ordered_unhealthy = sorted(unhealthy, key=lambda endpoint: scores[endpoint.uri])
+        if len(healthy) == 0:
+            return ordered_unhealthy
+
+        first = random.choices(healthy, weights=[1 / scores[endpoint.uri] for endpoint in healthy])[0]
+        rest = sorted((endpoint for endpoint in healthy if endpoint is not first),
+                      key=lambda endpoint: scores[endpoint.uri])
+        return [first] + rest + ordered_unhealthy
+
+    def _record_response(self, endpoint, latency, response):
+        # JSON-RPC errors in the response e.g. from a node that is not synced count towards the error rate
+        # but don't trigger failover, they are handled by the caller. A null result e.g. for a receipt of a pending
+        # transaction is a valid response.
+        has_errors = any(item.get('error') is not None for item in response) \
+            if isinstance(response, list) else response.get('error') is not None
+        with self._lock:
+            endpoint.record_success(latency, has_errors)
+            self._latencies.append(latency)
+
+    def _record_failure(self, endpoint):
+        with self._lock:
+            endpoint.record_failure(time.time())
+
+    def _start_health_checks(self):
+        if self._health_check_thread is not None or self.health_check_interval_seconds is None:
+            return
+        with self._lock:
+            if self._health_check_thread is None:
+                self._health_check_thread = threading.Thread(target=self._run_health_checks, daemon=True)
+                self._health_check_thread.start()
+
+    def _run_health_checks(self):
+        while not self._closed.is_set():
+            for endpoint in self.endpoints:
+                self.check_health(endpoint)
+            self._closed.wait(self.health_check_interval_seconds)
+
+    def check_health(self, endpoint):
+        start_time = time.time()
+        try:
+            response = endpoint.provider.make_request('eth_blockNumber', [])
+            head_block = int(response['result'], 16)
+        except Exception:
+            self.logger.warning('Health check of {} failed.'.format(endpoint.uri), exc_info=True)
+            self._record_failure(endpoint)
+            return
+        with self._lock:
+            endpoint.head_block = head_block
+            endpoint.record_success(time.time() - start_time, False)
+
+    def close(self):
+        self._closed.set()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+
+
+class Endpoint:
+    def __init__(self, uri, provider):
+        self.uri = uri
+        self.provider = provider
+        self.latency = None
+        self.error_rate = 0.0
+        self.head_block = None
+        self.consecutive_failures = 0
+        self.cooldown_until = 0
+
+    def is_healthy(self, now, min_head):
+        if now < self.cooldown_until:
+            return False
+        return min_head is None or self.head_block is None or self.head_block >= min_head
+
+    def score(self, default_latency):
+        latency = self.latency if self.latency is not None else default_latency
+        return max(latency, 0.001) * (1 + ERROR_RATE_PENALTY * self.error_rate)
+
+    def record_success(self, latency, has_errors):
+        self.latency = latency if self.latency is None \
+            else (1 - LATENCY_SMOOTHING) * self.latency + LATENCY_SMOOTHING * latency
+        self.error_rate = (1 - ERROR_RATE_SMOOTHING) * self.error_rate + ERROR_RATE_SMOOTHING * has_errors
+        self.consecutive_failures = 0
+        self.cooldown_until = 0
+
+    def record_failure(self, now):
+        self.error_rate = (1 - ERROR_RATE_SMOOTHING) * self.error_rate + ERROR_RATE_SMOOTHING
+        self.consecutive_failures += 1
+        cooldown = min(MIN_COOLDOWN_SECONDS * 2 ** (self.consecutive_failures - 1), MAX_COOLDOWN_SECONDS)
+        self.cooldown_until = now + cooldown
@@ -0,0 +1,211 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import logging
+import threading
+import time
+
+from web3.providers.base import JSONBaseProvider
+
+from blockchainetl import json_codec
+from ethereumetl.misc.rate_limited_error import RateLimitedError
+from ethereumetl.utils import is_rate_limit_error
+
+# Approximate compute unit costs of the methods used by the exporters, as billed by hosted node providers
+COMPUTE_UNITS = {
+    'eth_blockNumber': 10,
+    'eth_getBlockByNumber': 16,
+    'eth_getTransactionReceipt': 15,
+    'eth_getCode': 19,
+    'eth_call': 26,
+    'eth_getLogs': 75,
+    'trace_block': 24,
+    'debug_traceBlockByNumber': 309,
+}
+DEFAULT_COMPUTE_UNITS = 20
+
+# The rate is halved when the node throttles requests and recovers by this fraction of the limit per second
+MIN_RATE_FRACTION = 0.1
+RATE_RECOVERY_PER_SECOND = 0.05
+INITIAL_RATE_LIMITED_BACKOFF_SECONDS = 1
+MAX_RATE_LIMITED_BACKOFF_SECONDS = 30
+
+
+# Token bucket refilled at rate tokens per second up to capacity. Reservations can take the bucket below zero,
+# so a batch costing more than the capacity still goes through after waiting for the deficit to refill.
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def reserve(self, tokens, now):
+        self._refill(now)
+        self._tokens -= tokens
+        return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+# Limits requests per second and compute units per second sent to one endpoint. It's shared by all the threads
+# sending requests to the endpoint. When the endpoint throttles, requests are paused for the retry-after period
+# (or an exponential backoff) and the rates are halved, then they recover gradually to the configured limits.
+class EndpointRateLimiter:
+    def __init__(self, requests_per_second=None, compute_units_per_second=None):
+        self.requests_per_second = requests_per_second
+        self.compute_units_per_second = compute_units_per_second
+        self._request_bucket = TokenBucket(requests_per_second) if requests_per_second is not None else None
+        self._compute_unit_bucket = TokenBucket(compute_units_per_second) \
+            if compute_units_per_second is not None else None
+        self._rate_fraction = 1.0
+        self._rate_updated_at = time.monotonic()
+        self._paused_until = 0
+        self._backoff_seconds = INITIAL_RATE_LIMITED_BACKOFF_SECONDS
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger('EndpointRateLimiter')
+
+    def acquire(self, requests):
+        time.sleep(self.reserve(requests))
+
+    async def acquire_async(self, requests):
+        await asyncio.sleep(self.reserve(requests))
+
+    # Returns the number of seconds to wait before sending the requests
+    def reserve(self, requests):
+        compute_units = sum(COMPUTE_UNITS.get(request.get('method'), DEFAULT_COMPUTE_UNITS) for request in requests)
+        with self._lock:
+            now = time.monotonic()
+            self._recover_rate(now)
+            wait_seconds = max(self._paused_until - now, 0)
+            if self._request_bucket is not None:
+                wait_seconds = max(wait_seconds, self._request_bucket.reserve(len(requests), now))
+            if self._compute_unit_bucket is not None:
+                wait_seconds = max(wait_seconds, self._compute_unit_bucket.reserve(compute_units, now))
+            return wait_seconds
+
+    def on_success(self):
+        with self._lock:
+            self._backoff_seconds = INITIAL_RATE_LIMITED_BACKOFF_SECONDS
+
+    def on_rate_limited(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            # Requests that were in flight together are throttled together, that counts as one signal
+            if now < self._paused_until:
+                return
+            pause_seconds = retry_after if retry_after is not None else self._backoff_seconds
+            self._backoff_seconds = min(self._backoff_seconds * 2, MAX_RATE_LIMITED_BACKOFF_SECONDS)
+            self._paused_until = now + pause_seconds
+            self._set_rate_fraction(max(self._rate_fraction / 2, MIN_RATE_FRACTION), now)
+        self.logger.warning('Rate limited, pausing requests for {:.1f}s and reducing the rate to {:.0%} of the limit.'
+                            .format(pause_seconds, self._rate_fraction))
+
+    def _recover_rate(self, now):
+        if self._rate_fraction < 1.0:
+            recovered = self._rate_fraction + (now - self._rate_updated_at) * RATE_RECOVERY_PER_SECOND
+            self._set_rate_fraction(min(recovered, 1.0), now)
+
+    def _set_rate_fraction(self, rate_fraction, now):
+        self._rate_fraction = rate_fraction
+        self._rate_updated_at = now
+        for bucket, limit in ((self._request_bucket, self.requests_per_second),
+                              (self._compute_unit_bucket, self.compute_units_per_second)):
+            if bucket is not None:
+                bucket._refill(now)
+                bucket.rate = limit * rate_fraction
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(endpoint_uri, requests_per_second=None, compute_units_per_second=None):
+    key = (endpoint_uri, requests_per_second, compute_units_per_second)
+    with _rate_limiters_lock:
+        rate_limiter = _rate_limiters.get(key)
+        if rate_limiter is None:
+            rate_limiter = EndpointRateLimiter(requests_per_second, compute_units_per_second)
+            _rate_limiters[key] = rate_limiter
+        return rate_limiter
+
+
+def parse_requests(text):
+    requests = json_codec.loads(text)
+    return requests if isinstance(requests, list) else [requests]
+
+
+def check_rate_limited(response):
+    for response_item in response if isinstance(response, list) else [response]:
+        if isinstance(response_item, dict) and is_rate_limit_error(response_item.get('error')):
+            raise RateLimitedError('Rate limited: {}'.format(response_item.get('error')))
+
+
+# Sends requests through the endpoint's rate limiter. Rate limit errors in responses are raised
+# as RateLimitedError for the whole batch so that the executor backs off instead of splitting the batch.
+class RateLimitedBatchProvider(JSONBaseProvider):
+    def __init__(self, provider, rate_limiter):
+        super().__init__()
+        self.provider = provider
+        self.rate_limiter = rate_limiter
+
+    def make_batch_request(self, text):
+        self.rate_limiter.acquire(parse_requests(text))
+        return self._handle_response(lambda: self.provider.make_batch_request(text))
+
+    def make_request(self, method, params):
+        self.rate_limiter.acquire([{'method': method}])
+        return self._handle_response(lambda: self.provider.make_request(method, params))
+
+    def _handle_response(self, request_func):
+        try:
+            response = request_func()
+            check_rate_limited(response)
+        except RateLimitedError as e:
+            self.rate_limiter.on_rate_limited(e.retry_after)
+            raise
+        self.rate_limiter.on_success()
+        return response
+
+
+class AsyncRateLimitedBatchProvider:
+    def __init__(self, provider, rate_limiter):
+        self.provider = provider
+        self.rate_limiter = rate_limiter
+
+    async def make_batch_request(self, text):
+        await self.rate_limiter.acquire_async(parse_requests(text))
+        try:
+            response = await self.provider.make_batch_request(text)
+            check_rate_limited(response)
+        except RateLimitedError as e:
+            self.rate_limiter.on_rate_limited(e.retry_after)
+            raise
+        self.rate_limiter.on_success()
+        return response
+
+    async def close(self):
+        await self.provider.close()
@@ -21,25 +21,58 @@
 # SOFTWARE.
 
 
+from requests.exceptions import HTTPError
 from web3 import HTTPProvider
 from web3._utils.request import make_post_request
 
+from blockchainetl import json_codec
+from ethereumetl.metrics import track_rpc_batch, track_rpc_request
+from ethereumetl.misc.rate_limited_error import RateLimitedError, parse_retry_after
+from ethereumetl.providers.batch_response import with_response_size
+
 
 # Mostly copied from web3.py/providers/rpc.py. Supports batch requests.
 # Will be removed once batch feature is added to web3.py https://github.com/ethereum/web3.py/issues/832
 class BatchHTTPProvider(HTTPProvider):
 
     def make_batch_request(self, text):
-        self.logger.debug("Making request HTTP. URI: %s, Request: %s",
-                          self.endpoint_uri, text)
-        request_data = text.encode('utf-8')
-        raw_response = make_post_request(
-            self.endpoint_uri,
-            request_data,
-            **self.get_request_kwargs()
-        )
-        response = self.decode_rpc_response(raw_response)
+        raw_response = self.make_raw_batch_request(text)
+        response = with_response_size(self.decode_rpc_response(raw_response), len(raw_response))
         self.logger.debug("Getting response HTTP. URI: %s, "
                           "Request: %s, Response: %s",
                           self.endpoint_uri, text, response)
         return response
+
+    # Returns the undecoded response, so that decoding can be left to a worker process
+    def make_raw_batch_request(self, text):
+        self.logger.debug("Making request HTTP. URI: %s, Request: %s",
+                          self.endpoint_uri, text)
+        request_data = text.encode('utf-8')
+        try:
+            with track_rpc_batch(text):
+                return make_post_request(
+                    self.endpoint_uri,
+                    request_data,
+                    **self.get_request_kwargs()
+                )
+        except HTTPError as e:
+            raise_if_rate_limited(e)
+            raise
+
+    def make_request(self, method, params):
+        try:
+            with track_rpc_request(method):
+                return super().make_request(method, params)
+        except HTTPError as e:
+            raise_if_rate_limited(e)
+            raise
+
+    def decode_rpc_response(self, raw_response):
+        return json_codec.loads(raw_response)
+
+
+def raise_if_rate_limited(http_error):
+    response = http_error.response
+    if response is not None and response.status_code == 429:
+        raise RateLimitedError('Rate limited by {}'.format(response.url),
+                               retry_after=parse_retry_after(response.headers.get('Retry-After'))) from http_error
@@ -0,0 +1,177 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+from blockchainetl import json_codec
+
+DEFAULT_MAX_SIZE_BYTES = 10 * 1024 * 1024 * 1024
+DEFAULT_SEGMENT_SIZE_BYTES = 64 * 1024 * 1024
+
+INDEX_FILE_NAME = 'index.sqlite'
+SEGMENT_FILE_NAME_FORMAT = 'segment-{:08d}.bin'
+SEGMENT_FILE_NAME_PATTERN = re.compile(r'^segment-(\d{8})\.bin$')
+
+
+# Key-value store for immutable values. Values are zlib compressed JSON appended to segment files,
+# an sqlite index maps each key to its segment, offset and length. Segments are written one at a time and
+# when the total size exceeds max_size_bytes the oldest segments are deleted together with their index entries.
+# The cache can be shared between threads, it is not safe to share a directory between processes.
+class SegmentFileCache:
+    def __init__(self, directory, max_size_bytes=DEFAULT_MAX_SIZE_BYTES,
+                 segment_size_bytes=DEFAULT_SEGMENT_SIZE_BYTES):
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        self.segment_size_bytes = segment_size_bytes
+        self.logger = logging.getLogger('SegmentFileCache')
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._index = sqlite3.connect(os.path.join(directory, INDEX_FILE_NAME), check_same_thread=False)
+        self._index.execute('PRAGMA journal_mode=WAL')
+        self._index.execute('PRAGMA synchronous=NORMAL')
+        self._index.execute('CREATE TABLE IF NOT EXISTS entries '
+                            '(key BLOB PRIMARY KEY, segment INTEGER, offset INTEGER, length INTEGER)')
+        self._index.execute('CREATE INDEX IF NOT EXISTS entries_segment ON entries (segment)')
+        self._index.commit()
+
+        self._segment_sizes = self._scan_segments()
+        self._readers = {}
+        self._writer = None
+        self._writer_segment = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._index.execute(
+                'SELECT segment, offset, length FROM entries WHERE key = ?', (key,)).fetchone()
+            data = self._read(*row) if row is not None else None
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            return json_codec.loads(zlib.decompress(data))
+        except zlib.error:
+            self.logger.warning('Cache entry for key {} is corrupted.'.format(key.hex()))
+            return None
+
+    def put_many(self, items):
+        compressed = [(key, zlib.compress(json_codec.dumps_bytes(value)))
+                      for key, value in items]
+        if len(compressed) == 0:
+            return
+        with self._lock:
+            rows = []
+            for key, data in compressed:
+                segment, offset = self._append(data)
+                rows.append((key, segment, offset, len(data)))
+            self._writer.flush()
+            # Data is flushed before it's indexed so a crash can only leave unreferenced bytes in a segment
+            self._index.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', rows)
+            self._index.commit()
+            self._evict()
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def size_bytes(self):
+        with self._lock:
+            return sum(self._segment_sizes.values())
+
+    def close(self):
+        with self._lock:
+            for reader in self._readers.values():
+                reader.close()
+            self._readers = {}
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._index.close()
+
+    def _read(self, segment, offset, length):
+        reader = self._readers.get(segment)
+        if reader is None:
+            try:
+                reader = open(self._segment_path(segment), 'rb')
+            except FileNotFoundError:
+                return None
+            self._readers[segment] = reader
+        reader.seek(offset)
+        data = reader.read(length)
+        if len(data) != length:
+            self.logger.warning('Entry in segment {} at offset {} is truncated.'.format(segment, offset))
+            return None
+        return data
+
+    def _append(self, data):
+        if self._writer is None or self._segment_sizes[self._writer_segment] >= self.segment_size_bytes:
+            self._open_next_segment()
+        segment = self._writer_segment
+        offset = self._segment_sizes[segment]
+        self._writer.write(data)
+        self._segment_sizes[segment] = offset + len(data)
+        return segment, offset
+
+    def _open_next_segment(self):
+        last_segment = max(self._segment_sizes.keys(), default=0)
+        if self._writer is not None:
+            self._writer.close()
+            segment = last_segment + 1
+        elif last_segment > 0 and self._segment_sizes[last_segment] < self.segment_size_bytes:
+            # Keep appending to the last segment left by a previous run
+            segment = last_segment
+        else:
+            segment = last_segment + 1
+        self._writer = open(self._segment_path(segment), 'ab')
+        self._writer_segment = segment
+        self._segment_sizes[segment] = self._writer.tell()
+
+    def _evict(self):
+        while sum(self._segment_sizes.values()) > self.max_size_bytes and len(self._segment_sizes) > 1:
+            segment = min(self._segment_sizes.keys())
+            self.logger.info('Evicting cache segment {}.'.format(segment))
+            self._index.execute('DELETE FROM entries WHERE segment = ?', (segment,))
+            self._index.commit()
+            reader = self._readers.pop(segment, None)
+            if reader is not None:
+                reader.close()
+            os.remove(self._segment_path(segment))
+            del self._segment_sizes[segment]
+
+    def _scan_segments(self):
+        segment_sizes = {}
+        for file_name in os.listdir(self.directory):
+            match = SEGMENT_FILE_NAME_PATTERN.match(file_name)
+            if match is not None:
+                segment_sizes[int(match.group(1))] = os.path.getsize(os.path.join(self.directory, file_name))
+        return segment_sizes
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, SEGMENT_FILE_NAME_FORMAT.format(segment))
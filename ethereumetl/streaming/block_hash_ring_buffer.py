@@ -0,0 +1,60 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from collections import deque
+
+
+# Keeps the number, hash and timestamp of the latest max_size consecutive blocks, to detect reorgs by comparing the
+# parent hash of the next block with the hash of the last one, and to find the fork point
+class BlockHashRingBuffer:
+    def __init__(self, max_size):
+        if max_size <= 0:
+            raise ValueError('max_size must be greater than 0')
+        self._blocks = deque(maxlen=max_size)
+
+    def add(self, block):
+        if self._blocks and block['number'] != self._blocks[-1]['number'] + 1:
+            # Blocks that don't follow the previous ones can't be checked against them
+            self._blocks.clear()
+        self._blocks.append({'number': block['number'], 'hash': block['hash'], 'timestamp': block['timestamp']})
+
+    def get(self, block_number):
+        if not self._blocks:
+            return None
+        index = block_number - self._blocks[0]['number']
+        if index < 0 or index >= len(self._blocks):
+            return None
+        return self._blocks[index]
+
+    def first_block_number(self):
+        return self._blocks[0]['number'] if self._blocks else None
+
+    # Removes and returns the blocks after fork_block, in ascending order
+    def rewind(self, fork_block):
+        removed = []
+        while self._blocks and self._blocks[-1]['number'] > fork_block:
+            removed.append(self._blocks.pop())
+        return list(reversed(removed))
+
+    def __len__(self):
+        return len(self._blocks)
@@ -2,13 +2,28 @@ import logging
 
 from blockchainetl.jobs.exporters.console_item_exporter import ConsoleItemExporter
 from blockchainetl.jobs.exporters.in_memory_item_exporter import InMemoryItemExporter
+from blockchainetl.jobs.exporters.in_memory_object_exporter import InMemoryObjectExporter
+from blockchainetl.profiling import span
+from ethereumetl.domain.contract import EthContract
+from ethereumetl.domain.receipt import EthReceipt
+from ethereumetl.domain.receipt_log import EthReceiptLog
+from ethereumetl.domain.token_transfer import EthTokenTransfer
+from ethereumetl.domain.trace import EthTrace
 from ethereumetl.enumeration.entity_type import EntityType
+from ethereumetl.executors.dag_scheduler import DagScheduler
 from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
 from ethereumetl.jobs.export_receipts_job import ExportReceiptsJob
 from ethereumetl.jobs.export_traces_job import ExportTracesJob
 from ethereumetl.jobs.extract_contracts_job import ExtractContractsJob
 from ethereumetl.jobs.extract_token_transfers_job import ExtractTokenTransfersJob
 from ethereumetl.jobs.extract_tokens_job import ExtractTokensJob
+from ethereumetl.mappers.contract_mapper import EthContractMapper
+from ethereumetl.mappers.receipt_log_mapper import EthReceiptLogMapper
+from ethereumetl.mappers.receipt_mapper import EthReceiptMapper
+from ethereumetl.mappers.token_transfer_mapper import EthTokenTransferMapper
+from ethereumetl.mappers.trace_mapper import EthTraceMapper
+from ethereumetl.providers.multi_endpoint import MultiEndpointBatchProvider
+from ethereumetl.streaming.block_hash_ring_buffer import BlockHashRingBuffer
 from ethereumetl.streaming.enrich import enrich_transactions, enrich_logs, enrich_token_transfers, enrich_traces, \
     enrich_contracts, enrich_tokens
 from ethereumetl.streaming.eth_item_id_calculator import EthItemIdCalculator
@@ -24,7 +39,8 @@ class EthStreamerAdapter:
             item_exporter=ConsoleItemExporter(),
             batch_size=100,
             max_workers=5,
-            entity_types=tuple(EntityType.ALL_FOR_STREAMING)):
+            entity_types=tuple(EntityType.ALL_FOR_STREAMING),
+            max_reorg_depth=None):
         self.batch_web3_provider = batch_web3_provider
         self.item_exporter = item_exporter
         self.batch_size = batch_size
@@ -32,6 +48,12 @@ class EthStreamerAdapter:
         self.entity_types = entity_types
         self.item_id_calculator = EthItemIdCalculator()
         self.item_timestamp_calculator = EthItemTimestampCalculator()
+        self.receipt_mapper = EthReceiptMapper()
+        self.receipt_log_mapper = EthReceiptLogMapper()
+        self.token_transfer_mapper = EthTokenTransferMapper()
+        self.trace_mapper = EthTraceMapper()
+        self.contract_mapper = EthContractMapper()
+        self.block_hash_ring_buffer = BlockHashRingBuffer(max_reorg_depth) if max_reorg_depth else None
 
     def open(self):
         self.item_exporter.open()
@@ -41,57 +63,48 @@ class EthStreamerAdapter:
         return int(w3.eth.getBlock("latest").number)
 
     def export_all(self, start_block, end_block):
-        # Export blocks and transactions
-        blocks, transactions = [], []
-        if self._should_export(EntityType.BLOCK) or self._should_export(EntityType.TRANSACTION):
-            blocks, transactions = self._export_blocks_and_transactions(start_block, end_block)
-
-        # Export receipts and logs
-        receipts, logs = [], []
-        if self._should_export(EntityType.RECEIPT) or self._should_export(EntityType.LOG):
-            receipts, logs = self._export_receipts_and_logs(transactions)
-
-        # Extract token transfers
-        token_transfers = []
-        if self._should_export(EntityType.TOKEN_TRANSFER):
-            token_transfers = self._extract_token_transfers(logs)
-
-        # Export traces
-        traces = []
-        if self._should_export(EntityType.TRACE):
-            traces = self._export_traces(start_block, end_block)
-
-        # Export contracts
-        contracts = []
-        if self._should_export(EntityType.CONTRACT):
-            contracts = self._export_contracts(traces)
-
-        # Export tokens
-        tokens = []
-        if self._should_export(EntityType.TOKEN):
-            tokens = self._extract_tokens(contracts)
-
-        enriched_blocks = blocks \
-            if EntityType.BLOCK in self.entity_types else []
-        enriched_transactions = enrich_transactions(transactions, receipts) \
-            if EntityType.TRANSACTION in self.entity_types else []
-        enriched_logs = enrich_logs(blocks, logs) \
-            if EntityType.LOG in self.entity_types else []
-        enriched_token_transfers = enrich_token_transfers(blocks, token_transfers) \
-            if EntityType.TOKEN_TRANSFER in self.entity_types else []
-        enriched_traces = enrich_traces(blocks, traces) \
-            if EntityType.TRACE in self.entity_types else []
-        enriched_contracts = enrich_contracts(blocks, contracts) \
-            if EntityType.CONTRACT in self.entity_types else []
-        enriched_tokens = enrich_tokens(blocks, tokens) \
-            if EntityType.TOKEN in self.entity_types else []
-
-        logging.info('Exporting with ' + type(self.item_exporter).__name__)
-
+        self.export_items(self.extract_all(start_block, end_block), start_block, end_block)
+
+    # Returns the enriched items for the block range, in the order they are exported.
+    # The stages run on a DAG scheduler, so that traces, contracts and tokens are extracted while blocks, receipts and
+    # token transfers are.
+    # With max_reorg_depth, when the first block doesn't follow the last extracted block, the range is extracted again
+    # from the fork point, preceded by a retraction item for every extracted block after the fork point.
+    def extract_all(self, start_block, end_block):
+        scheduler = self._create_scheduler(start_block, end_block)
+        try:
+            results = scheduler.run()
+        except ReorgDetected as e:
+            return self._extract_after_reorg(e.fork_block, start_block, end_block)
+
+        blocks, transactions = results['blocks_and_transactions']
+        receipts, logs = results.get('receipts_and_logs', ([], []))
+        token_transfers = results.get('token_transfers', [])
+        traces = results.get('traces', [])
+        contracts = results.get('contracts', [])
+        tokens = results.get('tokens', [])
+
+        with span('enrich', start_block=start_block, end_block=end_block):
+            enriched_blocks = blocks \
+                if EntityType.BLOCK in self.entity_types else []
+            enriched_transactions = enrich_transactions(transactions, self._receipts_to_dicts(receipts)) \
+                if EntityType.TRANSACTION in self.entity_types else []
+            enriched_logs = enrich_logs(blocks, self._logs_to_dicts(logs)) \
+                if EntityType.LOG in self.entity_types else []
+            enriched_token_transfers = enrich_token_transfers(blocks, self._token_transfers_to_dicts(token_transfers)) \
+                if EntityType.TOKEN_TRANSFER in self.entity_types else []
+            enriched_traces = enrich_traces(blocks, self._traces_to_dicts(traces)) \
+                if EntityType.TRACE in self.entity_types else []
+            enriched_contracts = enrich_contracts(blocks, contracts) \
+                if EntityType.CONTRACT in self.entity_types else []
+            enriched_tokens = enrich_tokens(blocks, tokens) \
+                if EntityType.TOKEN in self.entity_types else []
+
+        # Blocks, transactions and logs are exported in order by the jobs and the joins keep that order
         all_items = \
-            sort_by(enriched_blocks, 'number') + \
-            sort_by(enriched_transactions, ('block_number', 'transaction_index')) + \
-            sort_by(enriched_logs, ('block_number', 'log_index')) + \
+            enriched_blocks + \
+            enriched_transactions + \
+            enriched_logs + \
             sort_by(enriched_token_transfers, ('block_number', 'log_index')) + \
             sort_by(enriched_traces, ('block_number', 'trace_index')) + \
             sort_by(enriched_contracts, ('block_number',)) + \
@@ -100,7 +113,76 @@ class EthStreamerAdapter:
         self.calculate_item_ids(all_items)
         self.calculate_item_timestamps(all_items)
 
-        self.item_exporter.export_items(all_items)
+        if self.block_hash_ring_buffer is not None:
+            self.block_hash_ring_buffer.rewind(start_block - 1)
+            for block in blocks:
+                self.block_hash_ring_buffer.add(block)
+
+        return all_items
+
+    # Returns the last block before start_block that is still in the chain, or None when there was no reorg
+    def _find_fork_block(self, start_block, blocks):
+        previous_block = self.block_hash_ring_buffer.get(start_block - 1)
+        if previous_block is None or not blocks or blocks[0]['parent_hash'] == previous_block['hash']:
+            return None
+
+        w3 = build_web3(self.batch_web3_provider)
+        block_number = start_block - 2
+        while True:
+            buffered_block = self.block_hash_ring_buffer.get(block_number)
+            if buffered_block is None:
+                raise ValueError('Reorg before block {} is deeper than the {} blocks kept for detecting reorgs'.format(
+                    start_block, len(self.block_hash_ring_buffer)))
+            if w3.eth.getBlock(block_number).hash.hex() == buffered_block['hash']:
+                return block_number
+            block_number -= 1
+
+    # Builds the dependency graph of the stages needed for the entity types
+    def _create_scheduler(self, start_block, end_block):
+        scheduler = DagScheduler(max_workers=len(STAGES))
+
+        def export_blocks_and_transactions():
+            blocks, transactions = self._export_blocks_and_transactions(start_block, end_block)
+            if self.block_hash_ring_buffer is not None:
+                check_blocks_are_consecutive(blocks)
+                fork_block = self._find_fork_block(start_block, blocks)
+                if fork_block is not None:
+                    # Stops the scheduler from starting the stages that depend on the blocks
+                    raise ReorgDetected(fork_block)
+            return blocks, transactions
+
+        # Blocks are always exported, they are needed for enriching the other entities
+        scheduler.add_task('blocks_and_transactions', export_blocks_and_transactions)
+        if self._should_export(EntityType.RECEIPT) or self._should_export(EntityType.LOG):
+            scheduler.add_task('receipts_and_logs', lambda blocks_and_transactions: self._export_receipts_and_logs(
+                blocks_and_transactions[1]), dependencies=['blocks_and_transactions'])
+        if self._should_export(EntityType.TOKEN_TRANSFER):
+            scheduler.add_task('token_transfers', lambda receipts_and_logs: self._extract_token_transfers(
+                receipts_and_logs[1]), dependencies=['receipts_and_logs'])
+        if self._should_export(EntityType.TRACE):
+            scheduler.add_task('traces', lambda: self._export_traces(start_block, end_block))
+        if self._should_export(EntityType.CONTRACT):
+            scheduler.add_task('contracts', self._export_contracts, dependencies=['traces'])
+        if self._should_export(EntityType.TOKEN):
+            scheduler.add_task('tokens', self._extract_tokens, dependencies=['contracts'])
+        return scheduler
+
+    def _extract_after_reorg(self, fork_block, start_block, end_block):
+        retracted_blocks = [self.block_hash_ring_buffer.get(block_number)
+                            for block_number in range(fork_block + 1, start_block)]
+        logging.warning('Reorg detected at block {}. Retracting blocks {} to {} and extracting them again'.format(
+            fork_block + 1, fork_block + 1, start_block - 1))
+        retractions = [block_to_retraction_item(block) for block in retracted_blocks]
+        self.calculate_item_ids(retractions)
+        self.calculate_item_timestamps(retractions)
+        # The ring buffer is only rewound once the blocks after the fork point are extracted, so that the reorg is
+        # detected again when extracting them fails
+        return retractions + self.extract_all(fork_block + 1, end_block)
+
+    def export_items(self, items, start_block, end_block):
+        logging.info('Exporting with ' + type(self.item_exporter).__name__)
+        with span('export', start_block=start_block, end_block=end_block):
+            self.item_exporter.export_items(items)
 
     def _export_blocks_and_transactions(self, start_block, end_block):
         blocks_and_transactions_item_exporter = InMemoryItemExporter(item_types=['block', 'transaction'])
@@ -112,15 +194,18 @@ class EthStreamerAdapter:
             max_workers=self.max_workers,
             item_exporter=blocks_and_transactions_item_exporter,
             export_blocks=self._should_export(EntityType.BLOCK),
-            export_transactions=self._should_export(EntityType.TRANSACTION)
+            export_transactions=self._should_export(EntityType.TRANSACTION),
+            ordered=True
         )
         blocks_and_transactions_job.run()
         blocks = blocks_and_transactions_item_exporter.get_items('block')
         transactions = blocks_and_transactions_item_exporter.get_items('transaction')
         return blocks, transactions
 
+    # The stages after blocks and transactions hand domain objects to each other. They are mapped to dicts only for
+    # the entity types that are exported, in extract_all.
     def _export_receipts_and_logs(self, transactions):
-        exporter = InMemoryItemExporter(item_types=['receipt', 'log'])
+        exporter = InMemoryObjectExporter(object_types=[EthReceipt, EthReceiptLog])
         job = ExportReceiptsJob(
             transaction_hashes_iterable=(transaction['hash'] for transaction in transactions),
             batch_size=self.batch_size,
@@ -128,48 +213,54 @@ class EthStreamerAdapter:
             max_workers=self.max_workers,
             item_exporter=exporter,
             export_receipts=self._should_export(EntityType.RECEIPT),
-            export_logs=self._should_export(EntityType.LOG)
+            export_logs=self._should_export(EntityType.LOG),
+            ordered=True,
+            export_domain_objects=True
         )
         job.run()
-        receipts = exporter.get_items('receipt')
-        logs = exporter.get_items('log')
+        receipts = exporter.get_items(EthReceipt)
+        logs = exporter.get_items(EthReceiptLog)
         return receipts, logs
 
     def _extract_token_transfers(self, logs):
-        exporter = InMemoryItemExporter(item_types=['token_transfer'])
+        exporter = InMemoryObjectExporter(object_types=[EthTokenTransfer])
         job = ExtractTokenTransfersJob(
             logs_iterable=logs,
             batch_size=self.batch_size,
             max_workers=self.max_workers,
-            item_exporter=exporter)
+            item_exporter=exporter,
+            export_domain_objects=True)
         job.run()
-        token_transfers = exporter.get_items('token_transfer')
+        token_transfers = exporter.get_items(EthTokenTransfer)
         return token_transfers
 
     def _export_traces(self, start_block, end_block):
-        exporter = InMemoryItemExporter(item_types=['trace'])
+        exporter = InMemoryObjectExporter(object_types=[EthTrace])
         job = ExportTracesJob(
             start_block=start_block,
             end_block=end_block,
             batch_size=self.batch_size,
             web3=ThreadLocalProxy(lambda: build_web3(self.batch_web3_provider)),
             max_workers=self.max_workers,
-            item_exporter=exporter
+            item_exporter=exporter,
+            export_domain_objects=True
         )
         job.run()
-        traces = exporter.get_items('trace')
+        traces = exporter.get_items(EthTrace)
         return traces
 
     def _export_contracts(self, traces):
-        exporter = InMemoryItemExporter(item_types=['contract'])
+        exporter = InMemoryObjectExporter(object_types=[EthContract])
         job = ExtractContractsJob(
             traces_iterable=traces,
             batch_size=self.batch_size,
             max_workers=self.max_workers,
-            item_exporter=exporter
+            item_exporter=exporter,
+            export_domain_objects=True
         )
         job.run()
-        contracts = exporter.get_items('contract')
+        # Mapped to dicts here, as both the tokens stage and the output read them
+        contracts = [self.contract_mapper.contract_to_dict(contract) for contract in exporter.get_items(EthContract)]
         return contracts
 
     def _extract_tokens(self, contracts):
@@ -211,6 +302,18 @@ class EthStreamerAdapter:
 
         raise ValueError('Unexpected entity type ' + entity_type)
 
+    def _receipts_to_dicts(self, receipts):
+        return [self.receipt_mapper.receipt_to_dict(receipt) for receipt in receipts]
+
+    def _logs_to_dicts(self, logs):
+        return [self.receipt_log_mapper.receipt_log_to_dict(log) for log in logs]
+
+    def _token_transfers_to_dicts(self, token_transfers):
+        return [self.token_transfer_mapper.token_transfer_to_dict(token_transfer) for token_transfer in token_transfers]
+
+    def _traces_to_dicts(self, traces):
+        return [self.trace_mapper.trace_to_dict(trace) for trace in traces]
+
     def calculate_item_ids(self, items):
         for item in items:
             item['item_id'] = self.item_id_calculator.calculate(item)
@@ -221,6 +324,35 @@ class EthStreamerAdapter:
 
     def close(self):
         self.item_exporter.close()
+        if isinstance(self.batch_web3_provider, MultiEndpointBatchProvider):
+            # Stops the health check and hedging threads
+            self.batch_web3_provider.close()
+
+
+STAGES = ['blocks_and_transactions', 'receipts_and_logs', 'token_transfers', 'traces', 'contracts', 'tokens']
+
+
+class ReorgDetected(Exception):
+    def __init__(self, fork_block):
+        super().__init__('Reorg detected after block {}'.format(fork_block))
+        self.fork_block = fork_block
+
+
+def check_blocks_are_consecutive(blocks):
+    for previous_block, block in zip(blocks, blocks[1:]):
+        if block['parent_hash'] != previous_block['hash']:
+            raise ValueError('Block {} changed while the blocks were being extracted'.format(previous_block['number']))
+
+
+# Tells consumers to delete the items of a block that is no longer in the chain. Items of the block that replaced it
+# follow.
+def block_to_retraction_item(block):
+    return {
+        'type': 'retraction',
+        'block_number': block['number'],
+        'block_hash': block['hash'],
+        'block_timestamp': block['timestamp'],
+    }
 
 
 def sort_by(arr, fields):
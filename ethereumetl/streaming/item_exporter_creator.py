@@ -45,6 +45,7 @@ def create_item_exporter(output):
                 'trace': output + '.traces',
                 'contract': output + '.contracts',
                 'token': output + '.tokens',
+                'retraction': output + '.retractions',
             },
             message_attributes=('item_id', 'item_timestamp'),
             batch_max_bytes=1024 * 1024 * 5,
@@ -92,6 +93,7 @@ def create_item_exporter(output):
             'trace': 'traces',
             'contract': 'contracts',
             'token': 'tokens',
+            'retraction': 'retractions',
         })
 
     else:
@@ -100,6 +102,13 @@ def create_item_exporter(output):
     return item_exporter
 
 
+# Postgres and GCS only insert items, so the items of retracted blocks would stay there
+def get_outputs_without_retractions(outputs):
+    split_outputs = [output.strip() for output in outputs.split(',')] if outputs else ['console']
+    return [output for output in split_outputs
+            if determine_item_exporter_type(output) in (ItemExporterType.POSTGRES, ItemExporterType.GCS)]
+
+
 def get_bucket_and_path_from_gcs_output(output):
     output = output.replace('gs://', '')
     bucket_and_path = output.split('/', 1)
@@ -0,0 +1,115 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import logging
+import threading
+
+import aiohttp
+
+from blockchainetl import json_codec
+
+DEFAULT_RECONNECT_SECONDS = 5
+
+
+# Head source for Streamer that subscribes to newHeads over a websocket, so that a sync cycle starts as soon as the
+# node has a new block instead of after the polling period. The subscription runs in a background thread with its
+# own event loop and reconnects after errors. While it's disconnected, Streamer falls back to polling.
+class NewHeadsSubscription:
+    def __init__(self, ws_uri, reconnect_seconds=DEFAULT_RECONNECT_SECONDS):
+        self.ws_uri = ws_uri
+        self.reconnect_seconds = reconnect_seconds
+        self.latest_block_number = None
+        self._new_head = threading.Event()
+        self._subscribed = threading.Event()
+        self._loop = None
+        self._task = None
+        self._thread = None
+        self.logger = logging.getLogger('NewHeadsSubscription')
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self._subscribe_forever())
+        self._thread = threading.Thread(target=self._run_loop, name='NewHeadsSubscription', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join()
+        self._thread = None
+
+    # Returns True when a new head arrived within timeout_seconds
+    def wait_for_new_head(self, timeout_seconds):
+        arrived = self._new_head.wait(timeout_seconds)
+        self._new_head.clear()
+        return arrived
+
+    # Returns True when subscribed within timeout_seconds
+    def wait_for_subscription(self, timeout_seconds):
+        return self._subscribed.wait(timeout_seconds)
+
+    def _run_loop(self):
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _subscribe_forever(self):
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    await self._subscribe(session)
+                # Any error, e.g. a close frame or a malformed notification, must not end the subscription for good
+                except Exception as e:
+                    self.logger.warning('The newHeads subscription to {} failed: {}. Polling for new blocks until it '
+                                        'reconnects in {} seconds.'.format(self.ws_uri, repr(e), self.reconnect_seconds))
+                finally:
+                    self._subscribed.clear()
+                await asyncio.sleep(self.reconnect_seconds)
+
+    async def _subscribe(self, session):
+        async with session.ws_connect(self.ws_uri, heartbeat=30) as websocket:
+            await websocket.send_str(json_codec.dumps(
+                {'jsonrpc': '2.0', 'id': 1, 'method': 'eth_subscribe', 'params': ['newHeads']}))
+            response = json_codec.loads(await websocket.receive_str())
+            if response.get('error') is not None:
+                raise ValueError('eth_subscribe failed: {}'.format(response['error']))
+            subscription_id = response.get('result')
+            self.logger.info('Subscribed to newHeads at {}'.format(self.ws_uri))
+            self._subscribed.set()
+
+            async for message in websocket:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                notification = json_codec.loads(message.data)
+                params = notification.get('params') or {}
+                if notification.get('method') != 'eth_subscription' or params.get('subscription') != subscription_id:
+                    continue
+                self.latest_block_number = int(params['result']['number'], 16)
+                self._new_head.set()
+            raise ValueError('The websocket was closed')
@@ -24,6 +24,7 @@
 import itertools
 import warnings
 
+from ethereumetl.misc.rate_limited_error import RateLimitedError
 from ethereumetl.misc.retriable_value_error import RetriableValueError
 
 
@@ -90,12 +91,31 @@ def rpc_response_to_result(response):
             # When nodes are behind a load balancer it makes sense to retry the request in hopes it will go to other,
             # synced node
             raise RetriableValueError(error_message)
+        elif is_rate_limit_error(response.get('error')):
+            raise RateLimitedError(error_message)
         elif response.get('error') is not None and is_retriable_error(response.get('error').get('code')):
             raise RetriableValueError(error_message)
         raise ValueError(error_message)
     return result
 
 
+# Some providers use 429 like the HTTP status. -32005 is the limit exceeded error from EIP-1474, it is also returned
+# for requests over a size limit e.g. "query returned more than 10000 results", so only its message tells throttling
+# apart from a request that will never succeed.
+RATE_LIMIT_ERROR_CODE = 429
+RATE_LIMIT_MESSAGES = ('rate limit', 'rate exceeded', 'too many requests', 'request count exceeded',
+                       'compute units per second')
+
+
+def is_rate_limit_error(error):
+    if not isinstance(error, dict):
+        return False
+    if error.get('code') == RATE_LIMIT_ERROR_CODE:
+        return True
+    message = error.get('message')
+    return isinstance(message, str) and any(text in message.lower() for text in RATE_LIMIT_MESSAGES)
+
+
 def is_retriable_error(error_code):
     if error_code is None:
         return False
@@ -40,7 +40,8 @@ setup(
         'ethereum-dasm==0.1.4',
         'urllib3<2',
         'base58',
-        'requests'
+        'requests',
+        'aiohttp>=3.7.4,<4'
     ],
     extras_require={
         'streaming': [
@@ -56,6 +57,9 @@ setup(
             # Later versions break the build in Travis CI for Python 3.7.2
             'grpcio==1.46.3'
         ],
+        'orjson': [
+            'orjson>=3.6,<4',
+        ],
         'streaming-kinesis': [
             'boto3==1.24.11',
             'botocore==1.27.11',
@@ -0,0 +1,83 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import decimal
+import io
+import json
+
+import pytest
+
+from blockchainetl import json_codec
+from blockchainetl.exporters import JsonLinesItemExporter
+from blockchainetl.json_codec import OrjsonJsonCodec, StdlibJsonCodec, orjson
+
+codecs = [StdlibJsonCodec(), StdlibJsonCodec(compact=True)]
+if orjson is not None:
+    codecs.append(OrjsonJsonCodec())
+
+
+@pytest.mark.parametrize('codec', codecs, ids=lambda codec: codec.name + ('-compact' if getattr(codec, 'compact', False) else ''))
+def test_json_codec_encodes_edge_cases(codec):
+    item = {'value': 2 ** 80, 'amount': decimal.Decimal('1.123456789'), 'data': b'\x01\xff', 'name': 'x'}
+
+    assert codec.loads(codec.dumps_bytes(item)) == \
+        {'value': 2 ** 80, 'amount': 1.12345679, 'data': '0x01ff', 'name': 'x'}
+
+
+@pytest.mark.parametrize('codec', codecs, ids=lambda codec: codec.name + ('-compact' if getattr(codec, 'compact', False) else ''))
+def test_json_codec_decodes_long_integers_exactly(codec):
+    assert codec.loads(b'{"value": 1234567890123456789012345, "hash": "0x1234567890123456789012"}') == \
+        {'value': 1234567890123456789012345, 'hash': '0x1234567890123456789012'}
+
+
+@pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+def test_json_codecs_produce_the_same_bytes():
+    item = {'type': 'token', 'name': 'Ünïcødé 🚀', 'symbol': '\u2603', 'value': 2 ** 60, 'data': b'\x01',
+            'amount': decimal.Decimal('0.5'), 'list': [1, None, True]}
+
+    assert StdlibJsonCodec(compact=True).dumps_bytes(item) == OrjsonJsonCodec().dumps_bytes(item)
+
+
+def export_json_lines(item):
+    file = io.BytesIO()
+    JsonLinesItemExporter(file).export_item(item)
+    return file.getvalue()
+
+
+def test_json_lines_are_written_like_json_dumps():
+    item = {'type': 'token', 'name': 'Ünïcødé 🚀', 'value': 2 ** 70, 'list': [1, None, True]}
+
+    assert export_json_lines(item) == \
+        b'{"type": "token", "name": "\\u00dcn\\u00efc\\u00f8d\\u00e9 \\ud83d\\ude80", ' \
+        b'"value": 1180591620717411303424, "list": [1, null, true]}\n'
+    assert export_json_lines(item) == (json.dumps(item) + '\n').encode()
+
+
+def test_compact_json_lines_are_opt_in():
+    item = {'name': 'Ünï', 'value': 1}
+    try:
+        json_codec.set_compact_items(True)
+        assert export_json_lines(item) == '{"name":"Ünï","value":1}\n'.encode('utf-8')
+    finally:
+        json_codec.set_compact_items(False)
+    assert export_json_lines(item) == b'{"name": "\\u00dcn\\u00ef", "value": 1}\n'
@@ -0,0 +1,57 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from urllib.request import urlopen
+
+from blockchainetl.metrics import MetricsRegistry, MetricsServer
+
+
+def test_metrics_are_served_in_prometheus_text_format():
+    registry = MetricsRegistry()
+    registry.counter('rpc_requests_total', 'RPC requests.', ['method']).labels('eth_getBlockByNumber').inc(100)
+    registry.gauge('batch_size', 'Batch size.').labels().set(50)
+    latency = registry.histogram('rpc_duration_seconds', 'RPC latency.', ['method'], buckets=(0.1, 1))
+    latency.labels('eth_call').observe(0.05)
+    latency.labels('eth_call').observe(0.5)
+
+    server = MetricsServer(0, metrics_registry=registry).start()
+    try:
+        text = urlopen('http://127.0.0.1:{}/metrics'.format(server.port)).read().decode('utf-8')
+    finally:
+        server.stop()
+
+    assert text == '\n'.join([
+        '# HELP rpc_requests_total RPC requests.',
+        '# TYPE rpc_requests_total counter',
+        'rpc_requests_total{method="eth_getBlockByNumber"} 100',
+        '# HELP batch_size Batch size.',
+        '# TYPE batch_size gauge',
+        'batch_size 50',
+        '# HELP rpc_duration_seconds RPC latency.',
+        '# TYPE rpc_duration_seconds histogram',
+        'rpc_duration_seconds_bucket{method="eth_call",le="0.1"} 1',
+        'rpc_duration_seconds_bucket{method="eth_call",le="1"} 2',
+        'rpc_duration_seconds_bucket{method="eth_call",le="+Inf"} 2',
+        'rpc_duration_seconds_sum{method="eth_call"} 0.55',
+        'rpc_duration_seconds_count{method="eth_call"} 2',
+    ]) + '\n'
@@ -0,0 +1,62 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+import time
+
+from blockchainetl.profiling import profiling, span
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+
+
+def test_batches_are_written_as_chrome_trace(tmpdir):
+    profile_file = str(tmpdir.join('profile.json'))
+
+    def export_batch(batch):
+        with span('fetch'):
+            time.sleep(0.01)
+
+    executor = BatchWorkExecutor(2, 2)
+    with profiling(profile_file, sampling_interval_ms=1):
+        executor.execute(range(6), export_batch)
+        executor.shutdown()
+
+    with open(profile_file) as file:
+        trace = json.load(file)
+
+    spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    batch_spans = sorted((event for event in spans if event['name'] == executor.stage),
+                         key=lambda event: event['args']['first_item'])
+    assert [(event['args']['first_item'], event['args']['last_item']) for event in batch_spans] == \
+        [(0, 1), (2, 3), (4, 5)]
+    fetch_spans = [event for event in spans if event['name'] == 'fetch']
+    assert len(fetch_spans) == 3
+    # Each fetch span is nested in a batch span on the same thread
+    for fetch_span in fetch_spans:
+        assert any(batch_span['tid'] == fetch_span['tid'] and batch_span['ts'] <= fetch_span['ts'] and
+                   fetch_span['ts'] + fetch_span['dur'] <= batch_span['ts'] + batch_span['dur']
+                   for batch_span in batch_spans)
+
+    thread_names = {event['tid'] for event in trace['traceEvents'] if event['ph'] == 'M'}
+    assert {event['tid'] for event in spans} <= thread_names
+    assert trace['samples']
+    assert all(sample['sf'] in trace['stackFrames'] for sample in trace['samples'])
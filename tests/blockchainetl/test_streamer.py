@@ -0,0 +1,82 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import threading
+import time
+
+from blockchainetl.streaming.streamer import Streamer, read_last_synced_block
+from blockchainetl.streaming.streamer_adapter_stub import StreamerAdapterStub
+
+
+class SlowStreamerAdapter(StreamerAdapterStub):
+    def __init__(self, current_block, delay_seconds, failing_exports=0):
+        self.current_block = current_block
+        self.delay_seconds = delay_seconds
+        self.failing_exports = failing_exports
+        self.exported_ranges = []
+        self.extracting = False
+        self.overlapped = False
+        self.last_synced_blocks = []
+        self.last_synced_block_file = None
+
+    def get_current_block_number(self):
+        return self.current_block
+
+    def extract_all(self, start_block, end_block):
+        self.extracting = True
+        time.sleep(self.delay_seconds)
+        self.extracting = False
+        return list(range(start_block, end_block + 1))
+
+    def export_items(self, items, start_block, end_block):
+        self.last_synced_blocks.append(read_last_synced_block(self.last_synced_block_file))
+        time.sleep(self.delay_seconds / 2)
+        self.overlapped = self.overlapped or self.extracting
+        time.sleep(self.delay_seconds / 2)
+        if self.failing_exports > 0:
+            self.failing_exports -= 1
+            raise ValueError('The sink is unavailable')
+        assert items == list(range(start_block, end_block + 1))
+        self.exported_ranges.append((start_block, end_block))
+        assert threading.current_thread() is not threading.main_thread()
+
+
+def test_pipelined_streamer_overlaps_extract_and_export(tmpdir):
+    last_synced_block_file = str(tmpdir.join('last_synced_block.txt'))
+    adapter = SlowStreamerAdapter(current_block=100, delay_seconds=0.05, failing_exports=1)
+    adapter.last_synced_block_file = last_synced_block_file
+    streamer = Streamer(
+        blockchain_streamer_adapter=adapter,
+        last_synced_block_file=last_synced_block_file,
+        start_block=1,
+        end_block=50,
+        period_seconds=0,
+        block_batch_size=10,
+        pipelined=True)
+    streamer.stream()
+
+    assert adapter.overlapped
+    # The failed range is exported again and every range is exported after the ones before it were committed
+    assert adapter.exported_ranges == [(1, 10), (11, 20), (21, 30), (31, 40), (41, 50)]
+    assert adapter.last_synced_blocks == [0, 0, 10, 20, 30, 40]
+    assert read_last_synced_block(last_synced_block_file) == 50
@@ -0,0 +1,69 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from ethereumetl.executors.aimd_controller import AimdController
+
+
+def build_controller(**kwargs):
+    return AimdController(**{**dict(batch_size=10, concurrency=4, max_batch_size=100, max_concurrency=8,
+                                     target_latency_seconds=1, window_seconds=10), **kwargs})
+
+
+def test_batch_size_increases_additively_and_decreases_multiplicatively():
+    controller = build_controller()
+    # Once per window of concurrency batches
+    for i in range(20):
+        controller.on_batch_done(10, started_at=i / 4, latency_seconds=0.5, success=True, now=i / 4 + 0.5)
+    assert controller.batch_size == 15
+
+    controller.on_batch_done(15, started_at=5, latency_seconds=2, success=True, now=7)
+    assert controller.batch_size == 7
+
+    # Started before the decrease, so it was sent with the old batch size
+    controller.on_batch_done(15, started_at=6, latency_seconds=2, success=False, now=8)
+    assert controller.batch_size == 7
+
+    controller.on_batch_done(7, started_at=7, latency_seconds=2, success=False, now=9)
+    assert controller.batch_size == 3
+
+
+def test_concurrency_follows_throughput_and_errors():
+    controller = build_controller(target_latency_seconds=100)
+
+    def run_window(start, items_per_second, error_count=0):
+        for second in range(10):
+            success = second >= error_count
+            controller.on_batch_done(items_per_second, started_at=start + second, latency_seconds=1,
+                                     success=success, now=start + second + 1)
+
+    run_window(0, 100)
+    assert controller.concurrency == 5
+    run_window(10, 120)
+    assert controller.concurrency == 6
+    # Throughput dropped, the node is saturated
+    run_window(20, 80)
+    assert controller.concurrency == 3
+    run_window(30, 80)
+    assert controller.concurrency == 4
+    run_window(40, 80, error_count=2)
+    assert controller.concurrency == 2
@@ -0,0 +1,91 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import random
+
+import aiohttp
+import pytest
+
+from ethereumetl.enumeration.retry_strategy import RetryStrategy
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
+
+
+@pytest.mark.parametrize("retry_strategy", RetryStrategy.ALL)
+def test_batch_is_retried_on_client_error(retry_strategy):
+    calls = []
+    done_items = []
+
+    async def work_handler(batch):
+        calls.append(list(batch))
+        if len(calls) == 1:
+            raise aiohttp.ClientConnectionError('Connection reset')
+        done_items.extend(batch)
+
+    batch_work_executor = AsyncBatchWorkExecutor(8, 1, retry_strategy=retry_strategy)
+    batch_work_executor.execute(range(8), work_handler)
+    batch_work_executor.shutdown()
+
+    assert sorted(done_items) == list(range(8))
+    assert calls[0] == list(range(8))
+    assert len(calls) > 1
+
+
+def test_pending_batches_are_cancelled_when_batch_fails():
+    started_batches = []
+    cancelled_batches = []
+
+    async def work_handler(batch):
+        started_batches.append(batch[0])
+        if batch[0] == 4:
+            raise ValueError('Not retriable')
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled_batches.append(batch[0])
+            raise
+
+    batch_work_executor = AsyncBatchWorkExecutor(2, 4)
+    with pytest.raises(ValueError):
+        batch_work_executor.execute(range(100), work_handler)
+    batch_work_executor.shutdown()
+
+    # Only the first max_workers batches were started, the rest were cancelled after the failure
+    assert started_batches == [0, 2, 4, 6]
+    assert sorted(cancelled_batches) == [0, 2, 6]
+
+
+@pytest.mark.parametrize("retry_strategy", RetryStrategy.ALL)
+def test_results_are_handled_in_submission_order(retry_strategy):
+    handled_items = []
+
+    async def work_handler(batch):
+        await asyncio.sleep(random.uniform(0, 0.01))
+        if 37 in batch and len(batch) > 1:
+            raise aiohttp.ClientPayloadError('Bad item in the batch')
+        return list(batch)
+
+    batch_work_executor = AsyncBatchWorkExecutor(4, 8, retry_strategy=retry_strategy, reorder_window=3)
+    batch_work_executor.execute(range(100), work_handler, result_handler=handled_items.extend)
+    batch_work_executor.shutdown()
+
+    assert handled_items == list(range(100))
@@ -0,0 +1,101 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import random
+import threading
+import time
+
+import pytest
+
+from ethereumetl.enumeration.retry_strategy import RetryStrategy
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+from ethereumetl.misc.retriable_value_error import RetriableValueError
+
+
+def test_batch_size_follows_target_batch_bytes():
+    batch_sizes = []
+
+    def work_handler(batch):
+        batch_sizes.append(len(batch))
+        # Items get 10 times bigger half way
+        bytes_per_item = 1000 if batch[0] < 500 else 10000
+        batch_work_executor.record_batch_bytes(len(batch), len(batch) * bytes_per_item)
+
+    batch_work_executor = BatchWorkExecutor(100, 1, target_batch_bytes=50000)
+    batch_work_executor.execute(range(1000), work_handler)
+    batch_work_executor.shutdown()
+
+    assert sum(batch_sizes) == 1000
+    assert batch_sizes[0] == 100
+    assert batch_sizes[2] == 50
+    assert batch_sizes[-2] == 5
+
+
+@pytest.mark.parametrize("retry_strategy,expected_calls", [
+    (RetryStrategy.ITEM, 1 + 64),
+    # Both halves are retried on every level down to the bad item
+    (RetryStrategy.BISECT, 1 + 2 * 6),
+])
+def test_failed_batch_is_retried(retry_strategy, expected_calls):
+    calls = []
+    done_items = []
+
+    def work_handler(batch):
+        calls.append(len(batch))
+        # The item only fails together with other items, e.g. because of the response size
+        if 37 in batch and len(batch) > 1:
+            raise RetriableValueError('Bad item in the batch')
+        done_items.extend(batch)
+
+    batch_work_executor = BatchWorkExecutor(64, 1, retry_strategy=retry_strategy)
+    batch_work_executor.execute(range(64), work_handler)
+    batch_work_executor.shutdown()
+
+    assert sorted(done_items) == list(range(64))
+    assert len(calls) == expected_calls
+
+
+@pytest.mark.parametrize("retry_strategy", RetryStrategy.ALL)
+def test_results_are_handled_in_submission_order(retry_strategy):
+    lock = threading.Lock()
+    started_batches = []
+    handled_items = []
+    max_unhandled_batches = []
+
+    def work_handler(batch):
+        # Retries of the failed batch are smaller
+        if len(batch) == 4:
+            with lock:
+                started_batches.append(batch[0])
+                max_unhandled_batches.append(len(started_batches) - len(handled_items) // 4)
+        time.sleep(random.uniform(0, 0.01))
+        if 37 in batch and len(batch) > 1:
+            raise RetriableValueError('Bad item in the batch')
+        return list(batch)
+
+    batch_work_executor = BatchWorkExecutor(4, 8, retry_strategy=retry_strategy, reorder_window=3)
+    batch_work_executor.execute(range(100), work_handler, result_handler=handled_items.extend)
+    batch_work_executor.shutdown()
+
+    assert handled_items == list(range(100))
+    assert max(max_unhandled_batches) <= 3
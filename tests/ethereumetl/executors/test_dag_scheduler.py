@@ -0,0 +1,88 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import threading
+
+import pytest
+
+from ethereumetl.executors.channel import Channel
+from ethereumetl.executors.dag_scheduler import DagScheduler
+
+
+def test_tasks_get_the_results_of_their_dependencies():
+    scheduler = DagScheduler(max_workers=2)
+    scheduler.add_task('blocks', lambda: [1, 2, 3])
+    scheduler.add_task('traces', lambda: [10])
+    scheduler.add_task('receipts', lambda blocks: [b * 2 for b in blocks], dependencies=['blocks'])
+    scheduler.add_task('all', lambda receipts, traces: receipts + traces, dependencies=['receipts', 'traces'])
+
+    results = scheduler.run()
+
+    assert results['all'] == [2, 4, 6, 10]
+
+
+def test_no_tasks_are_started_after_a_failure():
+    started = []
+
+    def fail():
+        raise ValueError('Failed')
+
+    scheduler = DagScheduler(max_workers=1)
+    scheduler.add_task('blocks', fail)
+    scheduler.add_task('receipts', lambda blocks: started.append('receipts'), dependencies=['blocks'])
+
+    with pytest.raises(ValueError, match='Failed'):
+        scheduler.run()
+    assert started == []
+
+
+def test_dependencies_must_be_added_first():
+    scheduler = DagScheduler(max_workers=1)
+    with pytest.raises(ValueError):
+        scheduler.add_task('receipts', lambda blocks: blocks, dependencies=['blocks'])
+
+
+def test_channel_streams_items_between_tasks():
+    channel = Channel(max_size=2)
+
+    def produce():
+        try:
+            for i in range(100):
+                channel.put(i)
+        finally:
+            channel.close()
+
+    scheduler = DagScheduler(max_workers=2)
+    scheduler.add_task('produce', produce)
+    scheduler.add_task('consume', lambda: list(channel))
+
+    assert scheduler.run()['consume'] == list(range(100))
+
+
+def test_channel_put_fails_once_the_consumer_closes_it():
+    channel = Channel(max_size=1)
+    channel.put(1)
+    threading.Timer(0.1, channel.close).start()
+
+    with pytest.raises(ValueError):
+        channel.put(2)
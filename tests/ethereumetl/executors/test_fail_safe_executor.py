@@ -0,0 +1,48 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import threading
+
+import pytest
+
+from ethereumetl.executors.bounded_executor import BoundedExecutor
+from ethereumetl.executors.fail_safe_executor import FailSafeExecutor
+
+
+def test_failure_cancels_pending_work_and_is_raised_from_submit():
+    executor = FailSafeExecutor(BoundedExecutor(10, 1))
+    failing_can_finish = threading.Event()
+
+    def fail():
+        failing_can_finish.wait()
+        raise ValueError('Failed')
+
+    executor.submit(fail)
+    pending_futures = [executor.submit(lambda: None) for _ in range(5)]
+    failing_can_finish.set()
+
+    with pytest.raises(ValueError, match='Failed'):
+        executor.shutdown()
+    assert all(future.cancelled() for future in pending_futures)
+    with pytest.raises(ValueError, match='Failed'):
+        executor.submit(lambda: None)
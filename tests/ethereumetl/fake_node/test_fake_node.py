@@ -0,0 +1,106 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+
+import pytest
+
+import tests.resources
+from ethereumetl.fake_node.chain import SyntheticChain
+from ethereumetl.fake_node.server import FakeNode, FakeNodeServer
+from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
+from ethereumetl.jobs.export_receipts_job import ExportReceiptsJob
+from ethereumetl.jobs.exporters.blocks_and_transactions_item_exporter import blocks_and_transactions_item_exporter
+from ethereumetl.jobs.exporters.receipts_and_logs_item_exporter import receipts_and_logs_item_exporter
+from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.thread_local_proxy import ThreadLocalProxy
+from tests.helpers import compare_lines_ignore_order, read_file
+
+RECORDED_DIR = os.path.join(os.path.dirname(tests.resources.__file__), 'test_export_blocks_job', 'blocks_with_transactions')
+
+
+@pytest.fixture
+def fake_node_server(tmpdir):
+    def start(node):
+        return FakeNodeServer(node, ipc_path=str(tmpdir.join('fake_node.ipc'))).start()
+
+    servers = []
+    yield lambda node: servers.append(start(node)) or servers[-1]
+    for server in servers:
+        server.stop()
+
+
+def export_blocks(provider_uri, start_block, end_block, blocks_output_file, transactions_output_file):
+    ExportBlocksJob(
+        start_block=start_block, end_block=end_block, batch_size=2,
+        batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+        max_workers=5,
+        item_exporter=blocks_and_transactions_item_exporter(blocks_output_file, transactions_output_file),
+        export_blocks=True,
+        export_transactions=True
+    ).run()
+
+
+@pytest.mark.parametrize("transport", ['http', 'ipc'])
+def test_fake_node_serves_recorded_responses(tmpdir, fake_node_server, transport):
+    server = fake_node_server(FakeNode(SyntheticChain(height=100), recorded_dir=RECORDED_DIR))
+    provider_uri = server.uri if transport == 'http' else server.ipc_uri
+    blocks_output_file = str(tmpdir.join('actual_blocks.csv'))
+    transactions_output_file = str(tmpdir.join('actual_transactions.csv'))
+
+    export_blocks(provider_uri, 47218, 47219, blocks_output_file, transactions_output_file)
+
+    compare_lines_ignore_order(
+        read_file(os.path.join(RECORDED_DIR, 'expected_blocks.csv')), read_file(blocks_output_file))
+    compare_lines_ignore_order(
+        read_file(os.path.join(RECORDED_DIR, 'expected_transactions.csv')), read_file(transactions_output_file))
+
+
+def test_fake_node_synthetic_chain_is_deterministic(tmpdir, fake_node_server):
+    outputs = []
+    for run in range(2):
+        server = fake_node_server(FakeNode(SyntheticChain(height=100, transactions_per_block=5, seed=1)))
+        blocks_output_file = str(tmpdir.join('blocks_{}.csv'.format(run)))
+        transactions_output_file = str(tmpdir.join('transactions_{}.csv'.format(run)))
+        export_blocks(server.uri, 90, 100, blocks_output_file, transactions_output_file)
+
+        transaction_hashes = [line.split(',')[0] for line in read_file(transactions_output_file).splitlines()[1:]]
+        receipts_output_file = str(tmpdir.join('receipts_{}.csv'.format(run)))
+        logs_output_file = str(tmpdir.join('logs_{}.csv'.format(run)))
+        ExportReceiptsJob(
+            transaction_hashes_iterable=transaction_hashes,
+            batch_size=10,
+            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(server.uri, batch=True)),
+            max_workers=5,
+            item_exporter=receipts_and_logs_item_exporter(receipts_output_file, logs_output_file),
+            export_receipts=True,
+            export_logs=True
+        ).run()
+
+        receipts = read_file(receipts_output_file).splitlines()
+        assert len(receipts) == len(transaction_hashes) + 1
+        outputs.append([sorted(read_file(file).splitlines()) for file in
+                        (blocks_output_file, transactions_output_file, receipts_output_file, logs_output_file)])
+        server.stop()
+
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,90 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import csv
+import glob
+import os
+import threading
+
+from ethereumetl.fake_node.chain import SyntheticChain
+from ethereumetl.fake_node.server import FakeNode, FakeNodeServer
+from ethereumetl.jobs.export_all_common import export_all_common, split_max_workers
+
+
+def read_csv(output_dir, entity):
+    file_names = glob.glob(os.path.join(output_dir, entity, '**', '*.csv'), recursive=True)
+    assert len(file_names) == 1
+    with open(file_names[0]) as file:
+        return list(csv.DictReader(file))
+
+
+def test_split_max_workers():
+    assert split_max_workers(5, 5) == [1, 1, 1, 1, 1]
+    assert split_max_workers(12, 5) == [3, 3, 2, 2, 2]
+    assert split_max_workers(2, 3) == [1, 1, 1]
+
+
+def test_export_all_exports_every_stage(tmpdir):
+    output_dir = str(tmpdir)
+    chain = SyntheticChain(height=100, transactions_per_block=2, contract_creation_rate=0.5)
+
+    with FakeNodeServer(FakeNode(chain)) as server:
+        export_all_common([(10, 19, '/start_block=00000010/end_block=00000019')], output_dir, server.uri,
+                          max_workers=5, batch_size=7)
+
+    blocks = read_csv(output_dir, 'blocks')
+    transactions = read_csv(output_dir, 'transactions')
+    receipts = read_csv(output_dir, 'receipts')
+    logs = read_csv(output_dir, 'logs')
+    token_transfers = read_csv(output_dir, 'token_transfers')
+    contracts = read_csv(output_dir, 'contracts')
+    tokens = read_csv(output_dir, 'tokens')
+
+    assert sorted(int(block['number']) for block in blocks) == list(range(10, 20))
+    assert len(transactions) == sum(len(chain.get_block(number, False)['transactions']) for number in range(10, 20))
+    assert {receipt['transaction_hash'] for receipt in receipts} == \
+        {transaction['hash'] for transaction in transactions}
+    assert {log['transaction_hash'] for log in logs} <= {transaction['hash'] for transaction in transactions}
+    assert len(token_transfers) > 0
+    assert {contract['address'] for contract in contracts} == \
+        {receipt['contract_address'] for receipt in receipts if receipt['contract_address']}
+    assert {token['address'] for token in tokens} == {transfer['token_address'] for transfer in token_transfers}
+
+
+def test_export_all_raises_when_producer_stage_fails(tmpdir):
+    errors = []
+
+    def run():
+        # Blocks after the head don't exist, so the blocks stage fails after its retries
+        with FakeNodeServer(FakeNode(SyntheticChain(height=15, transactions_per_block=2))) as server:
+            try:
+                export_all_common([(10, 19, '/start_block=00000010/end_block=00000019')], str(tmpdir), server.uri,
+                                  max_workers=5, batch_size=5)
+            except Exception as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(60)
+
+    assert not thread.is_alive()
+    assert len(errors) == 1
@@ -23,6 +23,7 @@
 import pytest
 
 import tests.resources
+from blockchainetl.jobs.export_ledger import ExportLedger
 from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
 from ethereumetl.jobs.exporters.blocks_and_transactions_item_exporter import blocks_and_transactions_item_exporter
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
@@ -70,3 +71,66 @@ def test_export_blocks_job(tmpdir, start_block, end_block, batch_size, resource_
     compare_lines_ignore_order(
         read_resource(resource_group, f'expected_transactions.{format}'), read_file(transactions_output_file)
     )
+
+
+def test_export_blocks_job_with_mapping_processes(tmpdir):
+    resource_group = 'blocks_with_transactions'
+    blocks_output_file = str(tmpdir.join('actual_blocks.csv'))
+    transactions_output_file = str(tmpdir.join('actual_transactions.csv'))
+
+    job = ExportBlocksJob(
+        start_block=47218, end_block=47219, batch_size=1,
+        batch_web3_provider=ThreadLocalProxy(
+            lambda: get_web3_provider('mock', lambda file: read_resource(resource_group, file), batch=True)
+        ),
+        max_workers=5,
+        item_exporter=blocks_and_transactions_item_exporter(blocks_output_file, transactions_output_file),
+        mapping_processes=2
+    )
+    job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_blocks.csv'), read_file(blocks_output_file)
+    )
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_transactions.csv'), read_file(transactions_output_file)
+    )
+
+
+def test_export_blocks_job_resumes_from_ledger(tmpdir):
+    resource_group = 'blocks_with_transactions'
+    blocks_output_file = str(tmpdir.join('actual_blocks.csv'))
+    transactions_output_file = str(tmpdir.join('actual_transactions.csv'))
+    ledger_file = str(tmpdir.join('ledger'))
+
+    def run_job():
+        ExportBlocksJob(
+            start_block=47218, end_block=47219, batch_size=1,
+            batch_web3_provider=ThreadLocalProxy(
+                lambda: get_web3_provider('mock', lambda file: read_resource(resource_group, file), batch=True)
+            ),
+            max_workers=5,
+            item_exporter=blocks_and_transactions_item_exporter(blocks_output_file, transactions_output_file),
+            ledger=ExportLedger(ledger_file)
+        ).run()
+
+    run_job()
+
+    # Simulate a crash while writing the second block: it is not recorded and its output is partially written
+    with open(ledger_file) as file:
+        ledger_lines = file.readlines()
+    assert len(ledger_lines) == 3
+    with open(ledger_file, 'w') as file:
+        file.writelines(ledger_lines[:2])
+        file.write('{"last_block": 472')
+    for output_file in (blocks_output_file, transactions_output_file):
+        with open(output_file, 'a') as file:
+            file.write('0x123,partially written row')
+
+    run_job()
+
+    assert read_resource(resource_group, 'expected_blocks.csv') == read_file(blocks_output_file)
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_transactions.csv'), read_file(transactions_output_file)
+    )
@@ -26,8 +26,13 @@ import io
 import pytest
 
 import tests.resources
+from blockchainetl.jobs.exporters.in_memory_item_exporter import InMemoryItemExporter
+from blockchainetl.jobs.exporters.in_memory_object_exporter import InMemoryObjectExporter
+from ethereumetl.domain.token_transfer import EthTokenTransfer
 from ethereumetl.jobs.exporters.token_transfers_item_exporter import token_transfers_item_exporter
 from ethereumetl.jobs.extract_token_transfers_job import ExtractTokenTransfersJob
+from ethereumetl.mappers.receipt_log_mapper import EthReceiptLogMapper
+from ethereumetl.mappers.token_transfer_mapper import EthTokenTransferMapper
 from tests.helpers import compare_lines_ignore_order, read_file
 
 RESOURCE_GROUP = 'test_extract_token_transfers_job'
@@ -56,3 +61,23 @@ def test_export_token_transfers_job(tmpdir, resource_group):
     compare_lines_ignore_order(
         read_resource(resource_group, 'expected_token_transfers.csv'), read_file(output_file)
     )
+
+
+def test_extract_token_transfers_job_hands_off_domain_objects():
+    log_dicts = list(csv.DictReader(io.StringIO(read_resource('logs', 'logs.csv'))))
+    receipt_log_mapper = EthReceiptLogMapper()
+    logs = [receipt_log_mapper.dict_to_receipt_log(log_dict) for log_dict in log_dicts]
+
+    dict_exporter = InMemoryItemExporter(item_types=['token_transfer'])
+    ExtractTokenTransfersJob(
+        logs_iterable=log_dicts, batch_size=100, item_exporter=dict_exporter, max_workers=1).run()
+    object_exporter = InMemoryObjectExporter(object_types=[EthTokenTransfer])
+    ExtractTokenTransfersJob(
+        logs_iterable=logs, batch_size=100, item_exporter=object_exporter, max_workers=1,
+        export_domain_objects=True).run()
+
+    token_transfer_mapper = EthTokenTransferMapper()
+    token_transfers = object_exporter.get_items(EthTokenTransfer)
+    assert token_transfers
+    assert [token_transfer_mapper.token_transfer_to_dict(token_transfer) for token_transfer in token_transfers] == \
+        dict_exporter.get_items('token_transfer')
@@ -0,0 +1,73 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import json
+
+import aiohttp
+import pytest
+
+from ethereumetl.fake_node.chain import SyntheticChain
+from ethereumetl.fake_node.server import FakeNode, FakeNodeServer
+from ethereumetl.json_rpc_requests import generate_get_block_by_number_json_rpc
+from ethereumetl.misc.rate_limited_error import RateLimitedError
+from ethereumetl.providers.async_rpc import AsyncBatchHTTPProvider
+from ethereumetl.utils import hex_to_dec
+
+
+def make_batch_requests(node, texts):
+    async def run(provider):
+        try:
+            return await asyncio.gather(*[provider.make_batch_request(text) for text in texts])
+        finally:
+            await provider.close()
+
+    with FakeNodeServer(node) as server:
+        provider = AsyncBatchHTTPProvider(server.uri, max_connections=2)
+        return asyncio.run(run(provider))
+
+
+def test_concurrent_batch_requests_get_their_own_responses():
+    node = FakeNode(SyntheticChain(height=100))
+    block_ranges = [range(start, start + 5) for start in range(0, 100, 5)]
+    texts = [json.dumps(list(generate_get_block_by_number_json_rpc(block_range, False)))
+             for block_range in block_ranges]
+
+    responses = make_batch_requests(node, texts)
+
+    for block_range, response in zip(block_ranges, responses):
+        assert [hex_to_dec(item['result']['number']) for item in response] == list(block_range)
+        assert [item['result'] for item in response] == [node.chain.get_block(n, False) for n in block_range]
+
+
+def test_rate_limited_response_raises_rate_limited_error():
+    text = json.dumps(list(generate_get_block_by_number_json_rpc([1], False)))
+
+    with pytest.raises(RateLimitedError):
+        make_batch_requests(FakeNode(SyntheticChain(height=10), rate_limit_rate=1), [text])
+
+
+def test_server_error_raises_client_error():
+    text = json.dumps(list(generate_get_block_by_number_json_rpc([1], False)))
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        make_batch_requests(FakeNode(SyntheticChain(height=10), http_error_rate=1), [text])
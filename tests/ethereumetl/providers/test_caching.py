@@ -0,0 +1,92 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import json
+
+from ethereumetl.providers.caching import CachingBatchProvider
+from ethereumetl.providers.segment_file_cache import SegmentFileCache
+
+
+class CountingProvider:
+    def __init__(self, head_block):
+        self.head_block = head_block
+        self.requested_block_numbers = []
+
+    def make_batch_request(self, text):
+        requests = json.loads(text)
+        self.requested_block_numbers.extend(int(request['params'][0], 16) for request in requests)
+        return [{'jsonrpc': '2.0', 'id': request['id'], 'result': {'number': request['params'][0]}}
+                for request in reversed(requests)]
+
+    def make_request(self, method, params):
+        assert method == 'eth_blockNumber'
+        return {'jsonrpc': '2.0', 'id': 1, 'result': hex(self.head_block)}
+
+
+def get_blocks_request(block_numbers):
+    return json.dumps([{'jsonrpc': '2.0', 'method': 'eth_getBlockByNumber', 'params': [hex(block_number), False],
+                        'id': idx} for idx, block_number in enumerate(block_numbers)])
+
+
+def test_caching_provider_caches_final_blocks(tmpdir):
+    provider = CountingProvider(head_block=100)
+    caching_provider = CachingBatchProvider(provider, SegmentFileCache(str(tmpdir)), finality_depth=10)
+
+    first_response = caching_provider.make_batch_request(get_blocks_request([89, 90, 91]))
+    second_response = caching_provider.make_batch_request(get_blocks_request([89, 90, 91]))
+
+    assert first_response == second_response
+    assert [response['result']['number'] for response in second_response] == ['0x59', '0x5a', '0x5b']
+    assert provider.requested_block_numbers == [89, 90, 91, 91]
+
+
+def test_caching_provider_does_not_cache_unmatched_responses(tmpdir):
+    class WrongIdsProvider(CountingProvider):
+        def make_batch_request(self, text):
+            responses = super().make_batch_request(text)
+            for response in responses:
+                response['id'] = None
+            return responses
+
+    provider = WrongIdsProvider(head_block=100)
+    caching_provider = CachingBatchProvider(provider, SegmentFileCache(str(tmpdir)), finality_depth=10)
+
+    caching_provider.make_batch_request(get_blocks_request([80, 81]))
+    caching_provider.make_batch_request(get_blocks_request([80, 81]))
+    caching_provider.close()
+
+    assert provider.requested_block_numbers == [80, 81, 80, 81]
+
+
+def test_segment_file_cache_evicts_oldest_segments(tmpdir):
+    cache = SegmentFileCache(str(tmpdir), max_size_bytes=1000, segment_size_bytes=200)
+    for i in range(100):
+        cache.put(str(i).encode(), {'value': 'x' * i})
+
+    assert cache.size_bytes() <= 1000 + 200
+    assert cache.get(b'0') is None
+    assert cache.get(b'99') == {'value': 'x' * 99}
+    cache.close()
+
+    reopened_cache = SegmentFileCache(str(tmpdir), max_size_bytes=1000, segment_size_bytes=200)
+    assert reopened_cache.get(b'99') == {'value': 'x' * 99}
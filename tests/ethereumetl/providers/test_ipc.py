@@ -0,0 +1,237 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import queue
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ethereumetl.json_rpc_requests import encode_json_rpc_batch, generate_json_rpc, next_request_id
+from ethereumetl.providers.ipc import IPCConnectionPool, JsonRpcResponseReader
+
+
+# Returns the given chunks from recv_into one at a time, then an empty read like a closed socket
+class ScriptedSocket:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def setsockopt(self, *args):
+        pass
+
+    def recv_into(self, view):
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        assert len(chunk) <= len(view)
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def read_all(chunks, chunk_size=16):
+    reader = JsonRpcResponseReader(ScriptedSocket(chunks), chunk_size=chunk_size)
+    responses = []
+    with pytest.raises(ConnectionResetError):
+        while True:
+            responses.append(reader.read_response(timeout=1))
+    return responses
+
+
+def test_frame_split_across_receives():
+    frame = b'{"jsonrpc": "2.0", "id": 1, "result": "0x' + b'ab' * 40 + b'"}\n'
+    chunks = [frame[i:i + 7] for i in range(0, len(frame), 7)]
+
+    assert read_all(chunks) == [{'jsonrpc': '2.0', 'id': 1, 'result': '0x' + 'ab' * 40}]
+
+
+def test_several_frames_in_one_receive():
+    chunks = [b'{"id": 1}\n{"id": 2}\n[{"id": 3}]\n{"i', b'd": 4}\n']
+
+    assert read_all(chunks, chunk_size=64) == [{'id': 1}, {'id': 2}, [{'id': 3}], {'id': 4}]
+
+
+def test_blank_lines_between_frames_are_skipped():
+    chunks = [b'\n{"id": 1}\n\n', b'  \r\n{"id": 2}\n', b'\n']
+
+    assert read_all(chunks) == [{'id': 1}, {'id': 2}]
+
+
+def test_peer_close_raises_connection_reset_error():
+    reader = JsonRpcResponseReader(ScriptedSocket([b'{"id": 1}\n{"id": 2']))
+
+    assert reader.read_response(timeout=1) == {'id': 1}
+    # The incomplete frame is never returned
+    with pytest.raises(ConnectionResetError):
+        reader.read_response(timeout=1)
+
+
+# Unix socket server that queues every received request, the test decides when and what to answer
+class ScriptedIPCServer:
+    def __init__(self, ipc_path):
+        self.requests = queue.Queue()
+        self.connections = []
+        self._server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server_sock.bind(ipc_path)
+        self._server_sock.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def next_request(self):
+        return self.requests.get(timeout=5)
+
+    def respond(self, connection, response):
+        connection.sendall(json.dumps(response).encode('utf-8') + b'\n')
+
+    def close(self):
+        self._server_sock.close()
+        for connection in self.connections:
+            connection.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._server_sock.accept()
+            except OSError:
+                return
+            self.connections.append(connection)
+            threading.Thread(target=self._read, args=(connection,), daemon=True).start()
+
+    def _read(self, connection):
+        decoder = json.JSONDecoder()
+        buffer = ''
+        while True:
+            try:
+                data = connection.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data.decode('utf-8')
+            while buffer:
+                request, end = decoder.raw_decode(buffer)
+                buffer = buffer[end:]
+                self.requests.put((connection, request))
+
+
+@pytest.fixture
+def ipc_server(tmpdir):
+    server = ScriptedIPCServer(str(tmpdir.join('node.ipc')))
+    pool = IPCConnectionPool(str(tmpdir.join('node.ipc')), pool_size=1)
+    yield server, pool
+    pool.close()
+    server.close()
+
+
+def batch_request(param, request_id=1):
+    return json.dumps([{'jsonrpc': '2.0', 'id': request_id, 'method': 'eth_test', 'params': [param]}])
+
+
+def result_for(request):
+    return [{'jsonrpc': '2.0', 'id': item['id'], 'result': item['params'][0]} for item in request]
+
+
+def test_request_ids_are_rewritten_and_restored(ipc_server):
+    server, pool = ipc_server
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_a = executor.submit(pool.make_batch_request, batch_request('a'), 5)
+        future_b = executor.submit(pool.make_batch_request, batch_request('b'), 5)
+        received = [server.next_request(), server.next_request()]
+        # Both requests had id 1, on the connection they get different ids
+        assert received[0][1][0]['id'] != received[1][1][0]['id']
+        for connection, request in reversed(received):
+            server.respond(connection, result_for(request))
+
+        assert future_a.result() == [{'jsonrpc': '2.0', 'id': 1, 'result': 'a'}]
+        assert future_b.result() == [{'jsonrpc': '2.0', 'id': 1, 'result': 'b'}]
+
+
+def test_batches_with_unique_ids_are_sent_as_they_are(ipc_server):
+    server, pool = ipc_server
+    text = encode_json_rpc_batch([generate_json_rpc('eth_test', ['a'], request_id=next_request_id())])
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(pool.make_batch_request, text, 5)
+        connection, request = server.next_request()
+        assert request == json.loads(text)
+        server.respond(connection, result_for(request))
+
+        assert future.result() == result_for(request)
+
+
+def test_unknown_id_is_dropped_and_null_id_fails_all_requests(ipc_server):
+    server, pool = ipc_server
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future_a = executor.submit(pool.make_batch_request, batch_request('a'), 5)
+        connection, request_a = server.next_request()
+        future_b = executor.submit(pool.make_batch_request, batch_request('b'), 5)
+        _, request_b = server.next_request()
+
+        server.respond(connection, {'jsonrpc': '2.0', 'id': 12345, 'result': 'late'})
+        server.respond(connection, {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32700, 'message': 'Parse error'}})
+
+        # The node handles pipelined requests concurrently, the error can't be matched to either request
+        for future in [future_a, future_b]:
+            with pytest.raises(ConnectionResetError):
+                future.result()
+
+        future = executor.submit(pool.make_batch_request, batch_request('c'), 5)
+        new_connection, request = server.next_request()
+        assert new_connection is not connection
+        server.respond(new_connection, result_for(request))
+        assert future.result() == [{'jsonrpc': '2.0', 'id': 1, 'result': 'c'}]
+
+
+def test_timed_out_request_closes_connection(ipc_server):
+    server, pool = ipc_server
+
+    with pytest.raises(socket.timeout):
+        pool.make_batch_request(batch_request('a'), 0.1)
+    old_connection, old_request = server.next_request()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(pool.make_batch_request, batch_request('b', request_id=2), 5)
+        connection, request = server.next_request()
+        assert connection is not old_connection
+        # The late reply on the old connection doesn't reach anyone
+        server.respond(old_connection, result_for(old_request))
+        server.respond(connection, result_for(request))
+
+        assert future.result() == [{'jsonrpc': '2.0', 'id': 2, 'result': 'b'}]
+
+
+def test_broken_connection_fails_in_flight_requests(ipc_server):
+    server, pool = ipc_server
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(pool.make_batch_request, batch_request('a'), 5)
+        connection, _ = server.next_request()
+        connection.shutdown(socket.SHUT_RDWR)
+        with pytest.raises(ConnectionResetError):
+            future.result()
+
+        future = executor.submit(pool.make_batch_request, batch_request('b'), 5)
+        connection, request = server.next_request()
+        server.respond(connection, result_for(request))
+        assert future.result() == [{'jsonrpc': '2.0', 'id': 1, 'result': 'b'}]
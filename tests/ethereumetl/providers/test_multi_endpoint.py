@@ -0,0 +1,147 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import threading
+import time
+
+import pytest
+
+from ethereumetl.providers.multi_endpoint import MultiEndpointBatchProvider
+
+
+class FakeProvider:
+    def __init__(self, head_block=100, fail=False):
+        self.head_block = head_block
+        self.fail = fail
+        self.calls = 0
+
+    def make_batch_request(self, text):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError('Connection refused')
+        return [{'jsonrpc': '2.0', 'id': 0, 'result': text}]
+
+    def make_request(self, method, params):
+        if self.fail:
+            raise ConnectionError('Connection refused')
+        return {'jsonrpc': '2.0', 'id': 0, 'result': hex(self.head_block)}
+
+
+class SlowOnceProvider(FakeProvider):
+    def __init__(self, slow_call, delay):
+        super().__init__()
+        self.slow_call = slow_call
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def make_batch_request(self, text):
+        with self._lock:
+            self.calls += 1
+            is_slow = self.calls == self.slow_call
+        if is_slow:
+            time.sleep(self.delay)
+        return [{'jsonrpc': '2.0', 'id': 0, 'result': text}]
+
+
+def build_provider(providers, **kwargs):
+    return MultiEndpointBatchProvider(
+        list(providers.keys()), lambda uri: providers[uri], health_check_interval_seconds=None, **kwargs)
+
+
+def test_multi_endpoint_provider_fails_over():
+    providers = {'a': FakeProvider(fail=True), 'b': FakeProvider()}
+    provider = build_provider(providers)
+
+    for _ in range(10):
+        assert provider.make_batch_request('test') == [{'jsonrpc': '2.0', 'id': 0, 'result': 'test'}]
+
+    # The failed endpoint is on cooldown after the first failure
+    assert providers['a'].calls == 1
+    assert providers['b'].calls == 10
+
+
+def test_multi_endpoint_provider_raises_when_all_endpoints_fail():
+    provider = build_provider({'a': FakeProvider(fail=True), 'b': FakeProvider(fail=True)})
+
+    with pytest.raises(ConnectionError):
+        provider.make_batch_request('test')
+
+
+def test_multi_endpoint_provider_skips_lagging_endpoints():
+    providers = {'a': FakeProvider(head_block=50), 'b': FakeProvider(head_block=100)}
+    provider = build_provider(providers)
+    for endpoint in provider.endpoints:
+        provider.check_health(endpoint)
+
+    for _ in range(10):
+        provider.make_batch_request('test')
+
+    assert providers['a'].calls == 0
+    assert providers['b'].calls == 10
+
+
+def test_multi_endpoint_provider_hedges_slow_requests():
+    slow_once_provider = SlowOnceProvider(slow_call=31, delay=2)
+    provider = build_provider({'a': slow_once_provider}, hedge_percentile=95)
+
+    for _ in range(30):
+        provider.make_batch_request('test')
+    start_time = time.time()
+    response = provider.make_batch_request('test')
+
+    assert response == [{'jsonrpc': '2.0', 'id': 0, 'result': 'test'}]
+    assert time.time() - start_time < 1
+    assert slow_once_provider.calls == 32
+    provider.close()
+
+
+def test_multi_endpoint_provider_counts_only_json_rpc_errors():
+    class ResponseProvider(FakeProvider):
+        def __init__(self, response):
+            super().__init__()
+            self.response = response
+
+        def make_batch_request(self, text):
+            return self.response
+
+    null_result_provider = build_provider(
+        {'a': ResponseProvider([{'jsonrpc': '2.0', 'id': 0, 'result': None}])})
+    error_provider = build_provider(
+        {'a': ResponseProvider([{'jsonrpc': '2.0', 'id': 0, 'error': {'code': -32000, 'message': 'error'}}])})
+
+    null_result_provider.make_batch_request('test')
+    error_provider.make_batch_request('test')
+
+    assert null_result_provider.endpoints[0].error_rate == 0
+    assert error_provider.endpoints[0].error_rate > 0
+
+
+def test_multi_endpoint_provider_close_stops_health_checks():
+    provider = MultiEndpointBatchProvider(['a'], lambda uri: FakeProvider(), health_check_interval_seconds=60)
+    provider.make_batch_request('test')
+    assert provider._health_check_thread.is_alive()
+
+    provider.close()
+
+    provider._health_check_thread.join(timeout=5)
+    assert not provider._health_check_thread.is_alive()
@@ -0,0 +1,83 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import time
+
+import pytest
+
+from ethereumetl.executors.batch_work_executor import MAX_RATE_LIMITED_BACKOFF_SECONDS, \
+    get_rate_limited_backoff_seconds
+from ethereumetl.misc.rate_limited_error import RateLimitedError
+from ethereumetl.misc.retriable_value_error import RetriableValueError
+from ethereumetl.providers.rate_limiter import EndpointRateLimiter, RateLimitedBatchProvider, TokenBucket
+from ethereumetl.utils import rpc_response_to_result
+
+
+def test_token_bucket_waits_for_deficit():
+    bucket = TokenBucket(rate=10)
+    now = time.monotonic()
+
+    assert bucket.reserve(10, now) == 0
+    assert bucket.reserve(5, now) == pytest.approx(0.5)
+    assert bucket.reserve(5, now + 1.5) == 0
+
+
+class ThrottledProvider:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def make_batch_request(self, text):
+        self.calls += 1
+        return [{'jsonrpc': '2.0', 'id': 0, 'error': self.error}]
+
+
+def test_rate_limited_provider_raises_and_pauses_on_rate_limit_errors():
+    rate_limiter = EndpointRateLimiter(requests_per_second=100)
+    provider = RateLimitedBatchProvider(
+        ThrottledProvider({'code': -32005, 'message': 'project ID request rate exceeded'}), rate_limiter)
+
+    with pytest.raises(RateLimitedError):
+        provider.make_batch_request('[{"jsonrpc": "2.0", "method": "eth_blockNumber", "params": [], "id": 0}]')
+
+    assert rate_limiter.reserve([{'method': 'eth_blockNumber'}]) > 0.5
+    assert rate_limiter._request_bucket.rate == pytest.approx(50, rel=0.01)
+
+
+def test_limit_exceeded_error_for_large_query_is_not_rate_limiting():
+    rate_limiter = EndpointRateLimiter(requests_per_second=100)
+    error = {'code': -32005, 'message': 'query returned more than 10000 results'}
+    provider = RateLimitedBatchProvider(ThrottledProvider(error), rate_limiter)
+
+    response = provider.make_batch_request('[{"jsonrpc": "2.0", "method": "eth_getLogs", "params": [], "id": 0}]')
+
+    # Fails after the executor's bounded retries instead of backing off as rate limited
+    with pytest.raises(RetriableValueError):
+        rpc_response_to_result(response[0])
+    assert rate_limiter._request_bucket.rate == pytest.approx(100)
+
+
+def test_retry_after_is_clamped():
+    assert get_rate_limited_backoff_seconds(RateLimitedError('Rate limited', retry_after=3), 0) == 3
+    assert get_rate_limited_backoff_seconds(RateLimitedError('Rate limited', retry_after=86400), 0) == \
+        MAX_RATE_LIMITED_BACKOFF_SECONDS
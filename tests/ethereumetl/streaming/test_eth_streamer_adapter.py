@@ -0,0 +1,61 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import threading
+
+from ethereumetl.enumeration.entity_type import EntityType
+from ethereumetl.fake_node.chain import SyntheticChain
+from ethereumetl.fake_node.server import FakeNode, FakeNodeServer
+from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.streaming.eth_streamer_adapter import EthStreamerAdapter
+from ethereumetl.thread_local_proxy import ThreadLocalProxy
+
+
+def test_traces_are_extracted_alongside_receipts():
+    with FakeNodeServer(FakeNode(SyntheticChain(height=20, transactions_per_block=2, contract_creation_rate=0.5))) as server:
+        streamer_adapter = EthStreamerAdapter(
+            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(server.uri, batch=True)),
+            batch_size=5,
+            entity_types=EntityType.ALL_FOR_STREAMING,
+        )
+        # Both stages wait at the barrier, which only passes when they run at the same time
+        barrier = threading.Barrier(2, timeout=10)
+        export_receipts_and_logs = streamer_adapter._export_receipts_and_logs
+        export_traces = streamer_adapter._export_traces
+
+        def export_receipts_and_logs_at_barrier(transactions):
+            barrier.wait()
+            return export_receipts_and_logs(transactions)
+
+        def export_traces_at_barrier(start_block, end_block):
+            barrier.wait()
+            return export_traces(start_block, end_block)
+
+        streamer_adapter._export_receipts_and_logs = export_receipts_and_logs_at_barrier
+        streamer_adapter._export_traces = export_traces_at_barrier
+        items = streamer_adapter.extract_all(1, 20)
+
+    item_types = {item['type'] for item in items}
+    assert item_types == set(EntityType.ALL_FOR_STREAMING)
+    token_transfers = [item for item in items if item['type'] == 'token_transfer']
+    assert all(token_transfer['block_timestamp'] is not None for token_transfer in token_transfers)
@@ -0,0 +1,152 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import json
+import threading
+
+from aiohttp import web
+
+from blockchainetl.streaming.streamer import Streamer
+from blockchainetl.streaming.streamer_adapter_stub import StreamerAdapterStub
+from ethereumetl.streaming.new_heads_subscription import NewHeadsSubscription
+
+
+# Stand-in for the websocket endpoint of a node, pushing a newHeads notification for every block number put in heads.
+# Each connection first takes the next of faults: 'close' closes it before answering eth_subscribe, 'malformed' sends
+# a notification without a block number.
+class NewHeadsServer:
+    def __init__(self, faults=()):
+        self.heads = None
+        self.port = None
+        self.faults = list(faults)
+        self.connection_count = 0
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def push_head(self, block_number):
+        self._loop.call_soon_threadsafe(self.heads.put_nowait, block_number)
+
+    def stop(self):
+        self.push_head(None)
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _start(self):
+        self.heads = asyncio.Queue()
+        app = web.Application()
+        app.router.add_get('/', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def _handle(self, request):
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self.connection_count += 1
+        fault = self.faults.pop(0) if self.faults else None
+        subscribe_request = json.loads(await websocket.receive_str())
+        assert subscribe_request['method'] == 'eth_subscribe' and subscribe_request['params'] == ['newHeads']
+        if fault == 'close':
+            await websocket.close()
+            return websocket
+        await websocket.send_str(json.dumps({'jsonrpc': '2.0', 'id': subscribe_request['id'], 'result': '0xab'}))
+        if fault == 'malformed':
+            await websocket.send_str(json.dumps({
+                'jsonrpc': '2.0', 'method': 'eth_subscription', 'params': {'subscription': '0xab', 'result': {}}
+            }))
+            # Waits for the client to disconnect
+            await websocket.receive()
+            return websocket
+        while True:
+            block_number = await self.heads.get()
+            if block_number is None:
+                return websocket
+            await websocket.send_str(json.dumps({
+                'jsonrpc': '2.0', 'method': 'eth_subscription',
+                'params': {'subscription': '0xab', 'result': {'number': hex(block_number)}}
+            }))
+
+
+class GrowingStreamerAdapter(StreamerAdapterStub):
+    def __init__(self):
+        self.current_block = 1
+        self.exported_ranges = []
+
+    def get_current_block_number(self):
+        return self.current_block
+
+    def export_all(self, start_block, end_block):
+        self.exported_ranges.append((start_block, end_block))
+
+
+def test_streamer_wakes_up_on_new_head(tmpdir):
+    server = NewHeadsServer().start()
+    try:
+        subscription = NewHeadsSubscription('ws://127.0.0.1:{}/'.format(server.port))
+        adapter = GrowingStreamerAdapter()
+        streamer = Streamer(
+            blockchain_streamer_adapter=adapter,
+            last_synced_block_file=str(tmpdir.join('last_synced_block.txt')),
+            start_block=1,
+            end_block=2,
+            period_seconds=60,
+            head_source=subscription)
+        streamer_thread = threading.Thread(target=streamer.stream)
+        streamer_thread.start()
+
+        assert subscription.wait_for_subscription(10)
+        adapter.current_block = 2
+        server.push_head(2)
+        streamer_thread.join(10)
+
+        assert not streamer_thread.is_alive()
+        assert adapter.exported_ranges == [(1, 1), (2, 2)]
+        assert subscription.latest_block_number == 2
+    finally:
+        server.stop()
+
+
+def test_subscription_reconnects_after_close_frame_and_malformed_notification():
+    server = NewHeadsServer(faults=['close', 'malformed']).start()
+    subscription = NewHeadsSubscription('ws://127.0.0.1:{}/'.format(server.port), reconnect_seconds=0.01)
+    try:
+        subscription.start()
+        # Only the third connection reads the heads
+        server.push_head(5)
+
+        assert subscription.wait_for_new_head(10)
+        assert subscription.latest_block_number == 5
+        assert server.connection_count == 3
+    finally:
+        subscription.stop()
+        server.stop()
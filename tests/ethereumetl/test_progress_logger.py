@@ -21,7 +21,12 @@
 # SOFTWARE.
 
 
-from ethereumetl.progress_logger import ProgressLogger
+import json
+import time
+
+import pytest
+
+from ethereumetl.progress_logger import ProgressLogger, configure_progress_output
 
 
 def test_progress_logger():
@@ -53,6 +58,29 @@ def test_progress_logger_with_total_items():
     assert logger_mock.logs[101].startswith('Finished work. Total items processed: 9900. Took ')
 
 
+def test_progress_logger_reports_rate_and_eta(tmpdir):
+    progress_file = str(tmpdir.join('progress.jsonl'))
+    configure_progress_output(progress_file)
+    logger_mock = LoggerMock()
+    progress_logger = ProgressLogger(name='ExportBlocksJob', logger=logger_mock)
+
+    try:
+        progress_logger.start(total_items=1000, item_name='blocks')
+        progress_logger.track(100)
+        progress_logger.report(now=time.monotonic() + 10)
+        progress_logger.finish()
+    finally:
+        configure_progress_output(None)
+
+    assert logger_mock.logs[2].startswith('ExportBlocksJob: 100 blocks processed of 1000, 10.0 blocks/s, ')
+    assert ', ETA 0:01:' in logger_mock.logs[2]
+    with open(progress_file) as file:
+        records = [json.loads(line) for line in file]
+    assert [(record['items_processed'], record['finished']) for record in records] == [(100, False), (100, True)]
+    assert records[0]['items_per_second'] == pytest.approx(10, rel=0.01)
+    assert records[0]['eta_seconds'] == pytest.approx(90, rel=0.01)
+
+
 class LoggerMock:
     def __init__(self):
         self.logs = []